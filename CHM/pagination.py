@@ -0,0 +1,162 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import QueryDict
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset with next/prev links."""
+
+    def __init__(self, object_list, params, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self._params = params if params is not None else QueryDict()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def _url(self, key, cursor):
+        params = self._params.copy()
+        params.pop(KeysetPaginator.after_param, None)
+        params.pop(KeysetPaginator.before_param, None)
+        params[key] = cursor
+        return f"?{params.urlencode()}"
+
+    @property
+    def next_url(self):
+        return self._url(KeysetPaginator.after_param, self.next_cursor) if self.has_next() else None
+
+    @property
+    def prev_url(self):
+        return self._url(KeysetPaginator.before_param, self.prev_cursor) if self.has_previous() else None
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a fixed ordering such as ('name', 'id') or
+    ('-record_date', 'id'). Each page is a range scan starting from the last
+    row seen, so deep pages cost the same as the first one (no OFFSET).
+    The primary key is appended to the ordering when missing so that the
+    sort key is always unique.
+    """
+    after_param = 'after'
+    before_param = 'before'
+
+    def __init__(self, queryset, ordering, per_page=25):
+        ordering = list(ordering)
+        if not any(f.lstrip('-') in ('pk', 'id') for f in ordering):
+            ordering.append('pk')
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+
+    @staticmethod
+    def _reverse(ordering):
+        return [f[1:] if f.startswith('-') else f'-{f}' for f in ordering]
+
+    @staticmethod
+    def _seek(ordering, values):
+        """Build the row-value comparison "sort key comes after `values`"."""
+        if len(values) != len(ordering):
+            raise InvalidCursor(values)
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _key(self, obj):
+        values = []
+        for field in self.ordering:
+            value = obj
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return values
+
+    def paginate(self, after=None, before=None, params=None):
+        if before:
+            ordering = self._reverse(self.ordering)
+            values = decode_cursor(before)
+        else:
+            ordering = self.ordering
+            values = decode_cursor(after) if after else None
+
+        qs = self.queryset.order_by(*ordering)
+        if values is not None:
+            qs = qs.filter(self._seek(ordering, values))
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if before:
+            rows.reverse()
+
+        next_cursor = prev_cursor = None
+        if rows:
+            if has_more or before:
+                next_cursor = encode_cursor(self._key(rows[-1]))
+            if (has_more and before) or after:
+                prev_cursor = encode_cursor(self._key(rows[0]))
+        return KeysetPage(rows, params, next_cursor, prev_cursor)
+
+    def paginate_request(self, request):
+        """Paginate using the ?after= / ?before= cursors on the request, keeping other GET params."""
+        try:
+            return self.paginate(
+                after=request.GET.get(self.after_param),
+                before=request.GET.get(self.before_param),
+                params=request.GET,
+            )
+        except (InvalidCursor, ValidationError, ValueError, TypeError):
+            # Tampered or stale cursor: fall back to the first page
+            return self.paginate(params=request.GET)
+
+
+def paginate(request, queryset, ordering, per_page=25):
+    return KeysetPaginator(queryset, ordering, per_page).paginate_request(request)
@@ -0,0 +1,95 @@
+"""
+Session engine that serves reads from the cache and coalesces DB writes.
+
+Like django.contrib.sessions.backends.cached_db, sessions live in the
+database with a copy in the cache (settings.SESSION_CACHE_ALIAS), and a
+cache miss falls back to the database. Unlike cached_db, save() skips
+the database when the session data is unchanged since it was last
+loaded or written, unless less than `refresh_fraction` of the session
+lifetime is left on the stored row. So requests that touch but do not
+change the session (SESSION_SAVE_EVERY_REQUEST, re-setting the same
+cart) no longer write django_session on every hit, while sliding
+expiry still works.
+
+Select it with SESSION_ENGINE = 'CHM.sessions'.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.utils import timezone
+
+KEY_PREFIX = 'chm.sessions.'
+
+
+class SessionStore(DBStore):
+    cache_key_prefix = KEY_PREFIX
+    # Rewrite the row once less than this share of its lifetime remains
+    refresh_fraction = 0.5
+
+    def __init__(self, session_key=None):
+        self._cache = caches[settings.SESSION_CACHE_ALIAS]
+        # (serialized data, expiry timestamp) of what the database holds
+        self._stored = None
+        super().__init__(session_key)
+
+    @property
+    def cache_key(self):
+        return self.cache_key_prefix + self._get_or_create_session_key()
+
+    def _serialize(self, data):
+        return self.serializer().dumps(data)
+
+    def _remember(self, data, expires):
+        self._stored = (self._serialize(data), expires.timestamp())
+        timeout = (expires - timezone.now()).total_seconds()
+        if timeout > 0:
+            self._cache.set(self.cache_key, {'data': data, 'expires': expires}, timeout)
+
+    def load(self):
+        try:
+            entry = self._cache.get(self.cache_key)
+        except Exception:
+            # A cache outage degrades to plain DB sessions
+            entry = None
+        if entry is None:
+            s = self._get_session_from_db()
+            if s is None:
+                return {}
+            entry = {'data': self.decode(s.session_data), 'expires': s.expire_date}
+            self._remember(entry['data'], entry['expires'])
+        else:
+            self._stored = (self._serialize(entry['data']), entry['expires'].timestamp())
+        return entry['data']
+
+    def exists(self, session_key):
+        return self.cache_key_prefix + session_key in self._cache or super().exists(session_key)
+
+    def _is_unchanged(self, data):
+        if self._stored is None:
+            return False
+        serialized, expires = self._stored
+        remaining = expires - timezone.now().timestamp()
+        return serialized == self._serialize(data) and remaining > self.get_expiry_age() * self.refresh_fraction
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        if not must_create and self._is_unchanged(data):
+            return
+        super().save(must_create=must_create)
+        self._remember(data, self.get_expiry_date())
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self._cache.delete(self.cache_key_prefix + session_key)
+        self._stored = None
+
+    def flush(self):
+        self.clear()
+        self.delete(self.session_key)
+        self._session_key = None
@@ -29,6 +29,11 @@ ALLOWED_HOSTS = ['.herokuapp.com']
 
 
 import os
+import environ
+
+# Initialise environment; .env is loaded first so every setting below sees it
+env = environ.Env()
+environ.Env.read_env(os.path.join(BASE_DIR, '.env'))  # loads .env locally
 
 # Application definition
 
@@ -45,6 +50,7 @@ INSTALLED_APPS = [
     'inventory',
     'patients',
     'reports',
+    'uploads',
     'storages',
     'environ'
 ]
@@ -55,6 +61,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'hospitals.middleware.ActiveHospitalMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -113,6 +120,19 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The first hasher is used for new passwords; the rest can still verify old
+# hashes, which are upgraded to the first one on the next successful login.
+PASSWORD_HASHERS = [
+    'accounts.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# PBKDF2 work factor. Changing it takes effect per user on their next login
+# (see accounts/hashers.py); unset means Django's default.
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 0)) or None
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -140,6 +160,9 @@ MEDIA_URL = 'media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, "static cdn", "media root")
 
+# Where uploaded files live: 's3' or 'local' (see the end of this file)
+MEDIA_MODE = os.environ.get('MEDIA_MODE', 's3')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -147,6 +170,70 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
+# Caches. Set REDIS_URL to share the cache between workers; without it each
+# process gets its own in-memory cache.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # Room for a page, a dashboard card and a version per hospital
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Sessions. SESSION_MODE picks the engine:
+#   db     - django_session only (Django's default)
+#   cache  - CHM/sessions.py: reads from the cache, writes the DB only when the
+#            session changes or nears expiry. Needs REDIS_URL when running more
+#            than one worker, or workers will serve each other stale sessions.
+#   cookie - signed cookies; no server-side state at all, but the whole
+#            session (cart included) travels with every request and a logout
+#            cannot revoke a copied cookie before it expires.
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'CHM.sessions',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+}[os.environ.get('SESSION_MODE', 'db')]
+
+# Loads the session user with select_related('hospital'). ModelBackend stays
+# listed so sessions created before HospitalModelBackend (which store its
+# path) remain valid; drop it once those have expired (SESSION_COOKIE_AGE).
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.HospitalModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Seconds to cache the session user and their hospital (accounts/backends.py).
+# Off by default: only enable it with a cache shared by all workers, otherwise
+# invalidation only reaches the worker that made the change.
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 0))
+
+# Chunked uploads for record and report files (uploads/backends.py):
+#   s3    - parts go straight from the browser to the bucket via presigned URLs
+#   local - parts are streamed to CHUNKED_UPLOAD_TEMP_DIR, which every worker
+#           must share; for development and tests
+CHUNKED_UPLOAD_BACKEND = os.environ.get('CHUNKED_UPLOAD_BACKEND', 'local' if MEDIA_MODE == 'local' else 's3')
+CHUNKED_UPLOAD_CHUNK_SIZE = int(os.environ.get('CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 5 * 1024 ** 3))
+CHUNKED_UPLOAD_TEMP_DIR = os.environ.get('CHUNKED_UPLOAD_TEMP_DIR', os.path.join(BASE_DIR, 'static cdn', 'upload parts'))
+
+# Seconds to cache storage URLs of record and report files (uploads/media.py).
+# Defaults to half the signature lifetime, and is capped there.
+MEDIA_URL_CACHE_TIMEOUT = int(os.environ.get('MEDIA_URL_CACHE_TIMEOUT', 0)) or None
+
+# Hash plain form uploads while they stream in, for deduplication (uploads/blobs.py)
+FILE_UPLOAD_HANDLERS = [
+    'uploads.handlers.HashingMemoryFileUploadHandler',
+    'uploads.handlers.HashingTemporaryFileUploadHandler',
+]
+
 CORS_REPLACE_HTTPS_REFERER      = True
 HOST_SCHEME                     = "https://"
 SECURE_PROXY_SSL_HEADER         = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -157,28 +244,51 @@ SECURE_HSTS_INCLUDE_SUBDOMAINS  = True
 SECURE_HSTS_SECONDS             = 1000000
 SECURE_FRAME_DENY               = True
 
-import environ
-import os
+# Media storage, by MEDIA_MODE:
+#   s3    - the bucket named by the AWS_* variables, which are then required
+#   local - MEDIA_ROOT on local disk, for on-prem sites without S3. Files are
+#           downloaded through uploads.views.serve_media, which only checks
+#           access; the front web server sends the bytes (see below).
+if MEDIA_MODE == 'local':
+    MEDIA_ROOT = env('MEDIA_ROOT', default=MEDIA_ROOT)
+    MEDIA_URL = '/media/'
+    STATIC_URL = '/static/'
+
+    STORAGES = {
+        "default": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+        },
 
-# Initialise environment
-env = environ.Env()
-environ.Env.read_env(os.path.join(BASE_DIR, '.env'))  # loads .env locally
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+        },
+    }
+else:
+    AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID")
+    AWS_SECRET_ACCESS_KEY = env("AWS_SECRET_ACCESS_KEY")
+    AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
 
-AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = env("AWS_SECRET_ACCESS_KEY")
-AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
+    AWS_S3_CUSTOM_DOMAIN = f"{AWS_STORAGE_BUCKET_NAME}.s3.ap-southeast-2.amazonaws.com"
 
-AWS_S3_CUSTOM_DOMAIN = f"{AWS_STORAGE_BUCKET_NAME}.s3.ap-southeast-2.amazonaws.com"
+    STATIC_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/static/"
+    MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/media/"
 
-STATIC_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/static/"
-MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/media/"
+    STORAGES = {
+        "default": {
+            "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+        },
 
-STORAGES = {
-    "default": {
-        "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
-    },
+        "staticfiles": {
+            "BACKEND": "storages.backends.s3boto3.S3StaticStorage",
+        },
+    }
 
-    "staticfiles": {
-        "BACKEND": "storages.backends.s3boto3.S3StaticStorage",
-    },
-}
\ No newline at end of file
+# How serve_media hands an authorized file to the front web server (local mode):
+#   X-Accel-Redirect - nginx; MEDIA_ACCEL_PREFIX must be an `internal` location
+#                      aliased to MEDIA_ROOT
+#   X-Sendfile       - Apache mod_xsendfile or lighttpd; the header carries the
+#                      file's path, which must be under an allowed directory
+#   (empty)          - Django streams the file itself; for development only
+# The web server answers Range requests in both header modes.
+MEDIA_SENDFILE_HEADER = env('MEDIA_SENDFILE_HEADER', default='X-Accel-Redirect')
+MEDIA_ACCEL_PREFIX = env('MEDIA_ACCEL_PREFIX', default='/protected-media/')
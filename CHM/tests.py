@@ -0,0 +1,98 @@
+import datetime
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from .exports import date_range
+from .sessions import KEY_PREFIX, SessionStore
+
+
+class DateRangeTests(TestCase):
+    """date_range: inclusive day bounds, ValueError for anything it cannot filter on."""
+
+    def midnight(self, *args):
+        return timezone.make_aware(datetime.datetime(*args))
+
+    def test_bounds(self):
+        self.assertEqual(date_range({}, 'created_at'), {})
+        self.assertEqual(date_range({'start': '2024-03-01', 'end': '2024-03-01'}, 'created_at'), {
+            'created_at__gte': self.midnight(2024, 3, 1),
+            'created_at__lt': self.midnight(2024, 3, 2),
+        })
+        self.assertEqual(date_range({'end': '9999-12-31'}, 'created_at'), {})
+
+    def test_invalid_dates(self):
+        for params in [
+            {'start': 'yesterday'}, {'end': '2024-02-30'}, {'start': '2024-13-01'},
+            {'start': '2024-03-02', 'end': '2024-03-01'},
+        ]:
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                date_range(params, 'created_at')
+
+
+class CachedSessionTests(TestCase):
+    """CHM.sessions: cached reads, DB writes only on change or near expiry."""
+
+    def setUp(self):
+        cache.clear()
+
+    def create(self, **data):
+        session = SessionStore()
+        session.update(data)
+        session.save()
+        return session.session_key
+
+    def test_create_writes_the_database_and_the_cache(self):
+        key = self.create(cart={'1': 2})
+        self.assertEqual(SessionStore().decode(Session.objects.get(pk=key).session_data), {'cart': {'1': 2}})
+        self.assertEqual(cache.get(KEY_PREFIX + key)['data'], {'cart': {'1': 2}})
+        self.assertTrue(SessionStore().exists(key))
+
+    def test_load_from_cache_then_database(self):
+        key = self.create(cart={'1': 2})
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(key).load(), {'cart': {'1': 2}})
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(SessionStore(key).load(), {'cart': {'1': 2}})
+        # The miss refilled the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(key)['cart'], {'1': 2})
+
+    def test_unchanged_session_is_not_written(self):
+        key = self.create(cart={'1': 2})
+        session = SessionStore(key)
+        session['cart'] = {'1': 2}
+        with self.assertNumQueries(0):
+            session.save()
+        session['cart'] = {'1': 3}
+        session.save()
+        self.assertEqual(SessionStore().decode(Session.objects.get(pk=key).session_data), {'cart': {'1': 3}})
+
+    def test_row_near_expiry_is_refreshed(self):
+        key = self.create(cart={})
+        soon = timezone.now() + datetime.timedelta(seconds=60)
+        Session.objects.filter(pk=key).update(expire_date=soon)
+        cache.clear()
+        session = SessionStore(key)
+        session.load()
+        session.save()
+        self.assertGreater(Session.objects.get(pk=key).expire_date, soon + datetime.timedelta(hours=1))
+
+    def test_expired_session_loads_empty(self):
+        key = self.create(cart={'1': 2})
+        Session.objects.filter(pk=key).update(expire_date=timezone.now() - datetime.timedelta(seconds=1))
+        cache.clear()
+        self.assertEqual(SessionStore(key).load(), {})
+
+    def test_flush_removes_database_row_and_cache_entry(self):
+        key = self.create(cart={'1': 2})
+        session = SessionStore(key)
+        session.load()
+        session.flush()
+        self.assertIsNone(session.session_key)
+        self.assertFalse(Session.objects.filter(pk=key).exists())
+        self.assertIsNone(cache.get(KEY_PREFIX + key))
+        self.assertEqual(SessionStore(key).load(), {})
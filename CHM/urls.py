@@ -3,6 +3,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import redirect
+from uploads.views import serve_media
 
 urlpatterns = [
     path('', lambda request: redirect('accounts:login')),  # 👈 Root goes to login
@@ -13,8 +14,16 @@ urlpatterns = [
     path('inventory/', include('inventory.urls', namespace='inventory')),
     path('patients/', include('patients.urls', namespace='patients')),
     path('reports/', include('reports.urls', namespace='reports')),
+    path('uploads/', include('uploads.urls', namespace='uploads')),
 ]
 
+if settings.MEDIA_MODE == 'local':
+    # Access-checked downloads; the web server sends the file (uploads/serving.py)
+    urlpatterns += [
+        path(f"{settings.MEDIA_URL.strip('/')}/<path:name>", serve_media, name='media'),
+    ]
+
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    if settings.MEDIA_MODE != 'local':
+        urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
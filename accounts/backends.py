@@ -0,0 +1,46 @@
+# accounts/backends.py
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+from .models import CustomUser
+
+
+def user_cache_key(user_id):
+    return f'accounts:user:{user_id}'
+
+
+def invalidate_users(user_ids):
+    cache.delete_many([user_cache_key(pk) for pk in user_ids])
+
+
+class HospitalModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the session user together with their hospital,
+    so request.user.hospital costs no extra query.
+
+    When settings.AUTH_USER_CACHE_TIMEOUT is set, the loaded user (hospital
+    included) is also kept in the cache for that many seconds, which takes
+    the user query off every authenticated request. accounts/signals.py
+    drops the entry whenever the user or their hospital changes.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and password is not None:
+            # The password has been checked; stop authenticate() from hashing
+            # it again in ModelBackend, which is only listed for old sessions
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', None)
+        user = cache.get(user_cache_key(user_id)) if timeout else None
+        if user is None:
+            user = CustomUser._default_manager.select_related('hospital').filter(pk=user_id).first()
+            if user is None:
+                return None
+            if timeout:
+                cache.set(user_cache_key(user_id), user, timeout)
+        return user if self.user_can_authenticate(user) else None
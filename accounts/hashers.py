@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the work factor taken from
+    settings.PASSWORD_PBKDF2_ITERATIONS (Django's default when unset).
+
+    The algorithm name is unchanged, so existing hashes keep verifying.
+    When the stored iteration count differs from the setting, Django
+    re-hashes the password on the user's next successful login, so the
+    cost can be raised or lowered without resetting passwords.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
@@ -0,0 +1,62 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, login
+from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure successful logins per second on a single core, next to the raw "
+        "password hasher rate. Uses a throwaway user that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50,
+                            help="Number of logins to time (default 50).")
+        parser.add_argument('--iterations', type=int,
+                            help="PBKDF2 iterations to benchmark instead of the configured value.")
+
+    def handle(self, *args, logins=50, iterations=None, **options):
+        overrides = {'PASSWORD_PBKDF2_ITERATIONS': iterations} if iterations else {}
+        with override_settings(**overrides), transaction.atomic():
+            self._run(logins)
+            transaction.set_rollback(True)
+
+    def _run(self, logins):
+        password = 'benchmark-password-1'
+        hasher = get_hasher()
+        user = get_user_model().objects.create_user(
+            'login-benchmark@example.invalid', password, role='Patient',
+        )
+        encoded = user.password
+
+        started = time.perf_counter()
+        for _ in range(logins):
+            hasher.verify(password, encoded)
+        hash_rate = logins / (time.perf_counter() - started)
+
+        factory = RequestFactory()
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        data = {'username': user.email, 'password': password}
+        started = time.perf_counter()
+        for _ in range(logins):
+            request = factory.post('/accounts/login/', data)
+            request.session = session_store()
+            form = AuthenticationForm(request, data=data)
+            if not form.is_valid():
+                raise RuntimeError(form.errors.as_text())
+            login(request, form.get_user())
+        login_rate = logins / (time.perf_counter() - started)
+
+        self.stdout.write(f"Hasher:       {hasher.algorithm}, {getattr(hasher, 'iterations', '-')} iterations")
+        self.stdout.write(f"Hash verify:  {hash_rate:,.1f}/s")
+        self.stdout.write(f"Full login:   {login_rate:,.1f}/s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Login costs {hash_rate / login_rate:.2f} hash verifications' worth of CPU."
+        ))
@@ -0,0 +1,64 @@
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'CHM.sessions',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the session engines selectable with SESSION_MODE: requests per "
+        "second and database queries per request for reads, unchanged saves and "
+        "real writes. Sessions created here are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000,
+                            help="Simulated requests per scenario (default 2000).")
+
+    def handle(self, *args, requests=2000, **options):
+        self.stdout.write(f"{'engine':<8}{'scenario':<12}{'req/s':>12}{'queries/req':>14}")
+        with transaction.atomic():
+            for mode, engine in ENGINES.items():
+                store_class = import_module(engine).SessionStore
+                for scenario in ('read', 'unchanged', 'write'):
+                    rate, queries = self._run(store_class, scenario, requests)
+                    self.stdout.write(f"{mode:<8}{scenario:<12}{rate:>12,.0f}{queries:>14.2f}")
+            transaction.set_rollback(True)
+
+    def _run(self, store_class, scenario, requests):
+        session = store_class()
+        session['_auth_user_id'] = '1'
+        session['pharmacy_cart'] = {'1': 2, '7': 1}
+        session.save()
+        key = session.session_key
+
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            for i in range(requests):
+                # One request: SessionMiddleware builds a store from the cookie,
+                # the view reads it, and the response phase saves if needed.
+                session = store_class(key)
+                session.get('_auth_user_id')
+                if scenario == 'unchanged':
+                    session['pharmacy_cart'] = {'1': 2, '7': 1}
+                elif scenario == 'write':
+                    session['pharmacy_cart'] = {'1': 2, '7': i}
+                if session.modified:
+                    session.save()
+                    key = session.session_key
+            elapsed = time.perf_counter() - started
+        return requests / elapsed, queries / requests
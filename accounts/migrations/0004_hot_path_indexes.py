@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_customuser_hospital'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('hospitals', '0002_hospitalstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['hospital', 'role', 'date_joined'], name='user_hosp_role_joined_idx'),
+        ),
+    ]
@@ -54,6 +54,12 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     objects = CustomUserManager()
 
+    class Meta:
+        indexes = [
+            # dashboards / hospital_overview: users per hospital and role, newest first
+            models.Index(fields=['hospital', 'role', 'date_joined'], name='user_hosp_role_joined_idx'),
+        ]
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name']
 
@@ -0,0 +1,44 @@
+# accounts/signals.py
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+
+from hospitals.cache import bump_hospital_version
+from hospitals.models import Hospital
+from .backends import invalidate_users
+from .models import CustomUser
+
+# Saves that touch only these fields do not show up on any cached page
+LOGIN_FIELDS = {'last_login', 'password'}
+
+
+def invalidate_user(sender, instance, **kwargs):
+    invalidate_users([instance.pk])
+
+
+def invalidate_hospital_users(sender, instance, **kwargs):
+    # pre_delete as well as post_save: deleting a hospital nulls user.hospital
+    # with a bulk UPDATE, after which its users can no longer be found.
+    invalidate_users(CustomUser.objects.filter(hospital=instance).values_list('pk', flat=True))
+
+
+def remember_hospital(sender, instance, **kwargs):
+    # __dict__ so that a deferred hospital_id is not loaded here
+    instance._loaded_hospital_id = instance.__dict__.get('hospital_id')
+
+
+def invalidate_hospital_pages(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Dashboard cards list each hospital's staff/patient counts and newest
+    # users; a user moving hospitals changes both the old and the new one.
+    if raw or (update_fields and set(update_fields) <= LOGIN_FIELDS):
+        return
+    bump_hospital_version(instance.hospital_id, getattr(instance, '_loaded_hospital_id', None))
+    instance._loaded_hospital_id = instance.hospital_id
+
+
+def connect():
+    post_save.connect(invalidate_user, sender=CustomUser, dispatch_uid='user_cache_save')
+    post_delete.connect(invalidate_user, sender=CustomUser, dispatch_uid='user_cache_delete')
+    post_save.connect(invalidate_hospital_users, sender=Hospital, dispatch_uid='user_cache_hospital_save')
+    pre_delete.connect(invalidate_hospital_users, sender=Hospital, dispatch_uid='user_cache_hospital_delete')
+    post_init.connect(remember_hospital, sender=CustomUser, dispatch_uid='page_cache_user_init')
+    post_save.connect(invalidate_hospital_pages, sender=CustomUser, dispatch_uid='page_cache_user_save')
+    post_delete.connect(invalidate_hospital_pages, sender=CustomUser, dispatch_uid='page_cache_user_delete')
@@ -1,3 +1,84 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY, authenticate, base_user
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from hospitals.models import Hospital
+from .models import CustomUser
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AdminDashboardQueryTests(TestCase):
+    """The admin dashboard's query count does not grow with the number of hospitals."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user('admin@example.com', 'pw', role='Admin')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def seed(self, hospitals, users=7):
+        for i in range(hospitals):
+            hospital = Hospital.objects.create(name=f'Hospital {Hospital.objects.count()}')
+            CustomUser.objects.bulk_create(
+                CustomUser(email=f'user-{hospital.pk}-{j}@example.com', role='Staff', hospital=hospital, password='!')
+                for j in range(users)
+            )
+
+    def count_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('accounts:admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_queries_do_not_grow_with_hospitals(self):
+        self.seed(2)
+        _, few = self.count_queries()
+        self.seed(30)
+        response, many = self.count_queries()
+        self.assertEqual(few, many)
+        self.assertContains(response, 'hospital-card', count=32)
+
+    def test_recent_users_are_the_five_newest(self):
+        self.seed(2)
+        hospital = Hospital.objects.order_by('pk').first()
+        response, _ = self.count_queries()
+        newest = CustomUser.objects.filter(hospital=hospital).order_by('-date_joined', '-id')
+        for user in newest[:5]:
+            self.assertContains(response, user.email)
+        for user in newest[5:]:
+            self.assertNotContains(response, user.email)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AuthenticationBackendTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='General')
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'secret-pw-1', role='Staff', hospital=cls.hospital)
+
+    def test_sessions_from_model_backend_stay_logged_in(self):
+        session = self.client.session
+        session[SESSION_KEY] = str(self.staff.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = self.staff.get_session_auth_hash()
+        session.save()
+        response = self.client.get(reverse('accounts:staff_dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_uses_hospital_backend(self):
+        user = authenticate(None, username='staff@example.com', password='secret-pw-1')
+        self.assertEqual(user.backend, 'accounts.backends.HospitalModelBackend')
+
+    def test_failed_login_hashes_once(self):
+        with mock.patch.object(base_user, 'check_password', wraps=base_user.check_password) as check:
+            self.assertIsNone(authenticate(None, username='staff@example.com', password='wrong'))
+        self.assertEqual(check.call_count, 1)
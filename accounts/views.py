@@ -1,14 +1,16 @@
 from django.http import HttpResponseForbidden
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, authenticate, get_user_model
+from django.contrib.auth import login, get_user_model
 from django.contrib.auth.forms import AuthenticationForm
 from .forms import *
 from .models import CustomUser
 from django.contrib.auth import logout
 from .decorators import role_required
 from django.contrib import messages
+from hospitals.dashboard import hospital_cards
 from hospitals.models import Hospital
 from django.urls import reverse
+from CHM.pagination import paginate
 
 
 User = get_user_model()
@@ -77,15 +79,17 @@ def user_list(request):
         if first_hospital:
             return redirect(f"{reverse('accounts:user_list')}?hospital_id={first_hospital.id}")
 
-    users = User.objects.all().order_by('role', 'email')
+    users = User.objects.select_related('hospital')
     hospital = None
 
     if hospital_id:
         users = users.filter(hospital_id=hospital_id)
         hospital = Hospital.objects.filter(pk=hospital_id).first()
+    page = paginate(request, users, ('role', 'email'))
 
     return render(request, 'accounts/user_list.html', {
-        'users': users,
+        'users': page.object_list,
+        'page': page,
         'hospital': hospital
     })
 
@@ -95,17 +99,16 @@ def user_login(request):
     if request.method == 'POST':
         form = AuthenticationForm(request, data=request.POST)
         if form.is_valid():
-            email = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(request, email=email, password=password)
-            if user is not None:
-                login(request, user)
-                if user.role == 'Admin':
-                    return redirect('accounts:admin_dashboard')
-                elif user.role == 'Staff':
-                    return redirect('accounts:staff_dashboard')
-                elif user.role == 'Patient':
-                    return redirect('accounts:patient_dashboard')
+            # is_valid() already authenticated the user; calling authenticate()
+            # again would hash the password a second time.
+            user = form.get_user()
+            login(request, user)
+            if user.role == 'Admin':
+                return redirect('accounts:admin_dashboard')
+            elif user.role == 'Staff':
+                return redirect('accounts:staff_dashboard')
+            elif user.role == 'Patient':
+                return redirect('accounts:patient_dashboard')
     else:
         form = AuthenticationForm()
     return render(request, 'accounts/login.html', {'form': form})
@@ -135,17 +138,10 @@ def profile_update(request, pk):
 
 @role_required('Admin')
 def admin_dashboard(request):
-    hospitals = Hospital.objects.all().order_by("name")  # keep it neat
-
-    # attach recent users per hospital
-    for hospital in hospitals:
-        hospital.recent_users = (
-            User.objects.filter(hospital=hospital)
-            .order_by("-date_joined")[:5]
-        )
-
+    # Hospital cards are cached per hospital version; only the cards whose
+    # hospital changed since they were cached load stats and users.
     return render(request, "dashboard/dashboard_admin.html", {
-        "hospitals": hospitals,
+        "hospital_cards": hospital_cards(),
     })
 
 
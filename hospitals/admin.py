@@ -2,4 +2,5 @@ from django.contrib import admin
 from .models import *
 
 admin.site.register(Hospital)
-admin.site.register(Department)
\ No newline at end of file
+admin.site.register(Department)
+admin.site.register(HospitalStats)
\ No newline at end of file
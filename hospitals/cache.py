@@ -0,0 +1,184 @@
+# hospitals/cache.py
+"""
+Per-hospital response caching.
+
+Every hospital has a version number in the cache. Cached pages include
+the version in their key, so bumping it (on any inventory write, see
+inventory/signals.py) makes that hospital's cached pages unreachable at
+once without having to find and delete them. Admin pages that are not
+scoped to a hospital use the ALL_HOSPITALS version, which every bump
+also advances.
+
+render_hospital_fragments() caches rendered template fragments (the admin
+dashboard's hospital cards) under the same versions.
+
+conditional_list() answers If-None-Match / If-Modified-Since on list
+pages from a single MAX(updated_at), COUNT(*) query.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+
+ALL_HOSPITALS = 'all'
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+# Placeholder stored under the shared key when a page embeds a CSRF token
+CSRF_VARIANT = 'csrf-variant'
+
+
+def _version_key(hospital_id):
+    return f'hospital:{hospital_id}:version'
+
+
+def hospital_version(hospital_id):
+    # Seeded with the clock rather than 1, so a version that was evicted
+    # never restarts at a number that old entries are still stored under.
+    return cache.get_or_set(_version_key(hospital_id), time.time_ns)
+
+
+def hospital_versions(hospital_ids):
+    """{hospital_id: version} for many hospitals in one cache round trip."""
+    keys = {_version_key(pk): pk for pk in hospital_ids}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        seed = time.time_ns()
+        for key in missing:
+            cache.add(key, seed)
+        found.update(cache.get_many(missing))
+    # A full cache can evict a version as soon as it is added
+    return {pk: found.get(key, time.time_ns()) for key, pk in keys.items()}
+
+
+def _bump(hospital_ids):
+    for hospital_id in hospital_ids:
+        try:
+            cache.incr(_version_key(hospital_id))
+        except ValueError:
+            cache.set(_version_key(hospital_id), time.time_ns())
+
+
+def bump_hospital_version(*hospital_ids):
+    """
+    Invalidate cached pages for these hospitals (and the unscoped admin
+    pages) once the current transaction commits, so a concurrent request
+    cannot re-cache the old rows under the new version.
+    """
+    ids = {pk for pk in hospital_ids if pk} | {ALL_HOSPITALS}
+    transaction.on_commit(lambda: _bump(ids))
+
+
+def render_hospital_fragments(template_name, hospitals, prepare=None, force=False):
+    """
+    Render `template_name` with {'hospital': hospital} for each hospital,
+    reusing the cached HTML while that hospital's version is unchanged.
+    `prepare(missing)` is called once with just the hospitals that need
+    rendering, so it can bulk-load what the template uses. Returns the
+    fragments in the order of `hospitals`.
+    """
+    # Versions are read before any data is loaded, so a concurrent write
+    # can only leave fresh data under an old key, never stale data under a
+    # new one.
+    versions = hospital_versions([hospital.pk for hospital in hospitals])
+    keys = {hospital.pk: f'fragment:{template_name}:{hospital.pk}:{versions[hospital.pk]}' for hospital in hospitals}
+    fragments = {} if force else cache.get_many(keys.values())
+    missing = [hospital for hospital in hospitals if keys[hospital.pk] not in fragments]
+    if missing:
+        if prepare:
+            prepare(missing)
+        rendered = {keys[hospital.pk]: render_to_string(template_name, {'hospital': hospital}) for hospital in missing}
+        cache.set_many(rendered, FRAGMENT_TIMEOUT)
+        fragments.update(rendered)
+    return [fragments[keys[hospital.pk]] for hospital in hospitals]
+
+
+def page_cache_key(request, view_name):
+    active = request.active_hospital
+    scope = ALL_HOSPITALS if active.id is None else active.id
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'page:{view_name}:{request.user.role}:{scope}:{hospital_version(scope)}:{path}'
+
+
+def _csrf_key(key, request):
+    secret = request.META.get('CSRF_COOKIE', '')
+    return f"{key}:{hashlib.md5(secret.encode()).hexdigest()}"
+
+
+def cache_hospital_page(timeout=300):
+    """
+    Cache a view's GET responses per view, role and active hospital until
+    that hospital's version is bumped or `timeout` seconds pass.
+
+    Pages that render a CSRF token are cached per CSRF cookie instead,
+    because the token in the form has to match the visitor's own cookie.
+    """
+    def decorator(view):
+        view_name = f'{view.__module__}.{view.__qualname__}'
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = page_cache_key(request, view_name)
+            response = cache.get(key)
+            if response == CSRF_VARIANT:
+                response = cache.get(_csrf_key(key, request))
+            if response is not None:
+                return response
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                    cache.set(key, CSRF_VARIANT, timeout)
+                    cache.set(_csrf_key(key, request), response, timeout)
+                else:
+                    cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def list_validators(request, model):
+    """
+    (etag, last_modified timestamp) for the rows of `model` visible to the
+    request. COUNT(*) is part of the ETag so deletions change it too;
+    Last-Modified cannot see deletions, but clients that send both
+    headers are answered from the ETag alone.
+    """
+    probe = model.objects.for_request(request).aggregate(last=Max('updated_at'), count=Count('pk'))
+    last = probe['last']
+    raw = f"{last.isoformat() if last else ''}|{probe['count']}|{request.user.pk}|{request.get_full_path()}"
+    etag = 'W/' + quote_etag(hashlib.md5(raw.encode()).hexdigest())
+    return etag, int(last.timestamp()) if last else None
+
+
+def conditional_list(model):
+    """
+    Answer conditional GETs for a list of `model` rows with 304 before the
+    view runs. Responses are marked private/no-cache so clients revalidate
+    on every poll instead of reusing a copy blindly.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag, last_modified = list_validators(request, model)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers.setdefault('ETag', etag)
+            if last_modified:
+                response.headers.setdefault('Last-Modified', http_date(last_modified))
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,28 @@
+# hospitals/dashboard.py
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .cache import render_hospital_fragments
+from .models import Hospital
+
+CARD_TEMPLATE = 'dashboard/hospital_card.html'
+
+
+def _load_cards(hospitals):
+    # Stats plus the 5 most recent users per hospital, the latter in a single
+    # windowed (ROW_NUMBER) query, for the cards that are not cached
+    prefetch_related_objects(
+        hospitals,
+        'stats',
+        Prefetch(
+            'hospital',
+            queryset=get_user_model().objects.order_by('-date_joined', '-id')[:5],
+            to_attr='recent_users',
+        ),
+    )
+
+
+def hospital_cards(force=False):
+    """Rendered admin dashboard cards for every hospital, by name."""
+    hospitals = list(Hospital.objects.order_by('name'))
+    return render_hospital_fragments(CARD_TEMPLATE, hospitals, prepare=_load_cards, force=force)
@@ -0,0 +1,70 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from hospitals.cache import _version_key
+from hospitals.dashboard import _load_cards, hospital_cards
+from hospitals.models import Hospital, HospitalStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed throwaway hospitals and users, then compare the admin dashboard's "
+        "hospital cards loaded one hospital at a time against the windowed "
+        "prefetch. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospitals', type=int, default=500,
+                            help="Hospitals to seed (default 500).")
+        parser.add_argument('--users', type=int, default=10,
+                            help="Users per hospital (default 10).")
+
+    def handle(self, *args, hospitals=500, users=10, **options):
+        with transaction.atomic():
+            seeded = self._seed(hospitals, users)
+            self.stdout.write(f"{len(seeded)} hospitals, {users} users each")
+            self._run(seeded)
+            transaction.set_rollback(True)
+        # The rolled-back ids may be handed out again; forget their cards
+        cache.delete_many([_version_key(pk) for pk in seeded])
+
+    def _seed(self, hospitals, users):
+        User = get_user_model()
+        created = Hospital.objects.bulk_create(
+            Hospital(name=f"Benchmark hospital {i:04}", address="-") for i in range(hospitals)
+        )
+        HospitalStats.objects.bulk_create(HospitalStats(hospital=hospital) for hospital in created)
+        User.objects.bulk_create(
+            User(email=f"benchmark-{hospital.pk}-{i}@example.invalid", role='Staff', hospital=hospital, password='!')
+            for hospital in created for i in range(users)
+        )
+        return [hospital.pk for hospital in created]
+
+    def _run(self, seeded):
+        User = get_user_model()
+
+        def per_hospital():
+            # The dashboard before the windowed prefetch
+            for hospital in Hospital.objects.order_by('name'):
+                hospital.stats
+                list(User.objects.filter(hospital=hospital).order_by('-date_joined')[:5])
+
+        def prefetched():
+            _load_cards(list(Hospital.objects.order_by('name')))
+
+        self._measure("one query per hospital", per_hospital)
+        self._measure("windowed prefetch", prefetched)
+        self._measure("cards, cold cache", lambda: hospital_cards(force=True))
+        self._measure("cards, warm cache", hospital_cards)
+
+    def _measure(self, label, func):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label:<25}{len(queries):>6} queries{elapsed * 1000:>10.1f} ms")
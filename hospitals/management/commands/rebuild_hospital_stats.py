@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hospitals.models import Hospital, HospitalStats
+
+
+class Command(BaseCommand):
+    help = "Recompute HospitalStats from the source tables and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only report drift, do not write. Exits non-zero if any is found.")
+        parser.add_argument('--hospital', type=int, dest='hospital_id',
+                            help="Limit to a single hospital id.")
+
+    def handle(self, *args, check=False, hospital_id=None, **options):
+        hospitals = Hospital.objects.order_by('pk')
+        if hospital_id:
+            hospitals = hospitals.filter(pk=hospital_id)
+        current = {s.pk: s for s in HospitalStats.objects.filter(hospital__in=hospitals)}
+
+        drifted = 0
+        for hospital_pk in hospitals.values_list('pk', flat=True):
+            expected = HospitalStats.compute(hospital_pk)
+            stats = current.get(hospital_pk)
+            diff = {
+                field: (getattr(stats, field) if stats else None, value)
+                for field, value in expected.items()
+                if not stats or getattr(stats, field) != value
+            }
+            if diff:
+                drifted += 1
+                details = ', '.join(f"{field} {old} -> {new}" for field, (old, new) in diff.items())
+                self.stdout.write(f"Hospital {hospital_pk}: {details}")
+                if not check:
+                    HospitalStats.objects.update_or_create(hospital_id=hospital_pk, defaults=expected)
+
+        if check and drifted:
+            raise CommandError(f"{drifted} hospital(s) have drifted stats.")
+        verb = "found with drift" if check else "rebuilt"
+        self.stdout.write(self.style.SUCCESS(f"{drifted} hospital(s) {verb}."))
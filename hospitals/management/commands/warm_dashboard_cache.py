@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from hospitals.dashboard import hospital_cards
+
+
+class Command(BaseCommand):
+    help = "Render the admin dashboard's hospital cards into the cache, e.g. right after a deploy."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Re-render every card, not only the ones missing from the cache.")
+
+    def handle(self, *args, force=False, **options):
+        started = time.perf_counter()
+        cards = hospital_cards(force=force)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"{len(cards)} hospital card(s) cached in {elapsed:.2f}s."))
@@ -0,0 +1,13 @@
+# hospitals/middleware.py
+from .scoping import ActiveHospital
+
+
+class ActiveHospitalMiddleware:
+    """Attach request.active_hospital; must come after AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.active_hospital = ActiveHospital(request)
+        return self.get_response(request)
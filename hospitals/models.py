@@ -1,5 +1,7 @@
 # hospitals/models.py
 from django.db import models
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 class Hospital(models.Model):
     name = models.CharField(max_length=255, null=True, blank=True)
@@ -19,3 +21,63 @@ class Department(models.Model):
     def __str__(self):
         return f"{self.name} - {self.hospital.name}"
 
+
+class HospitalStats(models.Model):
+    """
+    Per-hospital rollup of the counts shown on the overview and dashboards.
+    Kept current by the signal handlers in hospitals/signals.py; rebuild it
+    with `manage.py rebuild_hospital_stats`.
+    """
+    hospital = models.OneToOneField(Hospital, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    staff_count = models.PositiveIntegerField(default=0)
+    patient_count = models.PositiveIntegerField(default=0)
+    equipment_count = models.PositiveIntegerField(default=0)
+    supply_count = models.PositiveIntegerField(default=0)
+    medication_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    COUNT_FIELDS = ['staff_count', 'patient_count', 'equipment_count', 'supply_count', 'medication_count']
+
+    @staticmethod
+    def compute(hospital_id):
+        """Count everything from the source tables (the slow path)."""
+        from django.apps import apps
+        User = apps.get_model('accounts', 'CustomUser')
+        return {
+            'staff_count': User.objects.filter(hospital_id=hospital_id, role='Staff').count(),
+            'patient_count': User.objects.filter(hospital_id=hospital_id, role='Patient').count(),
+            'equipment_count': apps.get_model('inventory', 'Equipment').objects.filter(hospital_id=hospital_id).count(),
+            'supply_count': apps.get_model('inventory', 'MedicalSupply').objects.filter(hospital_id=hospital_id).count(),
+            'medication_count': apps.get_model('inventory', 'Medication').objects.filter(hospital_id=hospital_id).count(),
+        }
+
+    @classmethod
+    def rebuild(cls, hospital_id):
+        stats, _ = cls.objects.update_or_create(hospital_id=hospital_id, defaults=cls.compute(hospital_id))
+        return stats
+
+    @classmethod
+    def for_hospital(cls, hospital):
+        try:
+            return cls.objects.get(hospital=hospital)
+        except cls.DoesNotExist:
+            return cls.rebuild(hospital.pk)
+
+    @classmethod
+    def bump(cls, hospital_id, field, delta):
+        """
+        Atomically add `delta` to one counter; builds the row if it is missing.
+        Bulk updates and deletes send no signals, so a counter can already be
+        low: it stops at 0 instead of failing the write that decrements it,
+        and `rebuild_hospital_stats` reports the drift.
+        """
+        if hospital_id is None or not delta:
+            return
+        updated = cls.objects.filter(hospital_id=hospital_id).update(
+            **{field: Greatest(models.F(field) + delta, 0), 'updated_at': timezone.now()}
+        )
+        if not updated and Hospital.objects.filter(pk=hospital_id).exists():
+            cls.rebuild(hospital_id)
+
+    def __str__(self):
+        return f"Stats for {self.hospital}"
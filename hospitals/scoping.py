@@ -0,0 +1,71 @@
+# hospitals/scoping.py
+from django.db import models
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
+
+from .models import Hospital
+
+
+class ActiveHospital:
+    """
+    The hospital a request is working in, resolved at most once per request
+    (see hospitals.middleware.ActiveHospitalMiddleware):
+    Staff and Patients are tied to their own hospital, Admins pick one
+    with ?hospital_id= or see every hospital when it is omitted.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def user(self):
+        return getattr(self.request, 'user', None)
+
+    @property
+    def is_unscoped(self):
+        """Admin without ?hospital_id=: queries are not limited to one hospital."""
+        return self.user is not None and self.user.is_authenticated and self.user.role == 'Admin' and self.id is None
+
+    @cached_property
+    def id(self):
+        user = self.user
+        if user is None or not user.is_authenticated:
+            return None
+        if user.role == 'Admin':
+            hospital_id = self.request.GET.get('hospital_id')
+            if not hospital_id:
+                return None
+            try:
+                return int(hospital_id)
+            except ValueError:
+                raise Http404("Invalid hospital.")
+        return user.hospital_id
+
+    @cached_property
+    def hospital(self):
+        if self.id is None:
+            return None
+        if self.user.role == 'Admin':
+            return get_object_or_404(Hospital, pk=self.id)
+        return self.user.hospital
+
+
+class HospitalScopedQuerySet(models.QuerySet):
+    """
+    QuerySet for models that belong to a hospital. The model names the path
+    to its hospital FK in `hospital_scope` (e.g. 'patient__user__hospital');
+    filters go through the FK column so they use its index and never load
+    the Hospital row.
+    """
+
+    def for_hospital(self, hospital_id):
+        return self.filter(**{f'{self.model.hospital_scope}_id': hospital_id})
+
+    def for_request(self, request):
+        active = request.active_hospital
+        if active.is_unscoped:
+            return self
+        if active.id is None:
+            return self.none()
+        return self.for_hospital(active.id)
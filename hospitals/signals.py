@@ -0,0 +1,71 @@
+# hospitals/signals.py
+from django.db.models.signals import post_delete, post_init, post_save
+
+from accounts.models import CustomUser
+from inventory.models import Equipment, MedicalSupply, Medication
+from .cache import bump_hospital_version
+from .models import Hospital, HospitalStats
+
+# model -> function returning the HospitalStats counter a row contributes to (or None)
+TRACKED = {
+    CustomUser: lambda obj: {'Staff': 'staff_count', 'Patient': 'patient_count'}.get(obj.role),
+    Equipment: lambda obj: 'equipment_count',
+    MedicalSupply: lambda obj: 'supply_count',
+    Medication: lambda obj: 'medication_count',
+}
+
+
+def _bucket(obj):
+    field = TRACKED[type(obj)](obj)
+    return (obj.hospital_id, field) if obj.hospital_id and field else None
+
+
+def remember_bucket(sender, instance, **kwargs):
+    # Deferred loads (.only()/.defer()) are left alone so that no extra query
+    # is issued here; saving such an instance falls back to a rebuild.
+    if instance.pk and not instance.get_deferred_fields() & {'role', 'hospital_id'}:
+        instance._stats_bucket = _bucket(instance)
+
+
+def update_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new = _bucket(instance)
+    if not created and not hasattr(instance, '_stats_bucket'):
+        if new:
+            HospitalStats.rebuild(new[0])
+        instance._stats_bucket = new
+        return
+    old = None if created else instance._stats_bucket
+    if old != new:
+        if old:
+            HospitalStats.bump(*old, -1)
+        if new:
+            HospitalStats.bump(*new, 1)
+    instance._stats_bucket = new
+
+
+def update_stats_on_delete(sender, instance, **kwargs):
+    old = getattr(instance, '_stats_bucket', None)
+    if old:
+        HospitalStats.bump(*old, -1)
+
+
+def create_stats_for_hospital(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        HospitalStats.objects.get_or_create(hospital=instance)
+
+
+def invalidate_hospital_pages(sender, instance, raw=False, **kwargs):
+    # Cached pages show the hospital's name
+    if not raw:
+        bump_hospital_version(instance.pk)
+
+
+def connect():
+    for model in TRACKED:
+        post_init.connect(remember_bucket, sender=model, dispatch_uid=f'stats_init_{model.__name__}')
+        post_save.connect(update_stats_on_save, sender=model, dispatch_uid=f'stats_save_{model.__name__}')
+        post_delete.connect(update_stats_on_delete, sender=model, dispatch_uid=f'stats_delete_{model.__name__}')
+    post_save.connect(create_stats_for_hospital, sender=Hospital, dispatch_uid='stats_create_hospital')
+    post_save.connect(invalidate_hospital_pages, sender=Hospital, dispatch_uid='page_cache_hospital')
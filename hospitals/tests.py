@@ -1,3 +1,298 @@
-from django.test import TestCase
+import datetime
+import io
+import re
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from accounts.models import CustomUser
+from inventory.models import Medication
+from patients.models import MedicalRecord, PatientProfile
+from pharmacy.models import Prescription, Purchase
+from .cache import hospital_version, page_cache_key
+from .models import Hospital, HospitalStats
+from .scoping import ActiveHospital
+
+HOSPITALS = 20
+PER_HOSPITAL = 50
+
+
+class HotPathIndexTests(TestCase):
+    """
+    The hot filters from the pharmacy pages, patient history and the
+    dashboards are answered from an index, never a full table scan, on a
+    seeded dataset. The querysets mirror the views'.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        hospitals = Hospital.objects.bulk_create(Hospital(name=f'Hospital {i}') for i in range(HOSPITALS))
+        users = CustomUser.objects.bulk_create(
+            CustomUser(email=f'user-{h.pk}-{i}@example.com', role='Patient' if i % 5 else 'Staff', hospital=h, password='!')
+            for h in hospitals for i in range(PER_HOSPITAL)
+        )
+        medications = Medication.objects.bulk_create(
+            Medication(name=f'Medication {i}', price=1, quantity=100, prescription_required=bool(i % 2), hospital=h)
+            for h in hospitals for i in range(PER_HOSPITAL)
+        )
+        Prescription.objects.bulk_create(
+            Prescription(patient=user, medication=medication, prescribed_by=user, is_active=bool(i % 3))
+            for i, (user, medication) in enumerate(zip(users, medications))
+        )
+        Purchase.objects.bulk_create(
+            Purchase(patient=user, medication=medication, quantity=1, hospital=medication.hospital)
+            for user, medication in zip(users, medications)
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        cls.hospital = hospitals[0]
+        cls.patient = CustomUser.objects.filter(hospital=cls.hospital, role='Patient').first()
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        tables = set(connection.introspection.table_names())
+        if connection.vendor == 'sqlite':
+            # SEARCH is an index lookup; SCAN reads the whole table (or index)
+            pattern = r'\bSCAN (\w+)'
+        elif connection.vendor == 'postgresql':
+            pattern = r'Seq Scan on (\w+)'
+        else:
+            self.skipTest(f"No plan check for {connection.vendor}")
+        scanned = set(re.findall(pattern, plan)) & tables
+        self.assertFalse(scanned, f"Full scan of {', '.join(sorted(scanned))}:\n{plan}")
+
+    def test_pharmacy_medication_list(self):
+        self.assertNoFullScan(
+            Medication.objects.for_hospital(self.hospital.pk).filter(prescription_required=False).order_by('name', 'id')[:26]
+        )
+
+    def test_my_prescriptions(self):
+        self.assertNoFullScan(
+            Prescription.objects.for_hospital(self.hospital.pk).filter(patient=self.patient)
+            .select_related('medication').order_by('-date_prescribed', 'id')[:26]
+        )
+
+    def test_active_prescriptions(self):
+        self.assertNoFullScan(Prescription.objects.filter(patient=self.patient, is_active=True).order_by('-date_prescribed'))
+
+    def test_purchase_history(self):
+        self.assertNoFullScan(
+            Purchase.objects.for_hospital(self.hospital.pk).filter(patient=self.patient)
+            .select_related('medication').order_by('-date_purchased', 'id')[:26]
+        )
+
+    def test_hospital_overview_latest_patients(self):
+        self.assertNoFullScan(
+            CustomUser.objects.filter(role='Patient', hospital=self.hospital).order_by('-date_joined')[:5]
+        )
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PageCacheTests(TestCase):
+    """cache_hospital_page: per-hospital, per-role pages, dropped when the hospital's version is bumped."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital, cls.other = Hospital.objects.bulk_create([Hospital(name='General'), Hospital(name='Other')])
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=cls.hospital)
+        cls.other_staff = CustomUser.objects.create_user('other@example.com', 'pw', role='Staff', hospital=cls.other)
+        cls.admin = CustomUser.objects.create_user('admin@example.com', 'pw', role='Admin')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, user, url=None):
+        self.client.force_login(user)
+        return self.client.get(url or reverse('inventory:medication_list'))
+
+    def test_write_bumps_version_and_next_get_misses(self):
+        Medication.objects.create(name='Aspirin', price=1, quantity=5, hospital=self.hospital)
+        self.assertContains(self.get(self.staff), 'Aspirin')
+        # Without signals nothing is invalidated: the cached page is served
+        Medication.objects.bulk_create([Medication(name='Ibuprofen', price=1, quantity=5, hospital=self.hospital)])
+        self.assertNotContains(self.get(self.staff), 'Ibuprofen')
+
+        version = hospital_version(self.hospital.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Medication.objects.create(name='Paracetamol', price=1, quantity=5, hospital=self.hospital)
+        self.assertNotEqual(hospital_version(self.hospital.pk), version)
+        response = self.get(self.staff)
+        self.assertContains(response, 'Ibuprofen')
+        self.assertContains(response, 'Paracetamol')
+
+    def test_other_hospitals_bump_does_not_invalidate(self):
+        version = hospital_version(self.hospital.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Medication.objects.create(name='Aspirin', price=1, quantity=5, hospital=self.other)
+        self.assertEqual(hospital_version(self.hospital.pk), version)
+
+    def key(self, user, query=''):
+        request = RequestFactory().get(f'/inventory/medications/{query}')
+        request.user = user
+        request.active_hospital = ActiveHospital(request)
+        return page_cache_key(request, 'inventory.views.medication_list')
+
+    def test_key_differs_between_hospitals_and_roles(self):
+        keys = {
+            self.key(self.staff),
+            self.key(self.other_staff),
+            self.key(self.admin, f'?hospital_id={self.hospital.pk}'),
+            self.key(self.admin),
+        }
+        self.assertEqual(len(keys), 4)
+
+    def test_page_is_not_served_to_another_hospital(self):
+        Medication.objects.create(name='Aspirin', price=1, quantity=5, hospital=self.hospital)
+        Medication.objects.create(name='Morphine', price=1, quantity=5, hospital=self.other)
+        self.assertContains(self.get(self.staff), 'Aspirin')
+        response = self.get(self.other_staff)
+        self.assertContains(response, 'Morphine')
+        self.assertNotContains(response, 'Aspirin')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ConditionalListTests(TestCase):
+    """conditional_list: 304 while the visible rows are unchanged, 200 once one changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='General')
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=cls.hospital)
+        cls.medication = Medication.objects.create(name='Aspirin', price=1, quantity=5, hospital=cls.hospital)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def get(self, **headers):
+        return self.client.get(reverse('inventory:medication_list'), headers=headers)
+
+    def test_if_none_match(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+        self.medication.quantity = 4
+        self.medication.save()
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        last_modified = self.get()['Last-Modified']
+        self.assertEqual(self.get(if_modified_since=last_modified).status_code, 304)
+        later = timezone.now() + datetime.timedelta(minutes=1)
+        Medication.objects.filter(pk=self.medication.pk).update(updated_at=later)
+        response = self.get(if_modified_since=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'], http_date(int(later.timestamp())))
+
+    def test_deleted_row_changes_etag(self):
+        Medication.objects.create(name='Ibuprofen', price=1, quantity=5, hospital=self.hospital)
+        etag = self.get()['ETag']
+        Medication.objects.filter(name='Ibuprofen').delete()
+        self.assertEqual(self.get(if_none_match=etag).status_code, 200)
+
+
+class HospitalStatsTests(TestCase):
+    """The HospitalStats rollup follows saves and deletes, and the rebuild command repairs drift."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='General')
+
+    def counts(self):
+        stats = HospitalStats.objects.get(hospital=self.hospital)
+        return {field: getattr(stats, field) for field in HospitalStats.COUNT_FIELDS if getattr(stats, field)}
+
+    def test_create_and_delete(self):
+        self.assertEqual(self.counts(), {})
+        staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=self.hospital)
+        CustomUser.objects.create_user('patient@example.com', 'pw', role='Patient', hospital=self.hospital)
+        medication = Medication.objects.create(name='Aspirin', price=1, quantity=5, hospital=self.hospital)
+        self.assertEqual(self.counts(), {'staff_count': 1, 'patient_count': 1, 'medication_count': 1})
+        staff.role = 'Patient'
+        staff.save()
+        self.assertEqual(self.counts(), {'patient_count': 2, 'medication_count': 1})
+        medication.delete()
+        staff.delete()
+        self.assertEqual(self.counts(), {'patient_count': 1})
+
+    def test_decrement_of_a_drifted_counter_stops_at_zero(self):
+        # bulk_create sends no signals: the counter stays at 0
+        Medication.objects.bulk_create([
+            Medication(name='Aspirin', price=1, quantity=5, hospital=self.hospital),
+            Medication(name='Ibuprofen', price=1, quantity=5, hospital=self.hospital),
+        ])
+        Medication.objects.get(name='Aspirin').delete()
+        self.assertEqual(self.counts(), {})
+
+    def test_rebuild_command_repairs_drift(self):
+        Medication.objects.bulk_create([Medication(name='Aspirin', price=1, quantity=5, hospital=self.hospital)])
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_hospital_stats', check=True, stdout=out)
+        self.assertIn(f"Hospital {self.hospital.pk}: medication_count 0 -> 1", out.getvalue())
+        self.assertEqual(self.counts(), {})
+        call_command('rebuild_hospital_stats', stdout=io.StringIO())
+        self.assertEqual(self.counts(), {'medication_count': 1})
+        call_command('rebuild_hospital_stats', check=True, stdout=io.StringIO())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ForRequestTests(TestCase):
+    """for_request limits Staff and Patients to their hospital and lets Admins pick one."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital, cls.other = Hospital.objects.bulk_create([Hospital(name='General'), Hospital(name='Other')])
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=cls.hospital)
+        cls.patient = CustomUser.objects.create_user('patient@example.com', 'pw', role='Patient', hospital=cls.other)
+        cls.admin = CustomUser.objects.create_user('admin@example.com', 'pw', role='Admin')
+        cls.homeless = CustomUser.objects.create_user('new@example.com', 'pw', role='Staff')
+        cls.aspirin = Medication.objects.create(name='Aspirin', price=1, quantity=5, hospital=cls.hospital)
+        cls.morphine = Medication.objects.create(name='Morphine', price=1, quantity=5, hospital=cls.other)
+        patient = PatientProfile.objects.create(user=cls.patient, date_of_birth=datetime.date(1990, 1, 1), gender='male')
+        cls.record = MedicalRecord.objects.create(patient=patient, description='Flu')
+
+    def visible(self, user, model=Medication, query=None):
+        request = RequestFactory().get('/', query or {})
+        request.user = user
+        request.active_hospital = ActiveHospital(request)
+        return set(model.objects.for_request(request))
+
+    def test_staff_and_patients_see_their_hospital(self):
+        self.assertEqual(self.visible(self.staff), {self.aspirin})
+        self.assertEqual(self.visible(self.patient), {self.morphine})
+        self.assertEqual(self.visible(self.staff, MedicalRecord), set())
+        self.assertEqual(self.visible(self.patient, MedicalRecord), {self.record})
+
+    def test_staff_cannot_switch_hospital(self):
+        self.assertEqual(self.visible(self.staff, query={'hospital_id': self.other.pk}), {self.aspirin})
+        self.assertEqual(self.visible(self.staff, MedicalRecord, {'hospital_id': self.other.pk}), set())
+
+    def test_user_without_hospital_sees_nothing(self):
+        self.assertEqual(self.visible(self.homeless), set())
+
+    def test_admin_hospital_id_switches_scope(self):
+        self.assertEqual(self.visible(self.admin), {self.aspirin, self.morphine})
+        self.assertEqual(self.visible(self.admin, query={'hospital_id': self.other.pk}), {self.morphine})
+        self.assertEqual(self.visible(self.admin, MedicalRecord, {'hospital_id': self.hospital.pk}), set())
+        with self.assertRaises(Http404):
+            self.visible(self.admin, query={'hospital_id': 'x'})
+
+    def test_views_use_the_active_hospital(self):
+        url = reverse('inventory:medication_list')
+        self.client.force_login(self.staff)
+        response = self.client.get(url, {'hospital_id': self.other.pk})
+        self.assertContains(response, 'Aspirin')
+        self.assertNotContains(response, 'Morphine')
+        self.client.force_login(self.admin)
+        response = self.client.get(url, {'hospital_id': self.other.pk})
+        self.assertContains(response, 'Morphine')
+        self.assertNotContains(response, 'Aspirin')
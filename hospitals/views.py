@@ -1,8 +1,7 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Hospital, Department
+from .models import Hospital, Department, HospitalStats
 from .forms import HospitalForm, DepartmentForm
 from accounts.models import CustomUser
-from inventory.models import Equipment, MedicalSupply, Medication
 from reports.models import Report
 from .models import Hospital
 from django.shortcuts import render, get_object_or_404
@@ -44,14 +43,8 @@ def hospital_delete(request, pk):
 def hospital_overview(request, pk):
     hospital = get_object_or_404(Hospital, pk=pk)
 
-    # Filter users by hospital
-    staff_count = CustomUser.objects.filter(role='Staff', hospital=hospital).count()
-    patient_count = CustomUser.objects.filter(role='Patient', hospital=hospital).count()
-
-    # Inventory counts per hospital
-    equipment_count = Equipment.objects.filter(hospital=hospital).count()
-    supply_count = MedicalSupply.objects.filter(hospital=hospital).count()
-    medication_count = Medication.objects.filter(hospital=hospital).count()
+    # Counts come from the HospitalStats rollup instead of five COUNT(*) queries
+    stats = HospitalStats.for_hospital(hospital)
 
     # Latest patients for this hospital
     latest_patients = (
@@ -61,11 +54,11 @@ def hospital_overview(request, pk):
 
     return render(request, 'hospitals/hospital_overview.html', {
         'hospital': hospital,
-        'staff_count': staff_count,
-        'patient_count': patient_count,
-        'equipment_count': equipment_count,
-        'supply_count': supply_count,
-        'medication_count': medication_count,
+        'staff_count': stats.staff_count,
+        'patient_count': stats.patient_count,
+        'equipment_count': stats.equipment_count,
+        'supply_count': stats.supply_count,
+        'medication_count': stats.medication_count,
         'latest_patients': latest_patients,
     })
 
@@ -3,4 +3,5 @@ from .models import *
 
 admin.site.register(Medication)
 admin.site.register(MedicalSupply)
-admin.site.register(Equipment)
\ No newline at end of file
+admin.site.register(Equipment)
+admin.site.register(StockMovement)
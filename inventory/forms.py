@@ -2,10 +2,27 @@ from django import forms
 from .models import Medication, MedicalSupply, Equipment
 
 class MedicationForm(forms.ModelForm):
+    # Stock level the user saw when the form was rendered; on edit the change
+    # is applied as a delta so purchases made in the meantime are kept.
+    original_quantity = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
     class Meta:
         model = Medication
         fields = ['name', 'description', 'quantity', 'unit', 'price', 'prescription_required']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Read now: validation copies the submitted quantity onto the instance
+        self._original_quantity = self.instance.quantity
+        if self.instance.pk:
+            self.fields['original_quantity'].initial = self.instance.quantity
+
+    def stock_delta(self):
+        original = self.cleaned_data.get('original_quantity')
+        if original is None:
+            original = self._original_quantity
+        return self.cleaned_data['quantity'] - original
+
 class MedicalSupplyForm(forms.ModelForm):
     class Meta:
         model = MedicalSupply
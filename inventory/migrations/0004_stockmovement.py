@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def opening_balances(apps, schema_editor):
+    Medication = apps.get_model('inventory', 'Medication')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    # Dated when the medication was added, so stock_as_of() answers for the
+    # time before this migration too (history before then is the current
+    # stock: earlier purchases and restocks were never recorded)
+    StockMovement.objects.bulk_create(
+        StockMovement(medication_id=pk, kind='initial', delta=quantity, created_at=created_at)
+        for pk, quantity, created_at in Medication.objects.filter(quantity__gt=0)
+        .values_list('pk', 'quantity', 'created_at').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('inventory', '0003_equipment_hospital_medicalsupply_hospital_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('initial', 'Opening balance'), ('purchase', 'Purchase'), ('restock', 'Restock'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('delta', models.IntegerField()),
+                ('source_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='inventory.medication')),
+                ('source_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['medication', 'created_at'], name='inventory_s_medicat_2550bb_idx')],
+            },
+        ),
+        migrations.RunPython(opening_balances, migrations.RunPython.noop),
+    ]
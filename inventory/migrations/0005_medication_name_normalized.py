@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:08
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _normalize(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(value.casefold().split())
+
+
+def backfill_names(apps, schema_editor):
+    Medication = apps.get_model('inventory', 'Medication')
+    batch = []
+    for med in Medication.objects.only('pk', 'name').iterator(chunk_size=2000):
+        med.name_normalized = _normalize(med.name)
+        batch.append(med)
+        if len(batch) >= 2000:
+            Medication.objects.bulk_update(batch, ['name_normalized'])
+            batch = []
+    Medication.objects.bulk_update(batch, ['name_normalized'])
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS inventory_medication_name_trgm "
+            "ON inventory_medication USING GIN (name_normalized gin_trgm_ops)"
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS inventory_medication_name_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_stockmovement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='name_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_names, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0002_hospitalstats'),
+        ('inventory', '0005_medication_name_normalized'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['hospital', 'prescription_required', 'name'], name='medication_hosp_rx_name_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0002_hospitalstats'),
+        ('inventory', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['hospital', 'updated_at'], name='equipment_hosp_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalsupply',
+            index=models.Index(fields=['hospital', 'updated_at'], name='supply_hosp_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['hospital', 'updated_at'], name='medication_hosp_updated_idx'),
+        ),
+    ]
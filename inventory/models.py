@@ -1,5 +1,28 @@
-from django.db import models
+import unicodedata
+
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models, transaction
+from django.db.models import BooleanField, F, FloatField, Sum
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from hospitals.cache import bump_hospital_version
 from hospitals.models import Hospital
+from hospitals.scoping import HospitalScopedQuerySet
+
+
+def normalize_name(value):
+    """Lower-case, accent-free, single-spaced form of a name for prefix matching."""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(value.casefold().split())
+
+
+class InsufficientStock(Exception):
+    def __init__(self, message='', medication_ids=()):
+        super().__init__(message)
+        self.medication_ids = list(medication_ids)
+
 
 class Medication(models.Model):
     name = models.CharField(max_length=100)
@@ -9,14 +32,177 @@ class Medication(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     prescription_required = models.BooleanField(default=False)  # ✅ New field
     hospital = models.ForeignKey(Hospital, on_delete=models.SET_NULL, null=True, blank=True, related_name="medication")
+    # normalize_name(name); indexed for prefix search (on Postgres db_index adds a
+    # varchar_pattern_ops `_like` index too, plus the trigram index)
+    name_normalized = models.CharField(max_length=100, db_index=True, editable=False, default='')
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'hospital'
+
+    class Meta:
+        indexes = [
+            # pharmacy_medication_list: hospital + OTC filter, ordered by name
+            models.Index(fields=['hospital', 'prescription_required', 'name'], name='medication_hosp_rx_name_idx'),
+            # conditional GET probe: MAX(updated_at), COUNT(*) per hospital
+            models.Index(fields=['hospital', 'updated_at'], name='medication_hosp_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        self.name_normalized = normalize_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_normalized'}
+        super().save(*args, **kwargs)
+        # Opening balance so the ledger always sums to the stock on hand
+        if adding and self.quantity:
+            StockMovement.objects.create(
+                medication=self, kind=StockMovement.INITIAL, delta=self.quantity
+            )
+
+    @staticmethod
+    def autocomplete(queryset, term, limit=20):
+        """
+        Medications in `queryset` whose name starts with `term` (an index
+        scan on name_normalized), topped up with fuzzy matches: trigram
+        similarity on Postgres, substring match elsewhere.
+        """
+        prefix = normalize_name(term)
+        if not prefix:
+            return []
+        if connection.vendor == 'sqlite':
+            # SQLite compares text bytewise, so a range is exact and seeks the
+            # plain index; its LIKE is case-insensitive and cannot use it.
+            # U+10FFFF sorts above every character, emoji included.
+            matches = queryset.filter(name_normalized__gte=prefix, name_normalized__lt=prefix + '\U0010ffff')
+        else:
+            # LIKE 'prefix%'; on Postgres the `_like` (varchar_pattern_ops)
+            # index Django creates for db_index serves it under any collation
+            matches = queryset.filter(name_normalized__startswith=prefix)
+        results = list(matches.order_by('name_normalized', 'pk')[:limit])
+        if len(results) < limit:
+            fuzzy = queryset.exclude(pk__in=[m.pk for m in results])
+            if connection.vendor == 'postgresql':
+                fuzzy = fuzzy.filter(
+                    RawSQL("inventory_medication.name_normalized %% %s", (prefix,), output_field=BooleanField())
+                ).annotate(
+                    similarity=RawSQL("similarity(inventory_medication.name_normalized, %s)", (prefix,), output_field=FloatField())
+                ).order_by('-similarity', 'pk')
+            else:
+                fuzzy = fuzzy.filter(name_normalized__contains=prefix).order_by('name_normalized', 'pk')
+            results += list(fuzzy[:limit - len(results)])
+        return results
+
+    def adjust_stock(self, delta, kind, source=None):
+        return StockMovement.record(self, delta, kind, source)
+
+    def stock_as_of(self, when):
+        """Stock level at `when`, derived from the movement ledger."""
+        return self.stock_movements.filter(created_at__lte=when).aggregate(
+            total=Sum('delta')
+        )['total'] or 0
+
     def __str__(self):
         return f"{self.name} ({self.quantity} {self.unit})"
 
 
+class StockMovement(models.Model):
+    """
+    Append-only ledger of every change to Medication.quantity. The running
+    quantity column is only ever changed together with a row here, through
+    StockMovement.record(), so balances can be rebuilt for any point in time.
+    """
+    INITIAL = 'initial'
+    PURCHASE = 'purchase'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (INITIAL, 'Opening balance'),
+        (PURCHASE, 'Purchase'),
+        (RESTOCK, 'Restock'),
+        (ADJUSTMENT, 'Adjustment'),
+    ]
+
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    delta = models.IntegerField()
+    source_type = models.ForeignKey(ContentType, on_delete=models.SET_NULL, null=True, blank=True)
+    source_id = models.PositiveBigIntegerField(null=True, blank=True)
+    source = GenericForeignKey('source_type', 'source_id')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'medication__hospital'
+
+    class Meta:
+        indexes = [models.Index(fields=['medication', 'created_at'])]
+
+    @classmethod
+    def record(cls, medication, delta, kind, source=None):
+        """
+        Apply `delta` to the medication's stock with a single conditional
+        UPDATE (quantity = quantity + delta) and append the ledger row.
+        Raises InsufficientStock if the stock would go negative.
+        """
+        with transaction.atomic():
+            # Insert the ledger row first so the row lock taken by the UPDATE
+            # is held only until commit, not across further statements.
+            movement = cls.objects.create(medication=medication, kind=kind, delta=delta, source=source)
+            rows = Medication.objects.filter(pk=medication.pk)
+            if delta < 0:
+                rows = rows.filter(quantity__gte=-delta)
+            if not rows.update(quantity=F('quantity') + delta, updated_at=timezone.now()):
+                raise InsufficientStock(f"Not enough stock of {medication.name}.", [medication.pk])
+        return movement
+
+    @classmethod
+    def record_many(cls, entries, kind):
+        """
+        Apply several (medication, delta, source) entries in one transaction.
+        Stock rows are updated in primary-key order so concurrent callers
+        always lock them in the same order and cannot deadlock. Every entry
+        is checked; InsufficientStock lists all medications that fell short.
+        """
+        entries = sorted(entries, key=lambda entry: entry[0].pk)
+        short = []
+        with transaction.atomic():
+            movements = cls.objects.bulk_create([
+                cls(medication=medication, kind=kind, delta=delta, source=source)
+                for medication, delta, source in entries
+            ])
+            now = timezone.now()
+            for medication, delta, source in entries:
+                rows = Medication.objects.filter(pk=medication.pk)
+                if delta < 0:
+                    rows = rows.filter(quantity__gte=-delta)
+                if not rows.update(quantity=F('quantity') + delta, updated_at=now):
+                    short.append(medication.pk)
+            if short:
+                raise InsufficientStock("Not enough stock.", short)
+            # bulk_create sends no post_save, so invalidate cached pages here
+            bump_hospital_version(*{medication.hospital_id for medication, delta, source in entries})
+        return movements
+
+    @classmethod
+    def balances(cls, as_of=None):
+        """{medication_id: stock} for every medication, optionally as of a point in time."""
+        movements = cls.objects.all()
+        if as_of is not None:
+            movements = movements.filter(created_at__lte=as_of)
+        return dict(movements.values('medication').annotate(total=Sum('delta')).values_list('medication', 'total'))
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Stock movements are append-only.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.delta:+d} {self.medication.name}"
+
+
 class MedicalSupply(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
@@ -27,6 +213,15 @@ class MedicalSupply(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'hospital'
+
+    class Meta:
+        indexes = [
+            # conditional GET probe: MAX(updated_at), COUNT(*) per hospital
+            models.Index(fields=['hospital', 'updated_at'], name='supply_hosp_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.quantity} {self.unit})"
 
@@ -45,5 +240,14 @@ class Equipment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'hospital'
+
+    class Meta:
+        indexes = [
+            # conditional GET probe: MAX(updated_at), COUNT(*) per hospital
+            models.Index(fields=['hospital', 'updated_at'], name='equipment_hosp_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.quantity} units - {self.status})"
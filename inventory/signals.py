@@ -0,0 +1,25 @@
+# inventory/signals.py
+from django.db.models.signals import post_delete, post_save
+
+from hospitals.cache import bump_hospital_version
+from .models import Equipment, MedicalSupply, Medication, StockMovement
+
+
+def invalidate_hospital_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_hospital_version(instance.hospital_id)
+
+
+def invalidate_on_stock_movement(sender, instance, created, raw=False, **kwargs):
+    # Stock changes are applied with queryset.update(), which sends no
+    # Medication signal; the ledger row saved alongside it does.
+    if created and not raw:
+        bump_hospital_version(instance.medication.hospital_id)
+
+
+def connect():
+    for model in (Medication, MedicalSupply, Equipment):
+        post_save.connect(invalidate_hospital_pages, sender=model, dispatch_uid=f'page_cache_save_{model.__name__}')
+        post_delete.connect(invalidate_hospital_pages, sender=model, dispatch_uid=f'page_cache_delete_{model.__name__}')
+    post_save.connect(invalidate_on_stock_movement, sender=StockMovement, dispatch_uid='page_cache_stock_movement')
@@ -1,3 +1,94 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from hospitals.models import Hospital
+from .forms import MedicationForm
+from .models import Medication, StockMovement, normalize_name
+
+
+class MedicationStockTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='General')
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=cls.hospital)
+
+    def setUp(self):
+        self.medication = Medication.objects.create(
+            name='Paracetamol', quantity=10, price=Decimal('2.50'), hospital=self.hospital,
+        )
+
+    def form_data(self, **overrides):
+        data = {'name': 'Paracetamol', 'description': '', 'quantity': 10, 'unit': 'pcs', 'price': '2.50'}
+        data.update(overrides)
+        return data
+
+
+class MedicationFormTests(MedicationStockTestCase):
+
+    def test_delta_from_original_quantity(self):
+        form = MedicationForm(self.form_data(quantity=12, original_quantity=8), instance=self.medication)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.stock_delta(), 4)
+
+    def test_delta_without_original_quantity(self):
+        form = MedicationForm(self.form_data(quantity=15), instance=self.medication)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.stock_delta(), 5)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MedicationUpdateTests(MedicationStockTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.staff)
+        self.url = reverse('inventory:medication_update', args=[self.medication.pk])
+
+    def test_edit_records_adjustment(self):
+        self.client.post(self.url, self.form_data(quantity=4))
+        self.medication.refresh_from_db()
+        self.assertEqual(self.medication.quantity, 4)
+        self.assertEqual(
+            list(self.medication.stock_movements.values_list('kind', 'delta').order_by('pk')),
+            [(StockMovement.INITIAL, 10), (StockMovement.ADJUSTMENT, -6)],
+        )
+
+    def test_edit_keeps_concurrent_purchases(self):
+        form_quantity = self.medication.quantity
+        self.medication.adjust_stock(-3, StockMovement.PURCHASE)
+        self.client.post(self.url, self.form_data(quantity=form_quantity + 5, original_quantity=form_quantity))
+        self.medication.refresh_from_db()
+        self.assertEqual(self.medication.quantity, 12)
+
+
+class AutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        names = ['Amoxicillin', 'Amlodipine', 'Ámoxil', 'Aspirin', 'Co-amoxiclav', 'Am%ine', 'Amxxine',
+                 'Co-zinc', 'Zinc\U0001F48A syrup']
+        Medication.objects.bulk_create(Medication(name=name, name_normalized=normalize_name(name), price=1) for name in names)
+
+    def names(self, term, limit=20):
+        return [medication.name for medication in Medication.autocomplete(Medication.objects.all(), term, limit)]
+
+    def test_prefix_matches_first_then_substring(self):
+        self.assertEqual(self.names('AMOX'), ['Amoxicillin', 'Ámoxil', 'Co-amoxiclav'])
+
+    def test_limit_applies_to_prefix_matches(self):
+        self.assertEqual(self.names('am', limit=2), ['Am%ine', 'Amlodipine'])
+
+    def test_wildcards_are_literal(self):
+        self.assertEqual(self.names('am%'), ['Am%ine'])
+        self.assertEqual(self.names('a_'), [])
+
+    def test_prefix_followed_by_astral_character(self):
+        # Found as a prefix match, ahead of the substring match 'Co-zinc'
+        self.assertEqual(self.names('zinc', limit=1), ['Zinc\U0001F48A syrup'])
+
+    def test_blank_term(self):
+        self.assertEqual(self.names('   '), [])
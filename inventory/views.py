@@ -1,11 +1,14 @@
+from django.db import transaction
 from django.shortcuts import render, get_object_or_404, redirect
 from accounts.decorators import role_required
-from .models import Medication, MedicalSupply, Equipment
+from .models import Medication, MedicalSupply, Equipment, StockMovement, InsufficientStock
 from .forms import MedicationForm, MedicalSupplyForm, EquipmentForm
 from django.contrib import messages
-from hospitals.models import Hospital
 from django.urls import reverse
-from django.http import Http404
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from CHM.exports import date_range, stream_csv
+from CHM.pagination import paginate
+from hospitals.cache import cache_hospital_page, conditional_list
 
 
 # =======================
@@ -13,28 +16,23 @@ from django.http import Http404
 # =======================
 def get_user_hospital(request):
     """Return the hospital for the current user, Admin must provide hospital_id."""
-    if request.user.role == 'Staff':
-        return request.user.hospital
-    elif request.user.role == 'Admin':
-        hospital_id = request.GET.get('hospital_id')
-        if hospital_id:
-            return get_object_or_404(Hospital, id=hospital_id)
-    return None
+    return request.active_hospital.hospital
 
 
 # =======================
 # MEDICATION VIEWS
 # =======================
 @role_required('Admin', 'Staff')
+@conditional_list(Medication)
+@cache_hospital_page()
 def medication_list(request):
     hospital = get_user_hospital(request)
-    if hospital:
-        meds = Medication.objects.filter(hospital=hospital)
-    else:
-        meds = Medication.objects.all()
+    meds = Medication.objects.for_request(request)
+    page = paginate(request, meds, ('name', 'id'))
 
     return render(request, 'inventory/medication_list.html', {
-        'medications': meds,
+        'medications': page.object_list,
+        'page': page,
         'hospital': hospital
     })
 
@@ -74,9 +72,19 @@ def medication_update(request, pk):
             return redirect('inventory:medication_list') if request.user.role == 'Staff' else redirect(f"{reverse('inventory:medication_list')}?hospital_id={hospital.id}")
         form = MedicationForm(request.POST, instance=med)
         if form.is_valid():
-            med.save()
-            messages.success(request, "Medication updated.")
-            return redirect('inventory:medication_list') if request.user.role == 'Staff' else redirect(f"{reverse('inventory:medication_list')}?hospital_id={hospital.id}")
+            delta = form.stock_delta()
+            try:
+                with transaction.atomic():
+                    med = form.save(commit=False)
+                    # quantity only ever changes through the stock ledger
+                    med.save(update_fields=['name', 'description', 'unit', 'price', 'prescription_required', 'updated_at'])
+                    if delta:
+                        med.adjust_stock(delta, StockMovement.ADJUSTMENT, source=request.user)
+            except InsufficientStock:
+                form.add_error('quantity', "Stock changed since you opened this page and would go below zero. Please reload.")
+            else:
+                messages.success(request, "Medication updated.")
+                return redirect('inventory:medication_list') if request.user.role == 'Staff' else redirect(f"{reverse('inventory:medication_list')}?hospital_id={hospital.id}")
     else:
         form = MedicationForm(instance=med)
 
@@ -102,10 +110,13 @@ def medication_delete(request, pk):
 # MEDICAL SUPPLIES
 # =======================
 @role_required('Admin', 'Staff')
+@conditional_list(MedicalSupply)
+@cache_hospital_page()
 def supply_list(request):
     hospital = get_user_hospital(request)
-    supplies = MedicalSupply.objects.filter(hospital=hospital) if hospital else MedicalSupply.objects.all()
-    return render(request, 'inventory/supply_list.html', {'supplies': supplies, 'hospital': hospital})
+    supplies = MedicalSupply.objects.for_request(request)
+    page = paginate(request, supplies, ('name', 'id'))
+    return render(request, 'inventory/supply_list.html', {'supplies': page.object_list, 'page': page, 'hospital': hospital})
 
 
 @role_required('Admin', 'Staff')
@@ -162,10 +173,13 @@ def supply_delete(request, pk):
 # EQUIPMENT
 # =======================
 @role_required('Admin', 'Staff')
+@conditional_list(Equipment)
+@cache_hospital_page()
 def equipment_list(request):
     hospital = get_user_hospital(request)
-    equipment = Equipment.objects.filter(hospital=hospital) if hospital else Equipment.objects.all()
-    return render(request, 'inventory/equipment_list.html', {'equipment': equipment, 'hospital': hospital})
+    equipment = Equipment.objects.for_request(request)
+    page = paginate(request, equipment, ('name', 'id'))
+    return render(request, 'inventory/equipment_list.html', {'equipment': page.object_list, 'page': page, 'hospital': hospital})
 
 @role_required('Admin', 'Staff')
 def equipment_create(request):
@@ -215,3 +229,78 @@ def equipment_delete(request, pk):
         messages.success(request, "Equipment deleted.")
         return redirect('inventory:equipment_list') if request.user.role == 'Staff' else redirect(f"{reverse('inventory:equipment_list')}?hospital_id={hospital.id}")
     return render(request, 'inventory/equipment_confirm_delete.html', {'equipment': equip, 'hospital': hospital})
+
+
+# =======================
+# JSON API (polled by ward tablets)
+# =======================
+def _json_list(request, queryset, fields):
+    page = paginate(request, queryset, ('name', 'id'))
+    return JsonResponse({
+        'results': [{field: getattr(obj, field) for field in fields} for obj in page.object_list],
+        'next': page.next_url,
+        'previous': page.prev_url,
+    })
+
+
+@role_required('Admin', 'Staff')
+@conditional_list(Medication)
+def medication_api(request):
+    return _json_list(request, Medication.objects.for_request(request), (
+        'id', 'name', 'description', 'quantity', 'unit', 'price', 'prescription_required', 'hospital_id', 'updated_at',
+    ))
+
+
+@role_required('Admin', 'Staff')
+@conditional_list(MedicalSupply)
+def supply_api(request):
+    return _json_list(request, MedicalSupply.objects.for_request(request), (
+        'id', 'name', 'description', 'quantity', 'unit', 'hospital_id', 'updated_at',
+    ))
+
+
+@role_required('Admin', 'Staff')
+@conditional_list(Equipment)
+def equipment_api(request):
+    return _json_list(request, Equipment.objects.for_request(request), (
+        'id', 'name', 'description', 'quantity', 'status', 'hospital_id', 'updated_at',
+    ))
+
+
+# =======================
+# CSV EXPORTS (?start= / ?end= filter on created_at)
+# =======================
+def _export(request, model, name, header, fields):
+    try:
+        rows = model.objects.for_request(request).filter(**date_range(request.GET, 'created_at'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    scope = request.active_hospital.id or 'all'
+    return stream_csv(f'{name}-{scope}.csv', header, rows.order_by('created_at', 'id'), fields)
+
+
+@role_required('Admin', 'Staff')
+def medication_export(request):
+    return _export(request, Medication, 'medications', (
+        'ID', 'Hospital', 'Name', 'Description', 'Quantity', 'Unit', 'Price', 'Prescription required', 'Created', 'Updated',
+    ), (
+        'id', 'hospital__name', 'name', 'description', 'quantity', 'unit', 'price', 'prescription_required', 'created_at', 'updated_at',
+    ))
+
+
+@role_required('Admin', 'Staff')
+def supply_export(request):
+    return _export(request, MedicalSupply, 'supplies', (
+        'ID', 'Hospital', 'Name', 'Description', 'Quantity', 'Unit', 'Created', 'Updated',
+    ), (
+        'id', 'hospital__name', 'name', 'description', 'quantity', 'unit', 'created_at', 'updated_at',
+    ))
+
+
+@role_required('Admin', 'Staff')
+def equipment_export(request):
+    return _export(request, Equipment, 'equipment', (
+        'ID', 'Hospital', 'Name', 'Description', 'Quantity', 'Status', 'Created', 'Updated',
+    ), (
+        'id', 'hospital__name', 'name', 'description', 'quantity', 'status', 'created_at', 'updated_at',
+    ))
@@ -1,12 +1,23 @@
 # patients/forms.py
 from django import forms
 from .models import MedicalRecord, Comment, PatientProfile
+from uploads.forms import ChunkedUploadMixin
+
+class MedicalRecordForm(ChunkedUploadMixin, forms.ModelForm):
+    upload_target = 'medical_record'
 
-class MedicalRecordForm(forms.ModelForm):
     class Meta:
         model = MedicalRecord
         fields = '__all__'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Staff can only pick patients of their own hospital
+        patients = PatientProfile.objects.select_related('user')
+        if self.upload_user is not None and self.upload_user.role == 'Staff':
+            patients = patients.for_hospital(self.upload_user.hospital_id)
+        self.fields['patient'].queryset = patients
+
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
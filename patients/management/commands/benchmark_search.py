@@ -0,0 +1,109 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from hospitals.models import Hospital
+from patients import search
+from patients.models import Comment, MedicalRecord, PatientProfile
+
+WORDS = (
+    "fever cough headache nausea fatigue rash dizziness chest pain abdominal swelling "
+    "fracture sprain infection allergy asthma diabetes hypertension migraine insomnia anemia "
+    "follow-up referral prescribed observed improved stable discharged admitted reviewed scheduled"
+).split()
+RARE_WORDS = ["pneumothorax", "sarcoidosis", "pheochromocytoma"]
+QUERIES = ["fever", "chest pain", "asthma improved", "pneumothorax", "sarcoidosis referral"]
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed throwaway medical records (1M by default) and time ranked full-text "
+        "search against a plain icontains scan, scoped to one hospital like "
+        "record_list. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=1_000_000,
+                            help="Records to seed (default 1,000,000).")
+        parser.add_argument('--hospitals', type=int, default=20,
+                            help="Hospitals to spread them over (default 20).")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Runs per query; the median is reported (default 5).")
+
+    def handle(self, *args, records=1_000_000, hospitals=20, repeat=5, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            hospital_id = self._seed(records, hospitals)
+            self.stdout.write(
+                f"{connection.vendor}: seeded {records:,} records over {hospitals} hospitals "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+            self._run(hospital_id, repeat)
+            transaction.set_rollback(True)
+
+    def _seed(self, records, hospitals):
+        User = get_user_model()
+        rng = random.Random(0)
+        created = Hospital.objects.bulk_create(Hospital(name=f"Search benchmark {i}") for i in range(hospitals))
+        users = User.objects.bulk_create(
+            User(email=f"search-benchmark-{hospital.pk}@example.invalid", role='Patient', hospital=hospital, password='!')
+            for hospital in created
+        )
+        profiles = PatientProfile.objects.bulk_create(
+            PatientProfile(user=user, date_of_birth=datetime.date(1980, 1, 1), gender='other') for user in users
+        )
+        author = users[0]
+
+        def sentence(length):
+            words = rng.choices(WORDS, k=length)
+            if rng.random() < 0.001:
+                words.append(rng.choice(RARE_WORDS))
+            return ' '.join(words)
+
+        for offset in range(0, records, BATCH_SIZE):
+            batch = MedicalRecord.objects.bulk_create(
+                MedicalRecord(patient=profiles[i % len(profiles)], description=sentence(12))
+                for i in range(offset, min(offset + BATCH_SIZE, records))
+            )
+            Comment.objects.bulk_create(
+                Comment(record=record, author=author, content=sentence(8)) for record in batch[::5]
+            )
+            # bulk_create sends no signals, so index the batch directly
+            search.index_range(batch[0].pk, batch[-1].pk)
+            self.stdout.write(f"\r{offset + len(batch):,} records", ending='')
+            self.stdout.flush()
+        self.stdout.write('')
+        return created[0].pk
+
+    def _run(self, hospital_id, repeat):
+        records = MedicalRecord.objects.for_hospital(hospital_id)
+
+        def ranked(text):
+            return search.search_records(records, text, hospital_id=hospital_id)
+
+        def scan(text):
+            terms = Q()
+            for term in text.split():
+                terms &= Q(description__icontains=term) | Q(comments__content__icontains=term)
+            return list(records.filter(terms).distinct().order_by('-record_date', 'id')[:50])
+
+        self.stdout.write(f"{'query':<24}{'ranked':>12}{'icontains':>12}{'hits':>6}")
+        for text in QUERIES:
+            hits = len(ranked(text))
+            self.stdout.write(f"{text:<24}{self._time(ranked, text, repeat):>10.1f}ms"
+                              f"{self._time(scan, text, repeat):>10.1f}ms{hits:>6}")
+
+    @staticmethod
+    def _time(func, text, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(text)
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)[len(timings) // 2]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+FTS_TABLE = 'patients_medicalrecord_fts'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS patients_medicalrecord_description_fts "
+            "ON patients_medicalrecord USING GIN (to_tsvector('english', description))"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS patients_comment_content_fts "
+            "ON patients_comment USING GIN (to_tsvector('english', content))"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            "USING fts5(description, comments, tokenize='porter')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, description, comments) "
+            "SELECT r.id, r.description, COALESCE(("
+            "  SELECT group_concat(c.content, char(10)) FROM patients_comment c WHERE c.record_id = r.id"
+            "), '') FROM patients_medicalrecord r"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS patients_medicalrecord_description_fts")
+        schema_editor.execute("DROP INDEX IF EXISTS patients_comment_content_fts")
+    elif vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_rename_emergency_contact_patientprofile_emergency_contact_name_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_file_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['file'], name='record_file_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:08
+
+import os
+
+from django.db import migrations, models
+
+
+def backfill_filenames(apps, schema_editor):
+    MedicalRecord = apps.get_model('patients', 'MedicalRecord')
+    # Legacy and per-upload storage names end in the uploaded file name;
+    # dedup_files renames the stored files once the rows keep it
+    batch = []
+    for row in MedicalRecord.objects.exclude(file='').exclude(file__isnull=True).only('file').iterator(chunk_size=1000):
+        row.filename = os.path.basename(row.file.name)[:255]
+        batch.append(row)
+        if len(batch) == 1000:
+            MedicalRecord.objects.bulk_update(batch, ['filename'])
+            batch = []
+    MedicalRecord.objects.bulk_update(batch, ['filename'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_file_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='filename',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_filenames, migrations.RunPython.noop),
+    ]
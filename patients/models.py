@@ -1,6 +1,7 @@
 # patients/models.py
 from django.db import models
 from accounts.models import CustomUser
+from hospitals.scoping import HospitalScopedQuerySet
 
 from django.db import models
 from django.conf import settings
@@ -39,6 +40,9 @@ class PatientProfile(models.Model):
 
     date_created = models.DateTimeField(auto_now_add=True)
 
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'user__hospital'
+
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name} ({self.user.email})"
 
@@ -46,7 +50,20 @@ class MedicalRecord(models.Model):
     patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name='records')
     record_date = models.DateTimeField(auto_now_add=True)
     description = models.TextField()
-    file = models.FileField(upload_to='medical_records/', blank=True, null=True)
+    # Room for content-addressed blob names (uploads/blobs.py)
+    file = models.FileField(upload_to='medical_records/', max_length=500, blank=True, null=True)
+    # Name the file was uploaded as, used as the download name; the stored
+    # blob is named by content and may be shared with other hospitals
+    filename = models.CharField(max_length=255, blank=True, editable=False)
+
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'patient__user__hospital'
+
+    class Meta:
+        indexes = [
+            # media access checks and blob bookkeeping look records up by file
+            models.Index(fields=['file'], name='record_file_idx'),
+        ]
 
     def __str__(self):
         return f"Record for {self.patient.user.first_name} {self.patient.user.last_name} on {self.record_date}"
@@ -57,6 +74,9 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'record__patient__user__hospital'
+
     def __str__(self):
         return f"Comment by {self.author.first_name} {self.author.last_name}"
 
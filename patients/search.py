@@ -0,0 +1,136 @@
+# patients/search.py
+"""
+Full-text search over MedicalRecord.description and Comment.content.
+
+SQLite: an FTS5 table (one row per record: description + all comments)
+kept up to date by the signal handlers in patients/signals.py.
+PostgreSQL: GIN indexes on to_tsvector('english', ...) of both columns,
+which Postgres maintains itself.
+Other backends fall back to icontains.
+"""
+from django.db import connection
+from django.db.models import Q
+
+from accounts.models import CustomUser
+from .models import MedicalRecord, Comment, PatientProfile
+
+FTS_TABLE = 'patients_medicalrecord_fts'
+SEARCH_CONFIG = 'english'
+
+
+def uses_fts5():
+    return connection.vendor == 'sqlite'
+
+
+# =========================
+# SQLite FTS5 index maintenance
+# =========================
+def reindex_record(record_id):
+    if not uses_fts5():
+        return
+    record = MedicalRecord.objects.filter(pk=record_id).values_list('description', flat=True).first()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [record_id])
+        if record is not None:
+            comments = '\n'.join(Comment.objects.filter(record_id=record_id).values_list('content', flat=True))
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, description, comments) VALUES (%s, %s, %s)",
+                [record_id, record, comments],
+            )
+
+
+def remove_record(record_id):
+    if not uses_fts5():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [record_id])
+
+
+def index_range(first_id, last_id):
+    """Index records first_id..last_id in one statement, e.g. after a bulk_create (which sends no signals)."""
+    if not uses_fts5():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid BETWEEN %s AND %s", [first_id, last_id])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, description, comments) "
+            "SELECT r.id, r.description, COALESCE(("
+            f"  SELECT group_concat(c.content, char(10)) FROM {Comment._meta.db_table} c WHERE c.record_id = r.id"
+            f"), '') FROM {MedicalRecord._meta.db_table} r WHERE r.id BETWEEN %s AND %s",
+            [first_id, last_id],
+        )
+
+
+def _fts5_query(text):
+    # Quote every term so user input is never parsed as FTS5 syntax; terms are ANDed
+    terms = [t.replace('"', '""') for t in text.split()]
+    return ' '.join(f'"{t}"' for t in terms)
+
+
+# =========================
+# Query
+# =========================
+def _hospital_join(hospital_id, params):
+    if hospital_id is None:
+        return '', ''
+    params.append(hospital_id)
+    join = (
+        f" JOIN {MedicalRecord._meta.db_table} r ON r.id = hits.id"
+        f" JOIN {PatientProfile._meta.db_table} p ON p.id = r.patient_id"
+        f" JOIN {CustomUser._meta.db_table} u ON u.id = p.user_id"
+    )
+    return join, " WHERE u.hospital_id = %s"
+
+
+def _ranked_ids_fts5(text, hospital_id, limit):
+    params = [_fts5_query(text)]
+    inner = f"SELECT rowid AS id, bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    join, where = _hospital_join(hospital_id, params)
+    params.append(limit)
+    sql = f"SELECT hits.id FROM ({inner}) hits{join}{where} ORDER BY hits.score LIMIT %s"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _ranked_ids_postgres(text, hospital_id, limit):
+    # The to_tsvector() expressions must stay identical to the GIN indexes in the migration
+    records, comments = MedicalRecord._meta.db_table, Comment._meta.db_table
+    inner = (
+        "SELECT id, MAX(score) AS score FROM ("
+        f" SELECT id, ts_rank(to_tsvector('{SEARCH_CONFIG}', description), q) AS score"
+        f" FROM {records}, websearch_to_tsquery('{SEARCH_CONFIG}', %s) q"
+        f" WHERE to_tsvector('{SEARCH_CONFIG}', description) @@ q"
+        " UNION ALL"
+        f" SELECT record_id, ts_rank(to_tsvector('{SEARCH_CONFIG}', content), q)"
+        f" FROM {comments}, websearch_to_tsquery('{SEARCH_CONFIG}', %s) q"
+        f" WHERE to_tsvector('{SEARCH_CONFIG}', content) @@ q"
+        ") matches GROUP BY id"
+    )
+    params = [text, text]
+    join, where = _hospital_join(hospital_id, params)
+    params.append(limit)
+    sql = f"SELECT hits.id FROM ({inner}) hits{join}{where} ORDER BY hits.score DESC LIMIT %s"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_records(queryset, text, hospital_id=None, limit=50):
+    """
+    Return up to `limit` records from `queryset` matching `text`, best match
+    first. `hospital_id` scopes the index lookup itself so other hospitals'
+    matches never use up the limit.
+    """
+    text = (text or '').strip()
+    if not text:
+        return []
+    if uses_fts5():
+        ids = _ranked_ids_fts5(text, hospital_id, limit)
+    elif connection.vendor == 'postgresql':
+        ids = _ranked_ids_postgres(text, hospital_id, limit)
+    else:
+        matches = queryset.filter(Q(description__icontains=text) | Q(comments__content__icontains=text))
+        return list(matches.distinct().order_by('-record_date', 'id')[:limit])
+    found = queryset.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
@@ -0,0 +1,26 @@
+# patients/signals.py
+from django.db.models.signals import post_delete, post_save
+
+from . import search
+from .models import MedicalRecord, Comment
+
+
+def index_record(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.reindex_record(instance.pk)
+
+
+def unindex_record(sender, instance, **kwargs):
+    search.remove_record(instance.pk)
+
+
+def index_comment_record(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.reindex_record(instance.record_id)
+
+
+def connect():
+    post_save.connect(index_record, sender=MedicalRecord, dispatch_uid='search_index_record')
+    post_delete.connect(unindex_record, sender=MedicalRecord, dispatch_uid='search_unindex_record')
+    post_save.connect(index_comment_record, sender=Comment, dispatch_uid='search_index_comment')
+    post_delete.connect(index_comment_record, sender=Comment, dispatch_uid='search_unindex_comment')
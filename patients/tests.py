@@ -1,3 +1,179 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from CHM.pagination import encode_cursor, paginate
+from hospitals.models import Hospital
+from .models import Comment, MedicalRecord, PatientProfile
+from .search import search_records
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RecordQueryBudgetTests(TestCase):
+    """Record pages cost the same number of queries however many records and comments they show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='General')
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=cls.hospital)
+        cls.admin = CustomUser.objects.create_user('admin@example.com', 'pw', role='Admin')
+        cls.patient_user = CustomUser.objects.create_user('patient@example.com', 'pw', role='Patient', hospital=cls.hospital)
+        cls.profile = PatientProfile.objects.create(
+            user=cls.patient_user, date_of_birth=datetime.date(1990, 1, 1), gender='female',
+        )
+
+    def seed(self, count, comments_per_record=2):
+        for i in range(count):
+            record = MedicalRecord.objects.create(patient=self.profile, description=f'Visit {i}')
+            for j in range(comments_per_record):
+                author = self.staff if j % 2 else self.patient_user
+                Comment.objects.create(record=record, author=author, content=f'Note {j}')
+
+    def count_queries(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, user, url):
+        self.seed(2)
+        few = self.count_queries(user, url)
+        # More records than fit on a page, each with more comments
+        self.seed(40, comments_per_record=5)
+        many = self.count_queries(user, url)
+        self.assertEqual(few, many)
+        return many
+
+    def test_record_list_staff(self):
+        self.assertConstantQueries(self.staff, reverse('patients:record_list'))
+
+    def test_record_list_admin_for_hospital(self):
+        url = reverse('patients:record_list') + f'?hospital_id={self.hospital.pk}'
+        self.assertConstantQueries(self.admin, url)
+
+    def test_record_list_search(self):
+        self.assertConstantQueries(self.staff, reverse('patients:record_list') + '?q=visit')
+
+    def test_my_record(self):
+        self.assertConstantQueries(self.patient_user, reverse('patients:my_record'))
+
+    def test_patient_detail(self):
+        url = reverse('patients:patient_detail', args=[self.profile.pk])
+        self.assertConstantQueries(self.staff, url)
+
+    def test_record_list_budget(self):
+        self.seed(30, comments_per_record=3)
+        self.client.force_login(self.staff)
+        # session, user, records, comments with their authors
+        with self.assertNumQueries(4):
+            self.client.get(reverse('patients:record_list'))
+
+
+class SearchTests(TestCase):
+    """Ranked search is scoped to a hospital and follows record and comment changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital, cls.other = Hospital.objects.bulk_create([Hospital(name='General'), Hospital(name='Other')])
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=cls.hospital)
+        cls.profile = cls.make_profile('patient@example.com', cls.hospital)
+        cls.other_profile = cls.make_profile('other@example.com', cls.other)
+
+    @staticmethod
+    def make_profile(email, hospital):
+        user = CustomUser.objects.create_user(email, 'pw', role='Patient', hospital=hospital)
+        return PatientProfile.objects.create(user=user, date_of_birth=datetime.date(1990, 1, 1), gender='male')
+
+    def search(self, text):
+        return search_records(MedicalRecord.objects.all(), text, hospital_id=self.hospital.pk)
+
+    def test_scoped_to_hospital(self):
+        mine = MedicalRecord.objects.create(patient=self.profile, description='Persistent migraine')
+        MedicalRecord.objects.create(patient=self.other_profile, description='Persistent migraine')
+        self.assertEqual(self.search('migraine'), [mine])
+
+    def test_better_match_first(self):
+        weak = MedicalRecord.objects.create(patient=self.profile, description='Migraine ruled out, routine checkup after a long and uneventful week')
+        strong = MedicalRecord.objects.create(patient=self.profile, description='Migraine, migraine with aura')
+        self.assertEqual(self.search('migraine'), [strong, weak])
+
+    def test_follows_comments_and_deletes(self):
+        record = MedicalRecord.objects.create(patient=self.profile, description='Routine checkup')
+        self.assertEqual(self.search('asthma'), [])
+        comment = Comment.objects.create(record=record, author=self.staff, content='Mild asthma noted')
+        self.assertEqual(self.search('asthma'), [record])
+        comment.delete()
+        self.assertEqual(self.search('asthma'), [])
+        record.description = 'Asthma follow-up'
+        record.save()
+        self.assertEqual(self.search('asthma'), [record])
+        record.delete()
+        self.assertEqual(self.search('asthma'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        MedicalRecord.objects.create(patient=self.profile, description='Fever')
+        self.assertEqual(self.search('fever OR "NEAR('), [])
+
+
+class KeysetPaginationTests(TestCase):
+    """CHM/pagination.py over records, several of which share a record_date."""
+
+    ordering = ('-record_date', 'id')
+
+    @classmethod
+    def setUpTestData(cls):
+        hospital = Hospital.objects.create(name='General')
+        user = CustomUser.objects.create_user('patient@example.com', 'pw', role='Patient', hospital=hospital)
+        profile = PatientProfile.objects.create(user=user, date_of_birth=datetime.date(1990, 1, 1), gender='male')
+        day = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        # Dates: three rows on day 0, two on day 1, one each on days 2 and 3
+        for offset in (0, 0, 0, 1, 1, 2, 3):
+            record = MedicalRecord.objects.create(patient=profile, description='Visit')
+            MedicalRecord.objects.filter(pk=record.pk).update(record_date=day + datetime.timedelta(days=offset))
+        cls.expected = list(MedicalRecord.objects.order_by(*cls.ordering).values_list('pk', flat=True))
+
+    def page(self, query=''):
+        request = RequestFactory().get(f'/records/{query}')
+        return paginate(request, MedicalRecord.objects.all(), self.ordering, per_page=3)
+
+    def pks(self, page):
+        return [record.pk for record in page]
+
+    def test_forward_and_backward_walks(self):
+        pages = [self.page()]
+        while pages[-1].has_next():
+            pages.append(self.page(pages[-1].next_url))
+        self.assertEqual([self.pks(page) for page in pages],
+                         [self.expected[0:3], self.expected[3:6], self.expected[6:]])
+
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(self.page(back[-1].prev_url))
+        self.assertEqual([self.pks(page) for page in reversed(back)], [self.pks(page) for page in pages])
+
+    def test_boundaries(self):
+        first = self.page()
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+        last = self.page(self.page(first.next_url).next_url)
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+        # Back on the first page through its cursors, there is again no previous page
+        first_again = self.page(self.page(last.prev_url).prev_url)
+        self.assertEqual(self.pks(first_again), self.expected[:3])
+        self.assertFalse(first_again.has_previous())
+
+    def test_other_parameters_are_kept(self):
+        page = self.page('?q=visit')
+        self.assertIn('q=visit', page.next_url)
+
+    def test_bad_cursor_falls_back_to_the_first_page(self):
+        for cursor in ('not*base64', encode_cursor(['2024-01-01']), encode_cursor(['not a date', 1]), 'bnVsbA'):
+            for param in ('after', 'before'):
+                with self.subTest(cursor=cursor, param=param):
+                    self.assertEqual(self.pks(self.page(f'?{param}={cursor}')), self.expected[:3])
@@ -8,6 +8,7 @@ urlpatterns = [
     path('add/', views.record_create, name='record_create'),
     path('<int:pk>/edit/', views.record_update, name='record_update'),
     path('<int:pk>/delete/', views.record_delete, name='record_delete'),
+    path('<int:pk>/preview/', views.record_preview, name='record_preview'),
 
     path('<int:record_id>/comment/add/', views.comment_create, name='comment_create'),
     path('comment/<int:pk>/delete/', views.comment_delete, name='comment_delete'),
@@ -1,15 +1,26 @@
 from django.http import HttpResponseForbidden
+from django.db.models import Prefetch
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from .models import PatientProfile, MedicalRecord, Comment
 from .forms import MedicalRecordForm, CommentForm, PatientProfileForm
 from accounts.decorators import role_required
 from django.contrib.auth import get_user_model
-from hospitals.models import Hospital
 from django.contrib import messages
+from CHM.pagination import paginate
+from .search import search_records
+from uploads.media import prefetch_media_urls
+from uploads.previews import preview_response
 
 User = get_user_model()
 
+
+def records_with_related():
+    """MedicalRecord queryset that loads patients, users, comments and comment authors up front."""
+    return MedicalRecord.objects.select_related('patient__user').prefetch_related(
+        Prefetch('comments', queryset=Comment.objects.select_related('author').order_by('created_at'))
+    )
+
 # =========================
 # Medical Record Views
 # =========================
@@ -17,14 +28,23 @@ User = get_user_model()
 @role_required('Admin', 'Staff')
 def record_list(request, hospital_id=None):
     """Show medical records based on role."""
-    if request.user.role == 'Staff':
-        records = MedicalRecord.objects.filter(patient__user__hospital=request.user.hospital)
-    elif request.user.role == 'Admin' and hospital_id:
-        records = MedicalRecord.objects.filter(patient__user__hospital_id=hospital_id)
+    hospital_id = hospital_id or request.active_hospital.id
+    records = records_with_related().for_request(request)
+    scope = request.active_hospital.id
+
+    query = request.GET.get('q', '').strip()
+    if query:
+        # Search mode: best matches first, capped instead of paginated
+        page = None
+        results = search_records(records, query, hospital_id=scope)
     else:
-        records = MedicalRecord.objects.all()
+        page = paginate(request, records, ('-record_date', 'id'))
+        results = page.object_list
+    prefetch_media_urls(results)
     return render(request, 'patients/record_list.html', {
-        'records': records,
+        'records': results,
+        'page': page,
+        'query': query,
         'hospital_id': hospital_id if request.user.role == 'Admin' else None
     })
 
@@ -36,7 +56,7 @@ def record_create(request):
         hospital_id = request.GET.get('hospital_id')
 
     if request.method == 'POST':
-        form = MedicalRecordForm(request.POST, request.FILES)
+        form = MedicalRecordForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             record = form.save(commit=False)
             if request.user.role == 'Staff' and record.patient.user.hospital != request.user.hospital:
@@ -47,7 +67,7 @@ def record_create(request):
                 redirect_url += f"?hospital_id={hospital_id}"
             return redirect(redirect_url)
     else:
-        form = MedicalRecordForm()
+        form = MedicalRecordForm(user=request.user)
 
     return render(request, 'patients/record_form.html', {
         'form': form,
@@ -66,7 +86,7 @@ def record_update(request, pk):
         return HttpResponseForbidden("You cannot edit records for another hospital.")
 
     if request.method == 'POST':
-        form = MedicalRecordForm(request.POST, request.FILES, instance=record)
+        form = MedicalRecordForm(request.POST, request.FILES, instance=record, user=request.user)
         if form.is_valid():
             form.save()
             redirect_url = reverse('patients:record_list')
@@ -74,7 +94,7 @@ def record_update(request, pk):
                 redirect_url += f"?hospital_id={hospital_id}"
             return redirect(redirect_url)
     else:
-        form = MedicalRecordForm(instance=record)
+        form = MedicalRecordForm(instance=record, user=request.user)
 
     return render(request, 'patients/record_form.html', {
         'form': form,
@@ -82,6 +102,17 @@ def record_update(request, pk):
     })
 
 
+@role_required('Admin', 'Staff', 'Patient')
+def record_preview(request, pk):
+    """Thumbnail of a record's attachment, for the list pages."""
+    record = get_object_or_404(MedicalRecord.objects.select_related('patient__user'), pk=pk)
+    if request.user.role == 'Staff' and record.patient.user.hospital_id != request.user.hospital_id:
+        return HttpResponseForbidden("You cannot view records for another hospital.")
+    if request.user.role == 'Patient' and record.patient.user_id != request.user.pk:
+        return HttpResponseForbidden("You can only view your own records.")
+    return preview_response(record.file)
+
+
 @role_required('Admin', 'Staff')
 def record_delete(request, pk):
     record = get_object_or_404(MedicalRecord, pk=pk)
@@ -180,12 +211,14 @@ def my_record(request):
     patient_profile = PatientProfile.objects.filter(user=request.user).first()
 
     if patient_profile:
-        records = MedicalRecord.objects.filter(patient=patient_profile)
+        page = paginate(request, records_with_related().filter(patient=patient_profile), ('-record_date', 'id'))
     else:
-        records = []  # No profile means no records
+        page = paginate(request, MedicalRecord.objects.none(), ('-record_date', 'id'))  # No profile means no records
+    prefetch_media_urls(page.object_list)
 
     return render(request, 'patients/my_record.html', {
-        'records': records,
+        'records': page.object_list,
+        'page': page,
         'patient_profile': patient_profile
     })
 @role_required('Patient')
@@ -196,21 +229,13 @@ def my_profile(request):
 @role_required('Admin', 'Staff')
 def patient_list(request):
     """List patients with hospital scoping like the supply list."""
-    hospital = None
-
-    if request.user.role == 'Staff':
-        hospital = request.user.hospital
-        patients = PatientProfile.objects.filter(user__hospital=hospital)
-    elif request.user.role == 'Admin':
-        hospital_id = request.GET.get('hospital_id')
-        if hospital_id:
-            hospital = get_object_or_404(Hospital, id=hospital_id)
-            patients = PatientProfile.objects.filter(user__hospital=hospital)
-        else:
-            patients = PatientProfile.objects.all()
+    hospital = request.active_hospital.hospital
+    patients = PatientProfile.objects.for_request(request)
+    page = paginate(request, patients.select_related('user__hospital'), ('user__last_name', 'id'))
 
     return render(request, "patients/patient_list.html", {
-        'patients': patients,
+        'patients': page.object_list,
+        'page': page,
         'hospital': hospital
     })
 
@@ -218,7 +243,7 @@ def patient_list(request):
 @role_required('Admin', 'Staff')
 def patient_detail(request, pk):
     """Detailed view of a patient with hospital-aware redirects."""
-    patient = get_object_or_404(PatientProfile, pk=pk)
+    patient = get_object_or_404(PatientProfile.objects.select_related('user__hospital'), pk=pk)
     hospital = patient.user.hospital  # always derive from patient
 
     # Staff can only access patients from their own hospital
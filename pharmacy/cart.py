@@ -0,0 +1,38 @@
+# pharmacy/cart.py
+from inventory.models import Medication
+
+
+class Cart:
+    """Session-backed shopping cart: {medication_id: quantity}."""
+    SESSION_KEY = 'pharmacy_cart'
+
+    def __init__(self, request):
+        self.session = request.session
+        self.items = self.session.get(self.SESSION_KEY, {})
+
+    def add(self, medication, quantity):
+        key = str(medication.pk)
+        self.items[key] = self.items.get(key, 0) + quantity
+        self.save()
+
+    def remove(self, medication_id):
+        if self.items.pop(str(medication_id), None) is not None:
+            self.save()
+
+    def clear(self):
+        self.items = {}
+        self.save()
+
+    def save(self):
+        self.session[self.SESSION_KEY] = self.items
+        self.session.modified = True
+
+    def __len__(self):
+        return len(self.items)
+
+    def lines(self, request):
+        """(medication, quantity) pairs for the cart, in one query, dropping items no longer on sale."""
+        medications = Medication.objects.for_request(request).filter(
+            pk__in=self.items.keys(), prescription_required=False
+        ).order_by('name', 'pk')
+        return [(med, self.items[str(med.pk)]) for med in medications]
@@ -12,15 +12,35 @@ class PrescriptionForm(forms.ModelForm):
         fields = ['patient', 'medication', 'quantity', 'is_active']
         widgets = {
             'quantity': forms.NumberInput(attrs={'min': 1}),
+            # Picked through the autocomplete endpoint, so the catalog is never rendered into the page
+            'medication': forms.HiddenInput(attrs={'data-autocomplete': 'medication'}),
         }
 
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, user=None, **kwargs):
         super().__init__(*args, **kwargs)
         # Only allow patients in patient field
         self.fields['patient'].queryset = User.objects.filter(role='Patient', is_active=True)
         # Usually you only prescribe meds that require a prescription
-        self.fields['medication'].queryset = Medication.objects.filter(prescription_required=True)
+        self.fields['medication'].queryset = prescribable_medications(user)
+        if user is not None and user.role == 'Staff':
+            self.fields['patient'].queryset = self.fields['patient'].queryset.filter(hospital=user.hospital)
+
+    def medication_label(self):
+        """Name of the currently selected medication, for redisplaying the search box."""
+        pk = self['medication'].value()
+        if not pk:
+            return ''
+        med = self.fields['medication'].queryset.filter(pk=pk).only('name').first()
+        return med.name if med else ''
+
+
+def prescribable_medications(user=None):
+    """Prescription-only medications with stock, limited to the Staff user's hospital."""
+    medications = Medication.objects.filter(prescription_required=True, quantity__gt=0)
+    if user is not None and user.role == 'Staff':
+        medications = medications.for_hospital(user.hospital_id)
+    return medications
 
 
 class PurchaseForm(forms.Form):
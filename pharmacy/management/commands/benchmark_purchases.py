@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, connections, transaction
+
+from hospitals.models import Hospital
+from inventory.models import InsufficientStock, Medication
+from pharmacy.models import Purchase
+from pharmacy.views import purchase_medication
+
+
+class Command(BaseCommand):
+    help = (
+        "Run parallel buyers against one medication, first with the old "
+        "request-long select_for_update() lock, then with the conditional "
+        "stock decrement, and report purchases per second. Only meaningful on "
+        "PostgreSQL: SQLite serializes all writers either way. The seeded "
+        "hospital, patient and medication are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=50,
+                            help="Parallel buyers (default 50).")
+        parser.add_argument('--purchases', type=int, default=20,
+                            help="Purchases per buyer (default 20).")
+        parser.add_argument('--request-ms', type=float, default=5.0,
+                            help="Time the rest of the request takes (default 5ms). The old "
+                                 "view held the row lock through it.")
+
+    def handle(self, *args, buyers=50, purchases=20, request_ms=5.0, **options):
+        total = buyers * purchases
+        hospital = Hospital.objects.create(name="Purchase benchmark")
+        patient = get_user_model().objects.create_user(
+            'purchase-benchmark@example.invalid', None, role='Patient', hospital=hospital,
+        )
+        try:
+            self.stdout.write(f"{connection.vendor}, {buyers} buyers x {purchases} purchases, {request_ms:g} ms per request")
+            for label, buy in [("row lock per request", self._buy_locked), ("conditional decrement", self._buy)]:
+                medication = Medication.objects.create(
+                    name="Benchmark tablets", quantity=total, price=1, hospital=hospital,
+                )
+                self._run(label, buy, buyers, purchases, patient, medication, request_ms / 1000)
+                medication.refresh_from_db()
+                sold = Purchase.objects.filter(medication=medication).count()
+                if medication.quantity != total - sold:
+                    self.stderr.write(f"  stock is {medication.quantity}, expected {total - sold}")
+        finally:
+            hospital.delete()
+            patient.delete()
+
+    @staticmethod
+    def _buy_locked(patient, medication, work):
+        # buy_medication before: the whole request ran in one transaction
+        # holding the medication row
+        with transaction.atomic():
+            locked = Medication.objects.select_for_update().get(pk=medication.pk)
+            if locked.quantity < 1:
+                raise InsufficientStock()
+            locked.quantity -= 1
+            locked.save()
+            Purchase.objects.create(patient=patient, medication=locked, quantity=1, hospital=locked.hospital)
+            time.sleep(work)
+
+    @staticmethod
+    def _buy(patient, medication, work):
+        purchase_medication(patient, medication, 1)
+        time.sleep(work)
+
+    def _run(self, label, buy, buyers, purchases, patient, medication, work):
+        def buyer():
+            done = failed = 0
+            try:
+                for _ in range(purchases):
+                    try:
+                        buy(patient, medication, work)
+                        done += 1
+                    except (DatabaseError, InsufficientStock):
+                        failed += 1
+            finally:
+                connections.close_all()
+            return done, failed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=buyers) as pool:
+            results = list(pool.map(lambda _: buyer(), range(buyers)))
+        elapsed = time.perf_counter() - started
+        done = sum(result[0] for result in results)
+        failed = sum(result[1] for result in results)
+        self.stdout.write(
+            f"{label:<24}{done:>6} bought{failed:>6} failed{elapsed:>8.2f} s{done / elapsed:>10.1f}/s"
+        )
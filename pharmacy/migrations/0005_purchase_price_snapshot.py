@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:06
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def backfill_prices(apps, schema_editor):
+    # Best effort for existing rows: the price paid was never stored, so use the current price
+    Purchase = apps.get_model('pharmacy', 'Purchase')
+    Medication = apps.get_model('inventory', 'Medication')
+    Purchase.objects.update(
+        unit_price=Subquery(Medication.objects.filter(pk=OuterRef('medication_id')).values('price')[:1])
+    )
+    Purchase.objects.update(line_total=F('unit_price') * F('quantity'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_stockmovement'),
+        ('pharmacy', '0004_purchase_hospital'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0002_hospitalstats'),
+        ('inventory', '0006_hot_path_indexes'),
+        ('pharmacy', '0005_purchase_price_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['patient', 'is_active', 'date_prescribed'], name='prescription_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['patient', 'hospital', 'date_purchased'], name='purchase_patient_hosp_idx'),
+        ),
+    ]
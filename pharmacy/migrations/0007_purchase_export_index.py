@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0002_hospitalstats'),
+        ('inventory', '0007_conditional_get_indexes'),
+        ('pharmacy', '0006_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['hospital', 'date_purchased'], name='purchase_hosp_date_idx'),
+        ),
+    ]
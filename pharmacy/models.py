@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from inventory.models import Medication
 from hospitals.models import Hospital
+from hospitals.scoping import HospitalScopedQuerySet
 
 class Prescription(models.Model):
     patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='prescriptions')
@@ -11,6 +12,15 @@ class Prescription(models.Model):
     date_prescribed = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'medication__hospital'
+
+    class Meta:
+        indexes = [
+            # my_prescriptions / prescription lookups per patient, newest first
+            models.Index(fields=['patient', 'is_active', 'date_prescribed'], name='prescription_patient_idx'),
+        ]
+
     def __str__(self):
         return f"{self.medication.name} ({self.quantity} units) for {self.patient.email}"
 
@@ -18,8 +28,34 @@ class Purchase(models.Model):
     patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     medication = models.ForeignKey(Medication, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # Snapshot of the price paid, so history is not affected by later price changes
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     date_purchased = models.DateTimeField(auto_now_add=True)
     hospital = models.ForeignKey(Hospital, on_delete=models.SET_NULL, null=True, blank=True)
 
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'hospital'
+
+    class Meta:
+        indexes = [
+            # purchase_history: patient + hospital, newest first
+            models.Index(fields=['patient', 'hospital', 'date_purchased'], name='purchase_patient_hosp_idx'),
+            # purchase_export: hospital + date range
+            models.Index(fields=['hospital', 'date_purchased'], name='purchase_hosp_date_idx'),
+        ]
+
+    @classmethod
+    def for_medication(cls, medication, quantity, **kwargs):
+        """Unsaved Purchase with the medication's current price captured."""
+        return cls(
+            medication=medication,
+            quantity=quantity,
+            unit_price=medication.price,
+            line_total=medication.price * quantity,
+            hospital_id=medication.hospital_id,
+            **kwargs
+        )
+
     def __str__(self):
         return f"{self.medication.name} x {self.quantity} by {self.patient.email}"
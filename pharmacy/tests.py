@@ -1,3 +1,170 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from hospitals.models import Hospital
+from inventory.models import InsufficientStock, Medication, StockMovement
+from .cart import Cart
+from .models import Prescription, Purchase
+from .views import purchase_medication
+
+
+class PurchaseMedicationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='General')
+        cls.patient = CustomUser.objects.create_user('patient@example.com', 'pw', role='Patient', hospital=cls.hospital)
+
+    def setUp(self):
+        self.medication = Medication.objects.create(name='Ibuprofen', quantity=5, price=3, hospital=self.hospital)
+
+    def test_purchase_takes_stock(self):
+        purchase = purchase_medication(self.patient, self.medication, 2)
+        self.medication.refresh_from_db()
+        self.assertEqual(self.medication.quantity, 3)
+        self.assertEqual(purchase.line_total, 6)
+        self.assertTrue(StockMovement.objects.filter(kind=StockMovement.PURCHASE, delta=-2, source_id=purchase.pk).exists())
+
+    def test_insufficient_stock_leaves_nothing_behind(self):
+        with self.assertRaises(InsufficientStock):
+            purchase_medication(self.patient, self.medication, 6)
+        self.medication.refresh_from_db()
+        self.assertEqual(self.medication.quantity, 5)
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(self.medication.stock_movements.count(), 1)
+
+    def test_stale_instance_cannot_oversell(self):
+        # Another buyer emptied the shelf after this instance was loaded
+        Medication.objects.filter(pk=self.medication.pk).update(quantity=1)
+        with self.assertRaises(InsufficientStock):
+            purchase_medication(self.patient, self.medication, 2)
+        purchase_medication(self.patient, self.medication, 1)
+        self.medication.refresh_from_db()
+        self.assertEqual(self.medication.quantity, 0)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CheckoutTests(TestCase):
+    """Checkout buys the whole cart in one transaction, or nothing at all."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='General')
+        cls.patient = CustomUser.objects.create_user('patient@example.com', 'pw', role='Patient', hospital=cls.hospital)
+
+    def setUp(self):
+        self.aspirin = Medication.objects.create(name='Aspirin', quantity=5, price=2, hospital=self.hospital)
+        self.ibuprofen = Medication.objects.create(name='Ibuprofen', quantity=1, price=3, hospital=self.hospital)
+        self.client.force_login(self.patient)
+
+    def fill_cart(self, items):
+        session = self.client.session
+        session[Cart.SESSION_KEY] = {str(medication.pk): quantity for medication, quantity in items}
+        session.save()
+
+    def cart(self):
+        return self.client.session.get(Cart.SESSION_KEY)
+
+    def test_checkout_buys_every_line(self):
+        self.fill_cart([(self.aspirin, 2), (self.ibuprofen, 1)])
+        response = self.client.post(reverse('pharmacy:checkout'))
+        self.assertRedirects(response, reverse('pharmacy:purchase_history'), fetch_redirect_response=False)
+        self.assertEqual(self.cart(), {})
+        self.assertEqual(
+            sorted(Purchase.objects.values_list('medication__name', 'quantity', 'line_total')),
+            [('Aspirin', 2, 4), ('Ibuprofen', 1, 3)],
+        )
+        movements = StockMovement.objects.filter(kind=StockMovement.PURCHASE)
+        self.assertEqual(
+            sorted(movements.values_list('medication__name', 'delta')), [('Aspirin', -2), ('Ibuprofen', -1)],
+        )
+        self.assertEqual(
+            set(movements.values_list('source_id', flat=True)), set(Purchase.objects.values_list('pk', flat=True)),
+        )
+        self.aspirin.refresh_from_db()
+        self.ibuprofen.refresh_from_db()
+        self.assertEqual((self.aspirin.quantity, self.ibuprofen.quantity), (3, 0))
+
+    def test_one_short_line_rolls_back_the_order(self):
+        self.fill_cart([(self.aspirin, 2), (self.ibuprofen, 2)])
+        response = self.client.post(reverse('pharmacy:checkout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Only 1 left in stock.")
+        self.assertFalse(Purchase.objects.exists())
+        self.assertFalse(StockMovement.objects.filter(kind=StockMovement.PURCHASE).exists())
+        self.aspirin.refresh_from_db()
+        self.ibuprofen.refresh_from_db()
+        self.assertEqual((self.aspirin.quantity, self.ibuprofen.quantity), (5, 1))
+        # The cart is kept for the patient to adjust
+        self.assertEqual(len(self.cart()), 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ExportTests(TestCase):
+    """Purchase and prescription CSV exports: scoped rows, escaped formulas, 400 on a bad period."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital, cls.other = Hospital.objects.bulk_create([Hospital(name='General'), Hospital(name='Other')])
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=cls.hospital)
+        cls.patient = CustomUser.objects.create_user('patient@example.com', 'pw', role='Patient', hospital=cls.hospital)
+        cls.names = ['=HYPERLINK(A1)', '+1+2', '-3+4', '@SUM(A1)', 'Aspirin']
+        for name in cls.names:
+            medication = Medication.objects.create(name=name, price=2, quantity=10, hospital=cls.hospital)
+            Purchase.for_medication(medication, 1, patient=cls.patient).save()
+            Prescription.objects.create(patient=cls.patient, medication=medication, prescribed_by=cls.staff)
+        elsewhere = Medication.objects.create(name='Elsewhere', price=2, quantity=10, hospital=cls.other)
+        Purchase.for_medication(elsewhere, 1, patient=cls.patient).save()
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        if response.status_code != 200:
+            return response, None
+        body = b''.join(response.streaming_content).decode()
+        return response, list(csv.reader(io.StringIO(body)))
+
+    def test_purchase_export(self):
+        response, rows = self.export('pharmacy:purchase_export')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="purchases-{self.hospital.pk}.csv"')
+        self.assertEqual(
+            rows[0], ['ID', 'Date', 'Hospital', 'Patient', 'Medication', 'Quantity', 'Unit price', 'Line total'],
+        )
+        self.assertEqual(len(rows), 1 + len(self.names))
+        self.assertEqual(rows[-1][2:], ['General', 'patient@example.com', 'Aspirin', '1', '2.00', '2.00'])
+
+    def test_formulas_are_escaped(self):
+        for name in ('pharmacy:purchase_export', 'pharmacy:prescription_export'):
+            with self.subTest(name):
+                _, rows = self.export(name)
+                medications = [row[4] if name == 'pharmacy:purchase_export' else row[5] for row in rows[1:]]
+                self.assertEqual(medications, [
+                    "'=HYPERLINK(A1)", "'+1+2", "'-3+4", "'@SUM(A1)", 'Aspirin',
+                ])
+
+    def test_period(self):
+        today = timezone.localdate()
+        _, rows = self.export('pharmacy:prescription_export', start=today.isoformat(), end=today.isoformat())
+        self.assertEqual(len(rows), 1 + len(self.names))
+        tomorrow = (today + datetime.timedelta(days=1)).isoformat()
+        _, rows = self.export('pharmacy:prescription_export', start=tomorrow)
+        self.assertEqual(len(rows), 1)
+
+    def test_bad_period_is_a_bad_request(self):
+        today = timezone.localdate()
+        for params in [
+            {'start': 'not-a-date'}, {'end': '2024-02-30'}, {'start': '2024-13-01'},
+            {'start': today.isoformat(), 'end': (today - datetime.timedelta(days=1)).isoformat()},
+        ]:
+            for name in ('pharmacy:purchase_export', 'pharmacy:prescription_export', 'inventory:medication_export'):
+                with self.subTest(name, **params):
+                    response, _ = self.export(name, **params)
+                    self.assertEqual(response.status_code, 400)
@@ -6,8 +6,15 @@ app_name = 'pharmacy'
 urlpatterns = [
     path('', views.pharmacy_medication_list, name='medication_list'),
     path('prescribe/', views.prescribe_medication, name='prescribe_medication'),
+    path('medications/autocomplete/', views.medication_autocomplete, name='medication_autocomplete'),
     path('buy/<int:medication_id>/', views.buy_medication, name='buy_medication'),
     path('my-prescriptions/', views.my_prescriptions, name='my_prescriptions'),
     path('purchase-history/', views.purchase_history, name='purchase_history'),
     path('buy-from-prescription/<int:prescription_id>/', views.buy_from_prescription, name='buy_from_prescription'),
+    path('cart/', views.cart_view, name='cart'),
+    path('cart/add/<int:medication_id>/', views.cart_add, name='cart_add'),
+    path('cart/remove/<int:medication_id>/', views.cart_remove, name='cart_remove'),
+    path('cart/checkout/', views.checkout, name='checkout'),
+    path('purchases/export/', views.purchase_export, name='purchase_export'),
+    path('prescriptions/export/', views.prescription_export, name='prescription_export'),
 ]
@@ -1,13 +1,19 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import Sum
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.contrib import messages
 from django.urls import reverse
+from CHM.exports import date_range, stream_csv
+from CHM.pagination import paginate
 
 from accounts.decorators import role_required
-from inventory.models import Medication
+from hospitals.cache import cache_hospital_page, conditional_list
+from inventory.models import Medication, StockMovement, InsufficientStock
 from .models import Prescription, Purchase
-from .forms import PrescriptionForm, PurchaseForm
+from .forms import PrescriptionForm, PurchaseForm, prescribable_medications
+from .cart import Cart
 
 User = get_user_model()
 
@@ -16,23 +22,17 @@ User = get_user_model()
 # Medication list for pharmacy (all roles)
 # ==================================
 @role_required('Admin', 'Staff', 'Patient')
+@conditional_list(Medication)
+@cache_hospital_page()
 def pharmacy_medication_list(request):
     """Show OTC medications. Staff/Patient see only their hospital. Admin sees all or filtered by optional hospital."""
-    if request.user.role == "Admin":
-        medications = Medication.objects.filter(prescription_required=False).order_by('name')
-        hospital_id = request.GET.get('hospital_id')
-        hospital = get_object_or_404(Medication, id=hospital_id) if hospital_id else None
-        if hospital:
-            medications = medications.filter(hospital=hospital)
-    else:  # Staff or Patient
-        hospital = request.user.hospital
-        medications = Medication.objects.filter(
-            hospital=hospital,
-            prescription_required=False
-        ).order_by('name')
+    hospital = request.active_hospital.hospital
+    medications = Medication.objects.for_request(request).filter(prescription_required=False)
+    page = paginate(request, medications, ('name', 'id'))
 
     return render(request, 'pharmacy/medication_list.html', {
-        'medications': medications,
+        'medications': page.object_list,
+        'page': page,
         'hospital': hospital
     })
 
@@ -43,7 +43,7 @@ def pharmacy_medication_list(request):
 @role_required('Admin', 'Staff')
 def prescribe_medication(request):
     if request.method == 'POST':
-        form = PrescriptionForm(request.POST)
+        form = PrescriptionForm(request.POST, user=request.user)
         if form.is_valid():
             prescription = form.save(commit=False)
 
@@ -55,57 +55,63 @@ def prescribe_medication(request):
             prescription.save()
             return redirect('accounts:staff_dashboard')
     else:
-        form = PrescriptionForm()
-        if request.user.role == 'Staff':
-            form.fields['patient'].queryset = User.objects.filter(
-                role='Patient',
-                hospital=request.user.hospital
-            )
-            form.fields['medication'].queryset = Medication.objects.filter(
-                hospital=request.user.hospital,
-                prescription_required=True,
-                quantity__gt=0   # ✅ Only meds with stock
-            )
-        else:  # Admin
-            form.fields['medication'].queryset = Medication.objects.filter(
-                prescription_required=True,
-                quantity__gt=0   # ✅ Only meds with stock
-            )
+        form = PrescriptionForm(user=request.user)
 
     return render(request, 'pharmacy/prescription_form.html', {'form': form})
 
 
+# ==================================
+# Medication autocomplete (Staff/Admin only)
+# ==================================
+@role_required('Admin', 'Staff')
+def medication_autocomplete(request):
+    """JSON search over the prescribable catalog: ?q=<name prefix>[&hospital_id=] (Admin)."""
+    medications = prescribable_medications().for_request(request)
+    matches = Medication.autocomplete(medications.select_related('hospital'), request.GET.get('q', ''))
+    return JsonResponse({'results': [{
+        'id': med.pk,
+        'name': med.name,
+        'unit': med.unit,
+        'quantity': med.quantity,
+        'hospital': med.hospital.name if med.hospital else None,
+    } for med in matches]})
+
+
+
+def purchase_medication(patient, medication, quantity):
+    """
+    Record a purchase and take it out of stock. The stock check is the
+    conditional UPDATE inside StockMovement.record(), so the medication row
+    is only locked from that statement to the commit right after it,
+    rather than for the whole request.
+    Raises InsufficientStock if there is not enough left.
+    """
+    with transaction.atomic():
+        purchase = Purchase.for_medication(medication, quantity, patient=patient)
+        purchase.save()
+        medication.adjust_stock(-quantity, StockMovement.PURCHASE, source=purchase)
+    return purchase
+
 
 # ==================================
 # Buy Medication (Patient)
 # ==================================
 @role_required('Patient')
-@transaction.atomic
 def buy_medication(request, medication_id):
-    medication = get_object_or_404(Medication, id=medication_id, hospital=request.user.hospital)
+    medication = get_object_or_404(Medication.objects.for_request(request), id=medication_id)
 
     if request.method == 'POST':
         form = PurchaseForm(request.POST)
         if form.is_valid():
             qty = form.cleaned_data['quantity']
-            med_locked = Medication.objects.select_for_update().get(pk=medication.pk)
-
-            if med_locked.quantity < qty:
+            try:
+                purchase_medication(request.user, medication, qty)
+            except InsufficientStock:
                 return render(request, 'pharmacy/purchase_denied.html', {
                     'medication': medication,
                     'reason': "Not enough stock available."
                 })
 
-            med_locked.quantity -= qty
-            med_locked.save()
-
-            Purchase.objects.create(
-                patient=request.user,
-                medication=medication,
-                quantity=qty,
-                hospital=med_locked.hospital
-            )
-
             total_price = medication.price * qty
             messages.success(request, f"Successfully purchased {qty} x {medication.name} for ₱{total_price:.2f}.")
             return redirect('pharmacy:medication_list')
@@ -125,14 +131,15 @@ def buy_medication(request, medication_id):
 # ==================================
 @role_required('Patient')
 def my_prescriptions(request):
-    prescriptions = Prescription.objects.filter(
-        patient=request.user,
-        medication__hospital=request.user.hospital
-    ).order_by('-date_prescribed')
+    prescriptions = Prescription.objects.for_request(request).filter(
+        patient=request.user
+    ).select_related('medication')
+    page = paginate(request, prescriptions, ('-date_prescribed', 'id'))
 
-    hospital = request.user.hospital
+    hospital = request.active_hospital.hospital
     return render(request, 'pharmacy/my_prescriptions.html', {
-        'prescriptions': prescriptions,
+        'prescriptions': page.object_list,
+        'page': page,
         'hospital': hospital
     })
 
@@ -142,22 +149,15 @@ def my_prescriptions(request):
 # ==================================
 @role_required('Patient')
 def purchase_history(request):
-    purchases = Purchase.objects.filter(
-        patient=request.user,
-        hospital=request.user.hospital
-    ).order_by('-date_purchased')
-
-    purchases_with_price = [{
-        'medication': p.medication,
-        'quantity': p.quantity,
-        'price_per_unit': p.medication.price,
-        'total_price': p.quantity * p.medication.price,
-        'date_purchased': p.date_purchased
-    } for p in purchases]
-
-    hospital = request.user.hospital
+    purchases = Purchase.objects.for_request(request).filter(patient=request.user)
+    grand_total = purchases.aggregate(total=Sum('line_total'))['total'] or 0
+    page = paginate(request, purchases.select_related('medication'), ('-date_purchased', 'id'))
+
+    hospital = request.active_hospital.hospital
     return render(request, 'pharmacy/purchase_history.html', {
-        'purchases': purchases_with_price,
+        'purchases': page.object_list,
+        'page': page,
+        'grand_total': grand_total,
         'hospital': hospital
     })
 
@@ -166,45 +166,30 @@ def purchase_history(request):
 # Buy from Prescription (Patient)
 # ==================================
 @role_required('Patient')
-@transaction.atomic
 def buy_from_prescription(request, prescription_id):
-    # Lock the prescription row for update
     prescription = get_object_or_404(
-        Prescription.objects.select_for_update(),
+        Prescription.objects.for_request(request).select_related('medication'),
         id=prescription_id,
         patient=request.user,
-        is_active=True,
-        medication__hospital=request.user.hospital
+        is_active=True
     )
     medication = prescription.medication
     quantity = prescription.quantity
     total_price = medication.price * quantity
 
     if request.method == "POST":
-        # Lock medication row for update
-        med_locked = Medication.objects.select_for_update().get(pk=medication.pk)
-
-        if med_locked.quantity < quantity:
+        try:
+            with transaction.atomic():
+                # Claim the prescription; a concurrent request that already used it updates 0 rows
+                if not Prescription.objects.filter(pk=prescription.pk, is_active=True).update(is_active=False):
+                    raise Http404("Prescription has already been used.")
+                purchase_medication(request.user, medication, quantity)
+        except InsufficientStock:
             return render(request, 'pharmacy/purchase_denied.html', {
                 'medication': medication,
                 'reason': "Not enough stock available."
             })
-
-        # Update medication stock
-        med_locked.quantity -= quantity
-        med_locked.save()
-
-        # Record purchase
-        Purchase.objects.create(
-            patient=request.user,
-            medication=med_locked,
-            quantity=quantity,
-            hospital=med_locked.hospital
-        )
-
-        # Mark prescription as used
         prescription.is_active = False
-        prescription.save()
 
         # Prepare success message & redirect
         return render(request, 'pharmacy/purchase_from_prescription_confirm.html', {
@@ -219,4 +204,113 @@ def buy_from_prescription(request, prescription_id):
         'medication': medication,
         'prescription': prescription,
         'total_price': total_price
-    })
\ No newline at end of file
+    })
+
+
+# ==================================
+# Cart & checkout (Patient)
+# ==================================
+@role_required('Patient')
+def cart_add(request, medication_id):
+    medication = get_object_or_404(
+        Medication.objects.for_request(request), id=medication_id, prescription_required=False
+    )
+    if request.method == 'POST':
+        form = PurchaseForm(request.POST)
+        if form.is_valid():
+            Cart(request).add(medication, form.cleaned_data['quantity'])
+            messages.success(request, f"Added {medication.name} to your cart.")
+    return redirect('pharmacy:medication_list')
+
+
+@role_required('Patient')
+def cart_remove(request, medication_id):
+    if request.method == 'POST':
+        Cart(request).remove(medication_id)
+    return redirect('pharmacy:cart')
+
+
+def _cart_context(lines, errors=None):
+    items = [{
+        'medication': med,
+        'quantity': qty,
+        'total_price': med.price * qty,
+        'error': (errors or {}).get(med.pk),
+    } for med, qty in lines]
+    return {'items': items, 'grand_total': sum(item['total_price'] for item in items)}
+
+
+@role_required('Patient')
+def cart_view(request):
+    lines = Cart(request).lines(request)
+    return render(request, 'pharmacy/cart.html', _cart_context(lines))
+
+
+@role_required('Patient')
+def checkout(request):
+    """
+    Buy everything in the cart in one transaction: the Purchase rows and
+    ledger rows are bulk inserted and stock is decremented in medication
+    primary-key order. If any line is short, nothing is bought and each
+    failing line is reported.
+    """
+    if request.method != 'POST':
+        return redirect('pharmacy:cart')
+
+    cart = Cart(request)
+    lines = cart.lines(request)
+    if not lines:
+        messages.error(request, "Your cart is empty.")
+        return redirect('pharmacy:cart')
+
+    try:
+        with transaction.atomic():
+            purchases = Purchase.objects.bulk_create([
+                Purchase.for_medication(med, qty, patient=request.user)
+                for med, qty in lines
+            ])
+            StockMovement.record_many(
+                [(p.medication, -p.quantity, p) for p in purchases], StockMovement.PURCHASE
+            )
+    except InsufficientStock as exc:
+        available = dict(Medication.objects.filter(pk__in=exc.medication_ids).values_list('pk', 'quantity'))
+        errors = {pk: f"Only {qty} left in stock." for pk, qty in available.items()}
+        messages.error(request, "Some items do not have enough stock. Nothing was purchased.")
+        return render(request, 'pharmacy/cart.html', _cart_context(lines, errors))
+
+    cart.clear()
+    grand_total = sum(p.line_total for p in purchases)
+    messages.success(request, f"Successfully purchased {len(purchases)} item(s) for ₱{grand_total:.2f}.")
+    return redirect('pharmacy:purchase_history')
+
+
+# ==================================
+# CSV exports (Staff/Admin), ?start= / ?end= filter
+# ==================================
+@role_required('Admin', 'Staff')
+def purchase_export(request):
+    try:
+        purchases = Purchase.objects.for_request(request).filter(**date_range(request.GET, 'date_purchased'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return stream_csv(
+        f"purchases-{request.active_hospital.id or 'all'}.csv",
+        ('ID', 'Date', 'Hospital', 'Patient', 'Medication', 'Quantity', 'Unit price', 'Line total'),
+        purchases.order_by('date_purchased', 'id'),
+        ('id', 'date_purchased', 'hospital__name', 'patient__email', 'medication__name', 'quantity', 'unit_price', 'line_total'),
+    )
+
+
+@role_required('Admin', 'Staff')
+def prescription_export(request):
+    try:
+        prescriptions = Prescription.objects.for_request(request).filter(**date_range(request.GET, 'date_prescribed'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return stream_csv(
+        f"prescriptions-{request.active_hospital.id or 'all'}.csv",
+        ('ID', 'Date', 'Hospital', 'Patient', 'Prescribed by', 'Medication', 'Quantity', 'Active'),
+        prescriptions.order_by('date_prescribed', 'id'),
+        ('id', 'date_prescribed', 'medication__hospital__name', 'patient__email', 'prescribed_by__email',
+         'medication__name', 'quantity', 'is_active'),
+    )
@@ -1,4 +1,10 @@
 from django.contrib import admin
 from .models import *
 
-admin.site.register(Report)
\ No newline at end of file
+admin.site.register(Report)
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'report_type', 'hospital', 'status', 'progress', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'report_type')
+    raw_id_fields = ('report', 'requested_by')
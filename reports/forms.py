@@ -1,11 +1,37 @@
 from django import forms
-from .models import Report
+from .models import Report, ReportJob
 
 from django import forms
-from .models import Report
+from .models import Report, ReportJob
+from uploads.forms import ChunkedUploadMixin
+
+class ReportForm(ChunkedUploadMixin, forms.ModelForm):
+    upload_target = 'report'
 
-class ReportForm(forms.ModelForm):
     class Meta:
         model = Report
         exclude = ['hospital', 'generated_by']
 
+
+
+class ReportJobForm(forms.Form):
+    report_type = forms.ChoiceField(choices=ReportJob.TYPE_CHOICES)
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}),
+                            help_text="Ignored by stock levels.")
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        cleaned = super().clean()
+        start, end = cleaned.get('start'), cleaned.get('end')
+        if start and end and end < start:
+            raise forms.ValidationError("The end date must not be before the start date.")
+        return cleaned
+
+    def job_params(self):
+        """JSON-safe params; stock levels are a snapshot, so dates do not apply."""
+        if self.cleaned_data['report_type'] == ReportJob.STOCK_LEVELS:
+            return {}
+        return {
+            key: self.cleaned_data[key].isoformat()
+            for key in ('start', 'end') if self.cleaned_data.get(key)
+        }
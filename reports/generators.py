@@ -0,0 +1,184 @@
+# reports/generators.py
+"""
+Built-in report types, run by `manage.py run_report_worker`.
+
+Each builder takes a ReportJob and returns (header, rows, total): rows is
+an iterable of tuples (usually a values_list() iterator, so nothing is
+loaded into memory at once) and total its length, used for progress.
+generate() writes the rows to a CSV file, stores it as a blob
+(uploads/blobs.py) and attaches it to a new Report.
+"""
+import csv
+import io
+import itertools
+import tempfile
+import time
+import traceback
+
+from django.core.files import File
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from CHM.exports import CHUNK_SIZE, date_range
+from inventory.models import Equipment, MedicalSupply, Medication
+from patients.models import PatientProfile
+from pharmacy.models import Prescription, Purchase
+from uploads import blobs
+from .models import Report, ReportJob
+
+# Update the job's progress every this many rows, or at least this often
+# (seconds), so a slow query with few rows still keeps its heartbeat fresh
+# (ReportJob.requeue_stale)
+PROGRESS_EVERY = 1000
+HEARTBEAT_EVERY = 30
+
+
+def stock_levels(job):
+    hospital_id = job.hospital_id
+    medications = Medication.objects.for_hospital(hospital_id).order_by('name', 'id').annotate(
+        category=Value('Medication'),
+        value=ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    ).values_list('category', 'name', 'quantity', 'unit', 'price', 'value')
+    supplies = MedicalSupply.objects.for_hospital(hospital_id).order_by('name', 'id').annotate(
+        category=Value('Supply'),
+    ).values_list('category', 'name', 'quantity', 'unit')
+    equipment = Equipment.objects.for_hospital(hospital_id).order_by('name', 'id').annotate(
+        category=Value('Equipment'),
+    ).values_list('category', 'name', 'quantity', 'status')
+    total = medications.count() + supplies.count() + equipment.count()
+    rows = itertools.chain(*(qs.iterator(chunk_size=CHUNK_SIZE) for qs in (medications, supplies, equipment)))
+    return ('Category', 'Name', 'Quantity', 'Unit / status', 'Unit price', 'Stock value'), rows, total
+
+
+def sales_by_medication(job):
+    sales = (
+        Purchase.objects.for_hospital(job.hospital_id)
+        .filter(**date_range(job.params, 'date_purchased'))
+        .values('medication__name')
+        .annotate(purchases=Count('id'), units=Sum('quantity'), revenue=Sum('line_total'))
+        .order_by('-revenue', 'medication__name')
+        .values_list('medication__name', 'purchases', 'units', 'revenue')
+    )
+    return ('Medication', 'Purchases', 'Units sold', 'Revenue'), sales.iterator(chunk_size=CHUNK_SIZE), sales.count()
+
+
+def prescriptions_issued(job):
+    issued = (
+        Prescription.objects.for_hospital(job.hospital_id)
+        .filter(**date_range(job.params, 'date_prescribed'))
+        .annotate(day=TruncDate('date_prescribed'))
+        .values('day', 'medication__name')
+        .annotate(prescriptions=Count('id'), units=Sum('quantity'), active=Count('id', filter=Q(is_active=True)))
+        .order_by('day', 'medication__name')
+        .values_list('day', 'medication__name', 'prescriptions', 'units', 'active')
+    )
+    return (
+        ('Date', 'Medication', 'Prescriptions', 'Units', 'Still active'),
+        issued.iterator(chunk_size=CHUNK_SIZE),
+        issued.count(),
+    )
+
+
+AGE_BANDS = [(0, 17), (18, 39), (40, 64), (65, None)]
+
+
+def patient_census(job):
+    today = timezone.localdate()
+
+    def born_after(years):
+        # Anyone born after this date is younger than `years`
+        try:
+            return today.replace(year=today.year - years)
+        except ValueError:  # 29 February
+            return today.replace(year=today.year - years, day=28)
+
+    band = Case(*[
+        When(date_of_birth__gt=born_after(high + 1), then=Value(i))
+        for i, (low, high) in enumerate(AGE_BANDS) if high is not None
+    ], default=Value(len(AGE_BANDS) - 1), output_field=IntegerField())
+    # Without a period every patient counts as registered in it
+    joined = date_range(job.params, 'user__date_joined')
+    new = Count('id', filter=Q(**joined)) if joined else Count('id')
+    census = (
+        PatientProfile.objects.for_hospital(job.hospital_id)
+        .annotate(band=band)
+        .values('gender', 'band')
+        .annotate(patients=Count('id'), new=new)
+        .order_by('gender', 'band')
+        .values_list('gender', 'band', 'patients', 'new')
+    )
+    labels = [f"{low}+" if high is None else f"{low}-{high}" for low, high in AGE_BANDS]
+    rows = ((gender, labels[band], patients, new) for gender, band, patients, new in census.iterator(chunk_size=CHUNK_SIZE))
+    return ('Gender', 'Age', 'Patients', 'Registered in period'), rows, census.count()
+
+
+BUILDERS = {
+    ReportJob.STOCK_LEVELS: stock_levels,
+    ReportJob.SALES_BY_MEDICATION: sales_by_medication,
+    ReportJob.PRESCRIPTIONS_ISSUED: prescriptions_issued,
+    ReportJob.PATIENT_CENSUS: patient_census,
+}
+
+
+def _describe(job):
+    if job.report_type == ReportJob.STOCK_LEVELS:
+        return f"Stock on hand at {timezone.localtime():%Y-%m-%d %H:%M}. Generated automatically."
+    start, end = job.params.get('start'), job.params.get('end')
+    period = f"{start or 'beginning'} to {end or 'today'}" if start or end else 'all time'
+    return f"{job.get_report_type_display()}, {period}. Generated automatically."
+
+
+def generate(job):
+    """Build `job`'s report into a CSV file and attach it to a new Report."""
+    try:
+        header, rows, total = BUILDERS[job.report_type](job)
+        count = last_beat = 0
+
+        def beat():
+            nonlocal last_beat
+            job.set_progress(99 * count / total if total else 0)
+            last_beat = time.monotonic()
+
+        # The builders' counts ran; the rows query runs on the first row
+        beat()
+        with tempfile.TemporaryFile(mode='w+b') as out:
+            text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(header)
+            for count, row in enumerate(rows, 1):
+                writer.writerow(row)
+                if count % PROGRESS_EVERY == 0 or time.monotonic() - last_beat >= HEARTBEAT_EVERY:
+                    beat()
+            beat()
+            text.flush()
+            out.seek(0)
+            stamp = timezone.localtime().strftime('%Y%m%d-%H%M%S')
+            filename = f"{job.report_type}-{job.hospital_id}-{stamp}.csv"
+            # An unchanged report shares the file of the previous one
+            blob = blobs.store(File(out), filename)
+            text.detach()
+        report = Report(
+            hospital_id=job.hospital_id,
+            title=f"{job.get_report_type_display()} ({timezone.localdate():%Y-%m-%d})",
+            generated_by=job.requested_by,
+            description=_describe(job),
+            file=blob.name,
+            filename=filename,
+        )
+        # store() took the reference this row holds (uploads/signals.py)
+        report._acquired_file_name = blob.name
+        try:
+            report.save()
+        except Exception:
+            blobs.release(blob.name)
+            raise
+        if not job.finish(report):
+            # The job was requeued while this worker was still busy with it;
+            # deleting the row releases the file
+            report.delete()
+            return False
+        return True
+    except Exception:
+        job.fail(traceback.format_exc(limit=5))
+        raise
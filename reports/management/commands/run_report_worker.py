@@ -0,0 +1,49 @@
+import datetime
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from reports.generators import generate
+from reports.models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build queued reports (reports.ReportJob) outside the web workers. "
+        "Run one or more of these next to the web process; they coordinate "
+        "through the job table, no broker needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Exit when the queue is empty instead of polling.")
+        parser.add_argument('--poll', type=float, default=5.0,
+                            help="Seconds to wait between polls of an empty queue (default 5).")
+        parser.add_argument('--stale-after', type=int, default=10,
+                            help="Minutes without progress before a running job is requeued (default 10).")
+
+    def handle(self, *args, once=False, poll=5.0, stale_after=10, **options):
+        stale_after = datetime.timedelta(minutes=stale_after)
+        while True:
+            close_old_connections()
+            requeued = ReportJob.requeue_stale(stale_after)
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} stale job(s).")
+            job = ReportJob.claim_next()
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll)
+                continue
+            self.stdout.write(f"Building {job} (job {job.pk}, attempt {job.attempts})...")
+            try:
+                generate(job)
+            except Exception:
+                logger.exception("Report job %s failed", job.pk)
+                self.stderr.write(f"Job {job.pk} failed.")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Job {job.pk} done."))
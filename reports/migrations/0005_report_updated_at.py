@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    Report = apps.get_model('reports', 'Report')
+    Report.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0002_hospitalstats'),
+        ('reports', '0004_alter_report_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['hospital', 'updated_at'], name='report_hosp_updated_idx'),
+        ),
+    ]
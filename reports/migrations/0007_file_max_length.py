@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0006_reportjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='report',
+            name='file',
+            field=models.FileField(blank=True, max_length=500, null=True, upload_to='reports/'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:08
+
+import os
+
+from django.db import migrations, models
+
+
+def backfill_filenames(apps, schema_editor):
+    Report = apps.get_model('reports', 'Report')
+    # Legacy and per-upload storage names end in the uploaded file name;
+    # dedup_files renames the stored files once the rows keep it
+    batch = []
+    for row in Report.objects.exclude(file='').exclude(file__isnull=True).only('file').iterator(chunk_size=1000):
+        row.filename = os.path.basename(row.file.name)[:255]
+        batch.append(row)
+        if len(batch) == 1000:
+            Report.objects.bulk_update(batch, ['filename'])
+            batch = []
+    Report.objects.bulk_update(batch, ['filename'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_file_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='filename',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_filenames, migrations.RunPython.noop),
+    ]
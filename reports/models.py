@@ -1,14 +1,173 @@
 # reports/models.py
-from django.db import models
+import hashlib
+import json
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 from hospitals.models import Hospital
 from accounts.models import CustomUser
+from hospitals.scoping import HospitalScopedQuerySet
+
 class Report(models.Model):
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, null=True, blank=True)
     title = models.CharField(max_length=255)
     generated_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    file = models.FileField(upload_to='reports/', blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Room for content-addressed blob names (uploads/blobs.py)
+    file = models.FileField(upload_to='reports/', max_length=500, blank=True, null=True)
+    # Download name of the file (see MedicalRecord.filename)
+    filename = models.CharField(max_length=255, blank=True, editable=False)
     description = models.TextField(null=True, blank=True)
 
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'hospital'
+
+    class Meta:
+        indexes = [
+            # conditional GET probe: MAX(updated_at), COUNT(*) per hospital
+            models.Index(fields=['hospital', 'updated_at'], name='report_hosp_updated_idx'),
+            # media access checks and blob bookkeeping look reports up by file
+            models.Index(fields=['file'], name='report_file_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.hospital.name})"
+
+
+class ReportJob(models.Model):
+    """
+    A built-in report waiting for, or being built by, a
+    `manage.py run_report_worker` process. The table is the queue: workers
+    claim jobs with a conditional UPDATE, so no broker is needed. At most
+    one job per set of parameters can be queued or running at a time.
+    """
+    STOCK_LEVELS = 'stock_levels'
+    SALES_BY_MEDICATION = 'sales_by_medication'
+    PRESCRIPTIONS_ISSUED = 'prescriptions_issued'
+    PATIENT_CENSUS = 'patient_census'
+    TYPE_CHOICES = [
+        (STOCK_LEVELS, 'Stock levels'),
+        (SALES_BY_MEDICATION, 'Sales by medication'),
+        (PRESCRIPTIONS_ISSUED, 'Prescriptions issued'),
+        (PATIENT_CENSUS, 'Patient census'),
+    ]
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    ACTIVE = (QUEUED, RUNNING)
+    MAX_ATTEMPTS = 3
+
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, related_name='report_jobs')
+    report_type = models.CharField(max_length=30, choices=TYPE_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    dedup_key = models.CharField(max_length=64, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)  # percent
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    requested_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    report = models.OneToOneField(Report, on_delete=models.SET_NULL, null=True, blank=True, related_name='job')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched on every progress update; a running job whose heartbeat stops
+    # belonged to a worker that died and is handed to another one.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = HospitalScopedQuerySet.as_manager()
+    hospital_scope = 'hospital'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'], condition=Q(status__in=['queued', 'running']), name='reportjob_active_dedup',
+            ),
+        ]
+        indexes = [
+            # workers: oldest queued job first
+            models.Index(fields=['status', 'created_at'], name='reportjob_queue_idx'),
+        ]
+
+    @staticmethod
+    def make_dedup_key(hospital_id, report_type, params):
+        raw = json.dumps([hospital_id, report_type, params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @classmethod
+    def enqueue(cls, hospital, report_type, params, requested_by=None):
+        """
+        Queue a report, or return the job already queued or running with the
+        same parameters. Returns (job, created).
+        """
+        key = cls.make_dedup_key(hospital.pk, report_type, params)
+        for _ in range(2):
+            try:
+                with transaction.atomic():
+                    job = cls.objects.create(
+                        hospital=hospital, report_type=report_type, params=params,
+                        dedup_key=key, requested_by=requested_by,
+                    )
+                return job, True
+            except IntegrityError:
+                job = cls.objects.filter(dedup_key=key, status__in=cls.ACTIVE).first()
+                if job is not None:
+                    return job, False
+                # The other job finished between the INSERT and the lookup
+        raise IntegrityError(f"Could not queue {report_type} report.")
+
+    @classmethod
+    def claim_next(cls):
+        """Mark the oldest queued job as running and return it, or None if the queue is empty."""
+        for pk in cls.objects.filter(status=cls.QUEUED).order_by('created_at', 'id').values_list('pk', flat=True)[:10]:
+            now = timezone.now()
+            # Only one worker's UPDATE can match status=queued
+            claimed = cls.objects.filter(pk=pk, status=cls.QUEUED).update(
+                status=cls.RUNNING, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+            )
+            if claimed:
+                return cls.objects.select_related('hospital', 'requested_by').get(pk=pk)
+        return None
+
+    @classmethod
+    def requeue_stale(cls, older_than):
+        """Give running jobs whose heartbeat is older than `older_than` back to the queue."""
+        stale = cls.objects.filter(status=cls.RUNNING, heartbeat_at__lt=timezone.now() - older_than)
+        failed = stale.filter(attempts__gte=cls.MAX_ATTEMPTS).update(
+            status=cls.FAILED, error="Worker stopped responding.", finished_at=timezone.now(),
+        )
+        return stale.update(status=cls.QUEUED, progress=0) + failed
+
+    def set_progress(self, percent):
+        self.progress = max(0, min(100, int(percent)))
+        ReportJob.objects.filter(pk=self.pk).update(progress=self.progress, heartbeat_at=timezone.now())
+
+    def _close(self, **fields):
+        # Conditional on `attempts`, so a worker whose job was requeued as
+        # stale and claimed again cannot overwrite the new attempt's result.
+        fields['finished_at'] = timezone.now()
+        closed = ReportJob.objects.filter(pk=self.pk, status=self.RUNNING, attempts=self.attempts).update(**fields)
+        if closed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+        return bool(closed)
+
+    def finish(self, report):
+        """Record the finished report; False if this attempt no longer owns the job."""
+        return self._close(status=self.DONE, progress=100, report=report)
+
+    def fail(self, error):
+        return self._close(status=self.FAILED, error=error)
+
+    def __str__(self):
+        return f"{self.get_report_type_display()} for {self.hospital} ({self.status})"
@@ -1,3 +1,241 @@
-from django.test import TestCase
+import datetime
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from hospitals.models import Hospital
+from inventory.models import Medication
+from patients.models import PatientProfile
+from pharmacy.models import Prescription, Purchase
+from uploads.models import Blob
+from . import generators
+from .generators import generate
+from .models import Report, ReportJob
+
+
+class ReportJobQueueTests(TestCase):
+    """The ReportJob table as a queue: deduplicated enqueue, single claims and stale requeues."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='General')
+
+    def enqueue(self, report_type=ReportJob.STOCK_LEVELS, params=None):
+        return ReportJob.enqueue(self.hospital, report_type, params or {})
+
+    def test_enqueue_returns_the_active_job(self):
+        job, created = self.enqueue(ReportJob.SALES_BY_MEDICATION, {'start': '2024-01-01'})
+        self.assertTrue(created)
+        self.assertEqual(self.enqueue(ReportJob.SALES_BY_MEDICATION, {'start': '2024-01-01'}), (job, False))
+        ReportJob.claim_next()
+        self.assertEqual(self.enqueue(ReportJob.SALES_BY_MEDICATION, {'start': '2024-01-01'}), (job, False))
+        # Other parameters are another job
+        self.assertTrue(self.enqueue(ReportJob.SALES_BY_MEDICATION, {'start': '2024-02-01'})[1])
+
+    def test_enqueue_after_job_finished(self):
+        job, _ = self.enqueue()
+        ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.DONE)
+        again, created = self.enqueue()
+        self.assertTrue(created)
+        self.assertNotEqual(again.pk, job.pk)
+
+    def test_claim_next_claims_one_job(self):
+        first, _ = self.enqueue()
+        second, _ = self.enqueue(ReportJob.PATIENT_CENSUS)
+        claimed = ReportJob.claim_next()
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual((claimed.status, claimed.attempts), (ReportJob.RUNNING, 1))
+        self.assertIsNotNone(claimed.heartbeat_at)
+        self.assertEqual(ReportJob.objects.filter(status=ReportJob.RUNNING).count(), 1)
+        self.assertEqual(ReportJob.claim_next().pk, second.pk)
+        self.assertIsNone(ReportJob.claim_next())
+
+    def test_requeue_stale_only_takes_jobs_past_the_timeout(self):
+        stale, _ = self.enqueue()
+        fresh, _ = self.enqueue(ReportJob.PATIENT_CENSUS)
+        ReportJob.claim_next()
+        ReportJob.claim_next()
+        ReportJob.objects.filter(pk=stale.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(minutes=10))
+        ReportJob.objects.filter(pk=fresh.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(ReportJob.requeue_stale(datetime.timedelta(minutes=5)), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, ReportJob.QUEUED)
+        self.assertEqual(fresh.status, ReportJob.RUNNING)
+
+    def test_requeue_stale_fails_after_max_attempts(self):
+        job, _ = self.enqueue()
+        ReportJob.claim_next()
+        ReportJob.objects.filter(pk=job.pk).update(
+            attempts=ReportJob.MAX_ATTEMPTS, heartbeat_at=timezone.now() - datetime.timedelta(minutes=10),
+        )
+        ReportJob.requeue_stale(datetime.timedelta(minutes=5))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+
+class BuilderTests(TestCase):
+    """The period reports count only their hospital's rows within the requested dates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital, cls.other = Hospital.objects.bulk_create([Hospital(name='General'), Hospital(name='Other')])
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=cls.hospital)
+        cls.patient = CustomUser.objects.create_user('patient@example.com', 'pw', role='Patient', hospital=cls.hospital)
+        cls.aspirin = Medication.objects.create(name='Aspirin', price=2, quantity=100, hospital=cls.hospital)
+        cls.ibuprofen = Medication.objects.create(name='Ibuprofen', price=5, quantity=100, hospital=cls.hospital)
+        cls.elsewhere = Medication.objects.create(name='Aspirin', price=2, quantity=100, hospital=cls.other)
+
+    def build(self, report_type, **params):
+        job = ReportJob(hospital=self.hospital, report_type=report_type, params=params)
+        header, rows, total = generators.BUILDERS[report_type](job)
+        rows = list(rows)
+        self.assertEqual(total, len(rows))
+        return rows
+
+    def at(self, day):
+        return timezone.make_aware(datetime.datetime(2024, 3, day, 12))
+
+    def test_sales_by_medication(self):
+        for medication, quantity, day in [
+            (self.aspirin, 3, 1), (self.aspirin, 2, 5), (self.ibuprofen, 1, 3),
+            (self.aspirin, 7, 6),  # after the period
+            (self.elsewhere, 9, 2),  # another hospital
+        ]:
+            purchase = Purchase.for_medication(medication, quantity, patient=self.patient)
+            purchase.save()
+            Purchase.objects.filter(pk=purchase.pk).update(date_purchased=self.at(day))
+        self.assertEqual(self.build(ReportJob.SALES_BY_MEDICATION, start='2024-03-01', end='2024-03-05'), [
+            ('Aspirin', 2, 5, Decimal('10.00')),
+            ('Ibuprofen', 1, 1, Decimal('5.00')),
+        ])
+
+    def test_prescriptions_issued(self):
+        for medication, quantity, day, active in [
+            (self.aspirin, 1, 1, True), (self.aspirin, 2, 1, False), (self.ibuprofen, 4, 1, True),
+            (self.aspirin, 1, 2, True), (self.aspirin, 1, 9, True),
+            (self.elsewhere, 1, 1, True),
+        ]:
+            prescription = Prescription.objects.create(
+                patient=self.patient, medication=medication, prescribed_by=self.staff, quantity=quantity, is_active=active,
+            )
+            Prescription.objects.filter(pk=prescription.pk).update(date_prescribed=self.at(day))
+        self.assertEqual(self.build(ReportJob.PRESCRIPTIONS_ISSUED, start='2024-03-01', end='2024-03-02'), [
+            (datetime.date(2024, 3, 1), 'Aspirin', 2, 3, 1),
+            (datetime.date(2024, 3, 1), 'Ibuprofen', 1, 4, 1),
+            (datetime.date(2024, 3, 2), 'Aspirin', 1, 1, 1),
+        ])
+
+    def test_patient_census(self):
+        today = timezone.localdate()
+        for i, (gender, years, hospital) in enumerate([
+            ('male', 10, self.hospital), ('female', 30, self.hospital), ('male', 70, self.hospital),
+            ('female', 30, self.other),
+        ]):
+            user = CustomUser.objects.create_user(f'p{i}@example.com', 'pw', role='Patient', hospital=hospital)
+            born = today - datetime.timedelta(days=365 * years + 30)
+            PatientProfile.objects.create(user=user, date_of_birth=born, gender=gender)
+        self.assertEqual(self.build(ReportJob.PATIENT_CENSUS), [
+            ('female', '18-39', 1, 1),
+            ('male', '0-17', 1, 1),
+            ('male', '65+', 1, 1),
+        ])
+        tomorrow = (today + datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(
+            [row[3] for row in self.build(ReportJob.PATIENT_CENSUS, start=tomorrow)], [0, 0, 0],
+        )
+
+
+class GenerateReportTests(TestCase):
+    """Generated report files are blobs, shared when unchanged and deleted with their last report."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def tearDown(self):
+        # Files outlive the test's rolled back rows
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='General')
+        Medication.objects.create(name='Aspirin', price=2, quantity=10, hospital=cls.hospital)
+
+    def run_job(self):
+        ReportJob.enqueue(self.hospital, ReportJob.STOCK_LEVELS, {})
+        job = ReportJob.claim_next()
+        with self.captureOnCommitCallbacks(execute=True):
+            finished = generate(job)
+        return finished, job
+
+    def test_report_file_is_a_blob(self):
+        finished, job = self.run_job()
+        self.assertTrue(finished)
+        blob = Blob.objects.get(name=job.report.file.name)
+        self.assertEqual(blob.refcount, 1)
+        self.assertEqual(blob.name, f'blobs/{blob.sha256[:2]}/{blob.sha256}.csv')
+        self.assertTrue(job.report.filename.startswith(f'stock_levels-{self.hospital.pk}-'))
+        with job.report.file.open('rb') as stored:
+            self.assertIn(b'Aspirin', stored.read())
+
+    def test_unchanged_report_shares_the_file(self):
+        _, first = self.run_job()
+        _, second = self.run_job()
+        self.assertEqual(first.report.file.name, second.report.file.name)
+        self.assertEqual(Blob.objects.get().refcount, 2)
+        name = first.report.file.name
+        for report in Report.objects.all():
+            with self.captureOnCommitCallbacks(execute=True):
+                report.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_requeued_job_drops_its_file(self):
+        ReportJob.enqueue(self.hospital, ReportJob.STOCK_LEVELS, {})
+        job = ReportJob.claim_next()
+        # Requeued as stale and claimed again by another worker
+        ReportJob.objects.filter(pk=job.pk).update(attempts=job.attempts + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(generate(job))
+        self.assertFalse(Report.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+
+    def test_heartbeat_without_a_full_batch_of_rows(self):
+        ReportJob.enqueue(self.hospital, ReportJob.STOCK_LEVELS, {})
+        job = ReportJob.claim_next()
+        with mock.patch.object(ReportJob, 'set_progress', autospec=True) as set_progress:
+            with self.captureOnCommitCallbacks(execute=True):
+                generate(job)
+        # Before the rows are read and after the last one, although there
+        # are fewer than PROGRESS_EVERY of them
+        self.assertEqual(set_progress.call_count, 2)
+        with mock.patch.object(generators, 'HEARTBEAT_EVERY', 0), \
+                mock.patch.object(ReportJob, 'set_progress', autospec=True) as set_progress:
+            ReportJob.enqueue(self.hospital, ReportJob.STOCK_LEVELS, {})
+            with self.captureOnCommitCallbacks(execute=True):
+                generate(ReportJob.claim_next())
+        # A slow query: the one row arrives past the interval
+        self.assertEqual(set_progress.call_count, 3)
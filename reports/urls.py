@@ -6,6 +6,8 @@ app_name = 'reports'
 urlpatterns = [
     path('', views.report_list, name='report_list'),
     path('add/', views.report_create, name='report_create'),
+    path('generate/', views.report_generate, name='report_generate'),
+    path('jobs/', views.report_jobs, name='report_jobs'),
     path('<int:pk>/edit/', views.report_update, name='report_update'),
     path('<int:pk>/delete/', views.report_delete, name='report_delete'),
 ]
@@ -1,54 +1,94 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Report
-from .forms import ReportForm
+from .models import Report, ReportJob
+from .forms import ReportForm, ReportJobForm
 from accounts.decorators import role_required
 from django.contrib.auth.decorators import login_required
 from hospitals.models import Hospital
 from django.contrib import messages
+from django.http import JsonResponse
 from django.urls import reverse
+from CHM.pagination import paginate
+from hospitals.cache import conditional_list
+from uploads.media import prefetch_media_urls
 
 # =======================
 # REPORT LIST
 # =======================
 @login_required
+@conditional_list(Report)
 def report_list(request):
-    hospital = None
-
-    if request.user.role == 'Staff':
-        hospital = request.user.hospital
-        reports = Report.objects.filter(hospital=hospital)
-    elif request.user.role == 'Admin':
-        hospital_id = request.GET.get('hospital_id')
-        if hospital_id:
-            hospital = get_object_or_404(Hospital, id=hospital_id)
-            reports = Report.objects.filter(hospital=hospital)
-        else:
-            reports = Report.objects.all()
-    else:
-        reports = Report.objects.all()
+    hospital = request.active_hospital.hospital
+    reports = Report.objects.for_request(request)
+    page = paginate(request, reports, ('-created_at', 'id'))
+    prefetch_media_urls(page.object_list)
 
     return render(request, 'reports/report_list.html', {
-        'reports': reports,
+        'reports': page.object_list,
+        'page': page,
         'hospital': hospital
     })
 
 
+# =======================
+# GENERATED REPORTS (built by manage.py run_report_worker)
+# =======================
+@role_required('Admin', 'Staff')
+def report_generate(request):
+    hospital = request.active_hospital.hospital
+    if request.user.role == 'Admin' and hospital is None:
+        messages.error(request, "Hospital ID is required to generate a report.")
+        return redirect("reports:report_list")
+
+    if request.method == "POST":
+        form = ReportJobForm(request.POST)
+        if form.is_valid():
+            job, created = ReportJob.enqueue(
+                hospital, form.cleaned_data['report_type'], form.job_params(), requested_by=request.user,
+            )
+            if created:
+                messages.success(request, f"{job.get_report_type_display()} report queued.")
+            else:
+                messages.info(request, f"An identical {job.get_report_type_display()} report is already being generated.")
+
+            if request.user.role == "Admin":
+                return redirect(f"{reverse('reports:report_list')}?hospital_id={hospital.id}")
+            return redirect('reports:report_list')
+    else:
+        form = ReportJobForm()
+
+    return render(request, "reports/report_generate.html", {
+        "form": form,
+        "hospital": hospital
+    })
+
+
+@role_required('Admin', 'Staff')
+def report_jobs(request):
+    """Queued, running and recently failed report jobs, polled by the report list."""
+    jobs = ReportJob.objects.for_request(request).exclude(status=ReportJob.DONE).order_by('-created_at', '-id')[:20]
+    return JsonResponse({'jobs': [{
+        'id': job.pk,
+        'type': job.get_report_type_display(),
+        'params': job.params,
+        'status': job.status,
+        'progress': job.progress,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+        'created_at': job.created_at,
+    } for job in jobs]})
+
+
 # =======================
 # REPORT CREATE
 # =======================
 @role_required('Admin', 'Staff')
 def report_create(request):
-    if request.user.role == 'Staff':
-        hospital = request.user.hospital
-    else:  # Admin
-        hospital_id = request.GET.get("hospital_id")
-        if not hospital_id:
-            messages.error(request, "Hospital ID is required to create a report.")
-            return redirect("reports:report_list")
-        hospital = get_object_or_404(Hospital, id=hospital_id)
+    hospital = request.active_hospital.hospital
+    if request.user.role == 'Admin' and hospital is None:
+        messages.error(request, "Hospital ID is required to create a report.")
+        return redirect("reports:report_list")
 
     if request.method == "POST":
-        form = ReportForm(request.POST, request.FILES)
+        form = ReportForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             report = form.save(commit=False)
             report.hospital = hospital
@@ -60,7 +100,7 @@ def report_create(request):
                 return redirect(f"{reverse('reports:report_list')}?hospital_id={hospital.id}")
             return redirect('reports:report_list')
     else:
-        form = ReportForm()
+        form = ReportForm(user=request.user)
 
     return render(request, "reports/report_form.html", {
         "form": form,
@@ -86,7 +126,7 @@ def report_update(request, pk):
             hospital = report.hospital  # fallback
 
     if request.method == 'POST':
-        form = ReportForm(request.POST, request.FILES, instance=report)
+        form = ReportForm(request.POST, request.FILES, instance=report, user=request.user)
         if form.is_valid():
             updated_report = form.save(commit=False)
             updated_report.hospital = hospital
@@ -100,7 +140,7 @@ def report_update(request, pk):
         else:
             print(form.errors)
     else:
-        form = ReportForm(instance=report)
+        form = ReportForm(instance=report, user=request.user)
 
     return render(request, 'reports/report_form.html', {
         'form': form,
@@ -0,0 +1,254 @@
+// Chunked, resumable uploads for file inputs marked data-chunked-upload
+// (see uploads/forms.py). On submit the chosen file is sent in parts,
+// each with its SHA-256, straight to storage; the form is then posted
+// with only the upload id. An interrupted upload of the same file picks
+// up from the parts the server already has. The whole file is hashed
+// first, so content the server already stores is not sent again (see
+// uploads/views.py); the server then hashes it too, and the form waits
+// until it has.
+(function () {
+    const PARALLEL = 3;
+    const RETRIES = 3;
+    const READ_SIZE = 4 * 1024 * 1024;
+    const POLL_MS = 1000;
+
+    // SHA-256 fed in pieces: crypto.subtle can only digest a whole buffer,
+    // and a file may not fit in memory.
+    const K = new Uint32Array([
+        0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+        0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+        0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+        0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+        0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+        0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+        0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+        0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+    ]);
+
+    class Sha256 {
+        constructor() {
+            this.h = new Uint32Array([
+                0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+            ]);
+            this.w = new Uint32Array(64);
+            this.block = new Uint8Array(64);
+            this.used = 0;
+            this.length = 0;
+        }
+
+        compress(bytes, offset) {
+            const w = this.w, h = this.h;
+            for (let i = 0; i < 16; i++, offset += 4) {
+                w[i] = (bytes[offset] << 24) | (bytes[offset + 1] << 16) | (bytes[offset + 2] << 8) | bytes[offset + 3];
+            }
+            for (let i = 16; i < 64; i++) {
+                const a = w[i - 15], b = w[i - 2];
+                const s0 = ((a >>> 7) | (a << 25)) ^ ((a >>> 18) | (a << 14)) ^ (a >>> 3);
+                const s1 = ((b >>> 17) | (b << 15)) ^ ((b >>> 19) | (b << 13)) ^ (b >>> 10);
+                w[i] = (w[i - 16] + s0 + w[i - 7] + s1) | 0;
+            }
+            let [a, b, c, d, e, f, g, k] = h;
+            for (let i = 0; i < 64; i++) {
+                const s1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+                const t1 = (k + s1 + ((e & f) ^ (~e & g)) + K[i] + w[i]) | 0;
+                const s0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+                const t2 = (s0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+                k = g; g = f; f = e; e = (d + t1) | 0;
+                d = c; c = b; b = a; a = (t1 + t2) | 0;
+            }
+            h[0] += a; h[1] += b; h[2] += c; h[3] += d;
+            h[4] += e; h[5] += f; h[6] += g; h[7] += k;
+        }
+
+        update(bytes) {
+            let i = 0;
+            this.length += bytes.length;
+            if (this.used) {
+                const take = Math.min(64 - this.used, bytes.length);
+                this.block.set(bytes.subarray(0, take), this.used);
+                this.used += take;
+                i = take;
+                if (this.used < 64) {
+                    return;
+                }
+                this.compress(this.block, 0);
+                this.used = 0;
+            }
+            for (; i + 64 <= bytes.length; i += 64) {
+                this.compress(bytes, i);
+            }
+            this.block.set(bytes.subarray(i), 0);
+            this.used = bytes.length - i;
+        }
+
+        hex() {
+            const bits = this.length * 8;
+            const tail = new Uint8Array(this.used < 56 ? 64 - this.used : 128 - this.used);
+            tail[0] = 0x80;
+            const view = new DataView(tail.buffer);
+            view.setUint32(tail.length - 8, Math.floor(bits / 0x100000000));
+            view.setUint32(tail.length - 4, bits >>> 0);
+            this.update(tail);
+            return Array.from(this.h, word => word.toString(16).padStart(8, "0")).join("");
+        }
+    }
+
+    async function fileSha256(file, onProgress) {
+        const hash = new Sha256();
+        for (let start = 0; start < file.size; start += READ_SIZE) {
+            hash.update(new Uint8Array(await file.slice(start, start + READ_SIZE).arrayBuffer()));
+            onProgress(Math.min(start + READ_SIZE, file.size) / file.size);
+        }
+        return hash.hex();
+    }
+
+    // Proof of holding the file: SHA-256 of the nonce and the challenged bytes
+    async function answer(file, challenge) {
+        const nonce = new Uint8Array(challenge.nonce.match(/../g).map(byte => parseInt(byte, 16)));
+        const piece = new Uint8Array(await file.slice(challenge.start, challenge.start + challenge.length).arrayBuffer());
+        const data = new Uint8Array(nonce.length + piece.length);
+        data.set(nonce);
+        data.set(piece, nonce.length);
+        const digest = await crypto.subtle.digest("SHA-256", data);
+        return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, "0")).join("");
+    }
+
+    function csrfToken(form) {
+        const input = form.querySelector("input[name=csrfmiddlewaretoken]");
+        return input ? input.value : "";
+    }
+
+    async function sha256(blob) {
+        const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+        return btoa(String.fromCharCode(...new Uint8Array(digest)));
+    }
+
+    async function call(url, token, method, fields) {
+        const options = {method: method, headers: {"X-CSRFToken": token}, credentials: "same-origin"};
+        if (fields) {
+            options.body = new FormData();
+            Object.entries(fields).forEach(([key, value]) => options.body.append(key, value));
+        }
+        const response = await fetch(url, options);
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw new Error(data.error || `Upload failed (${response.status})`);
+        }
+        return data;
+    }
+
+    async function sendPart(base, session, file, number, token) {
+        const start = (number - 1) * session.chunk_size;
+        const blob = file.slice(start, start + session.chunk_size);
+        const checksum = await sha256(blob);
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const target = await call(`${base}${session.id}/parts/${number}/`, token, "POST", {checksum: checksum});
+                const headers = Object.assign({}, target.headers);
+                // Same-origin targets (the local backend) need the CSRF token
+                if (target.url.startsWith("/")) {
+                    headers["X-CSRFToken"] = token;
+                }
+                const response = await fetch(target.url, {method: target.method, headers: headers, body: blob});
+                if (!response.ok) {
+                    throw new Error(`Part ${number} failed (${response.status})`);
+                }
+                return;
+            } catch (error) {
+                if (attempt >= RETRIES) {
+                    throw error;
+                }
+            }
+        }
+    }
+
+    async function upload(input, token, onProgress, onHashing) {
+        const file = input.files[0];
+        const startUrl = input.dataset.chunkedUpload;
+        const base = startUrl.replace(/start\/$/, "");
+        const target = input.dataset.uploadTarget;
+        const resumeKey = `chunked-upload:${target}:${file.name}:${file.size}:${file.lastModified}`;
+
+        let session = null;
+        const previous = localStorage.getItem(resumeKey);
+        if (previous) {
+            session = await call(`${base}${previous}/`, token, "GET").catch(() => null);
+            if (session && !["uploading", "hashing", "complete"].includes(session.status)) {
+                session = null;
+            }
+        }
+        if (!session) {
+            session = await call(startUrl, token, "POST", {
+                target: target, filename: file.name, size: file.size, content_type: file.type,
+                sha256: await fileSha256(file, onHashing),
+            });
+            localStorage.setItem(resumeKey, session.id);
+            if (session.challenge) {
+                // Already stored; a refused proof just means uploading it
+                const proof = await answer(file, session.challenge);
+                session = await call(`${base}${session.id}/prove/`, token, "POST", {proof: proof})
+                    .catch(() => session);
+            }
+        }
+
+        if (session.status === "uploading") {
+            const received = new Set(session.parts);
+            const pending = [];
+            for (let n = 1; n <= session.part_count; n++) {
+                if (!received.has(n)) {
+                    pending.push(n);
+                }
+            }
+            let done = received.size;
+            onProgress(done / session.part_count);
+            const worker = async () => {
+                while (pending.length) {
+                    await sendPart(base, session, file, pending.shift(), token);
+                    onProgress(++done / session.part_count);
+                }
+            };
+            await Promise.all(Array.from({length: PARALLEL}, worker));
+            session = await call(`${base}${session.id}/complete/`, token, "POST", {});
+        }
+        while (session.status === "hashing") {
+            onHashing(null);
+            await new Promise(resolve => setTimeout(resolve, POLL_MS));
+            session = await call(`${base}${session.id}/`, token, "GET");
+        }
+        if (session.status !== "complete") {
+            throw new Error("The upload could not be completed");
+        }
+        localStorage.removeItem(resumeKey);
+        return session.id;
+    }
+
+    document.querySelectorAll("input[type=file][data-chunked-upload]").forEach(input => {
+        const form = input.form;
+        const progress = document.createElement("div");
+        progress.className = "form-text";
+        input.after(progress);
+
+        form.addEventListener("submit", async event => {
+            if (!input.files.length || !window.crypto || !crypto.subtle) {
+                return;  // nothing to upload, or fall back to a plain file post
+            }
+            event.preventDefault();
+            const buttons = form.querySelectorAll("button[type=submit]");
+            buttons.forEach(button => button.disabled = true);
+            try {
+                const id = await upload(input, csrfToken(form), share => {
+                    progress.textContent = `Uploading… ${Math.floor(share * 100)}%`;
+                }, share => {
+                    progress.textContent = share === null ? "Checking the file…" : `Reading… ${Math.floor(share * 100)}%`;
+                });
+                form.querySelector("input[name=upload_id]").value = id;
+                input.value = "";
+                progress.textContent = "Upload complete.";
+                form.submit();
+            } catch (error) {
+                progress.textContent = `${error.message}. Submit again to resume.`;
+                buttons.forEach(button => button.disabled = false);
+            }
+        });
+    });
+})();
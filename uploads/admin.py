@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import Blob, UploadSession
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'filename', 'target', 'user', 'size', 'backend', 'status', 'created_at')
+    list_filter = ('status', 'target', 'backend')
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'refcount', 'created_at')
+    search_fields = ('sha256', 'name')
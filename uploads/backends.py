@@ -0,0 +1,314 @@
+# uploads/backends.py
+"""
+Where the parts of a chunked upload go.
+
+S3Backend   - an S3 multipart upload. The browser PUTs each part straight
+              to S3 through a presigned URL; S3 checks the part against the
+              SHA-256 it was signed with, and completion stitches the parts
+              together without the bytes ever reaching Django. The bucket
+              needs a CORS rule allowing PUT with the x-amz-checksum-sha256
+              header from the site's origin.
+LocalBackend - the stand-in for development and tests. Parts are PUT to
+              uploads:part_data, streamed to CHUNKED_UPLOAD_TEMP_DIR in
+              small reads and checked against X-Chunk-Sha256; the parts
+              are assembled on disk and stored as a blob. Every web and
+              upload worker must see the same temp dir.
+
+Checksums are base64 SHA-256 digests of a part's bytes, the encoding S3
+uses for x-amz-checksum-sha256.
+
+complete() only checks the parts and joins them where that is cheap (S3
+does it server-side), then the session waits in HASHING. Reading the
+whole file to hash it is left to `manage.py run_upload_worker`
+(claim_next() and hash_upload() below), which turns it into a blob, so
+no web request ever reads a file back. A completed upload holds one
+reference on its uploads.models.Blob until it is attached or cleaned up.
+"""
+import base64
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from storages.utils import clean_name
+
+from . import blobs
+from .models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+# S3 limits: parts other than the last must be at least 5 MiB, and an
+# upload can have at most 10,000 parts.
+MIN_CHUNK_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+READ_SIZE = 64 * 1024
+# Lifetime of a presigned part URL
+PRESIGNED_EXPIRES = 60 * 60
+
+
+class UploadError(Exception):
+    """The upload cannot go on as requested; the message is shown to the client."""
+
+
+def chunk_size_for(size):
+    """Part size for a file of `size` bytes: the configured size, grown to stay within MAX_PARTS."""
+    chunk = max(settings.CHUNKED_UPLOAD_CHUNK_SIZE, MIN_CHUNK_SIZE, -(-size // MAX_PARTS))
+    mib = 1024 * 1024
+    return -(-chunk // mib) * mib
+
+
+def _check_checksum(checksum):
+    try:
+        if len(base64.b64decode(checksum, validate=True)) == hashlib.sha256().digest_size:
+            return checksum
+    except ValueError:
+        pass
+    raise UploadError("Checksum must be a base64 SHA-256 digest.")
+
+
+class S3Backend:
+    name = 's3'
+
+    def __init__(self, storage=default_storage):
+        self.storage = storage
+
+    @property
+    def client(self):
+        return self.storage.bucket.meta.client
+
+    def _params(self, session):
+        return {
+            'Bucket': self.storage.bucket_name,
+            'Key': self.storage._normalize_name(clean_name(session.key)),
+            'UploadId': session.multipart_id,
+        }
+
+    def start(self, session):
+        params = self._params(session)
+        del params['UploadId']
+        response = self.client.create_multipart_upload(
+            ContentType=session.content_type or 'application/octet-stream',
+            ChecksumAlgorithm='SHA256',
+            **params,
+        )
+        session.multipart_id = response['UploadId']
+
+    def part_target(self, session, number, checksum):
+        checksum = _check_checksum(checksum)
+        url = self.client.generate_presigned_url('upload_part', Params={
+            **self._params(session),
+            'PartNumber': number,
+            'ChecksumSHA256': checksum,
+        }, ExpiresIn=PRESIGNED_EXPIRES)
+        return {'method': 'PUT', 'url': url, 'headers': {'x-amz-checksum-sha256': checksum}}
+
+    def _list_parts(self, session):
+        parts, marker = [], 0
+        while True:
+            page = self.client.list_parts(PartNumberMarker=marker, **self._params(session))
+            parts.extend(page.get('Parts', []))
+            if not page.get('IsTruncated'):
+                return parts
+            marker = page['NextPartNumberMarker']
+
+    def received_parts(self, session):
+        return {part['PartNumber']: part['Size'] for part in self._list_parts(session)}
+
+    def complete(self, session):
+        parts = self._list_parts(session)
+        _check_parts(session, {part['PartNumber']: part['Size'] for part in parts})
+        self.client.complete_multipart_upload(MultipartUpload={'Parts': [
+            {'PartNumber': part['PartNumber'], 'ETag': part['ETag'], 'ChecksumSHA256': part['ChecksumSHA256']}
+            for part in parts
+        ]}, **self._params(session))
+
+    def finish(self, session):
+        # S3 only has per-part digests for a multipart object, so the whole
+        # file is hashed by streaming it back once. It is then copied to its
+        # content name within S3, unless that content is stored already.
+        params = self._params(session)
+        del params['UploadId']
+        body = self.client.get_object(**params)['Body']
+        digest, size = hashlib.sha256(), 0
+        for chunk in body.iter_chunks(READ_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+        sha256 = digest.hexdigest()
+        blob = blobs.acquire_existing(sha256)
+        if blob is None:
+            name = blobs.blob_name(sha256, session.filename)
+            self.client.copy(
+                {'Bucket': params['Bucket'], 'Key': params['Key']},
+                params['Bucket'], self.storage._normalize_name(clean_name(name)),
+            )
+            blob = blobs.adopt(name, sha256, size)
+        self.storage.delete(session.key)
+        return blob
+
+    def abort(self, session):
+        if session.multipart_id:
+            self.client.abort_multipart_upload(**self._params(session))
+
+    def discard(self, session):
+        self.storage.delete(session.key)
+
+
+class LocalBackend:
+    name = 'local'
+
+    def __init__(self, storage=default_storage):
+        self.storage = storage
+
+    def _dir(self, session):
+        return os.path.join(settings.CHUNKED_UPLOAD_TEMP_DIR, str(session.pk))
+
+    def _part_path(self, session, number):
+        return os.path.join(self._dir(session), f'{number}.part')
+
+    def start(self, session):
+        os.makedirs(self._dir(session), exist_ok=True)
+
+    def part_target(self, session, number, checksum):
+        checksum = _check_checksum(checksum)
+        url = reverse('uploads:part_data', args=[session.pk, number])
+        return {'method': 'PUT', 'url': url, 'headers': {'X-Chunk-Sha256': checksum}}
+
+    def write_part(self, session, number, stream, checksum):
+        """
+        Stream one part from `stream` to disk, READ_SIZE bytes at a time,
+        and keep it only if its size and SHA-256 match.
+        """
+        checksum = _check_checksum(checksum)
+        expected = session.part_size(number)
+        path = self._part_path(session, number)
+        partial = f'{path}.{os.getpid()}.tmp'
+        digest, written = hashlib.sha256(), 0
+        try:
+            with open(partial, 'wb') as out:
+                while written <= expected:
+                    block = stream.read(READ_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    out.write(block)
+                    written += len(block)
+            if written != expected:
+                raise UploadError(f"Part {number} should be {expected} bytes, got {written}.")
+            if base64.b64encode(digest.digest()).decode() != checksum:
+                raise UploadError(f"Part {number} does not match its checksum.")
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def received_parts(self, session):
+        try:
+            names = os.listdir(self._dir(session))
+        except FileNotFoundError:
+            return {}
+        return {
+            int(name[:-len('.part')]): os.path.getsize(os.path.join(self._dir(session), name))
+            for name in names if name.endswith('.part')
+        }
+
+    def complete(self, session):
+        _check_parts(session, self.received_parts(session))
+
+    def finish(self, session):
+        # Each worker assembles into a file of its own, so a worker taking
+        # over a stale claim cannot interleave writes with the first one;
+        # the hash is of exactly the bytes that get stored.
+        assembled = os.path.join(self._dir(session), f'assembled.{os.getpid()}.{uuid.uuid4().hex}.tmp')
+        digest, written = hashlib.sha256(), 0
+        try:
+            with open(assembled, 'wb') as out:
+                for number in range(1, session.part_count + 1):
+                    with open(self._part_path(session, number), 'rb') as part:
+                        while block := part.read(READ_SIZE):
+                            digest.update(block)
+                            out.write(block)
+                            written += len(block)
+            if written != session.size:
+                raise UploadError(f"Assembled {written} bytes, expected {session.size}.")
+            # Content already stored is not written again; otherwise the
+            # assembled file is moved into storage
+            with open(assembled, 'rb') as content:
+                blob = blobs.store(_AssembledFile(content, name=session.filename), session.filename, digest.hexdigest())
+        finally:
+            if os.path.exists(assembled):
+                os.remove(assembled)
+        shutil.rmtree(self._dir(session), ignore_errors=True)
+        return blob
+
+    def abort(self, session):
+        shutil.rmtree(self._dir(session), ignore_errors=True)
+
+    discard = abort
+
+
+class _AssembledFile(File):
+    # Lets FileSystemStorage move the assembled file instead of copying it
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _check_parts(session, received):
+    missing = [n for n in range(1, session.part_count + 1) if received.get(n) != session.part_size(n)]
+    if missing or len(received) != session.part_count:
+        raise UploadError(f"Parts missing or incomplete: {missing[:20]}")
+
+
+BACKENDS = {backend.name: backend for backend in (S3Backend, LocalBackend)}
+
+
+def get_backend(name=None):
+    return BACKENDS[name or settings.CHUNKED_UPLOAD_BACKEND]()
+
+
+# =========================
+# Hashing (run_upload_worker)
+# =========================
+
+def claim_next(stale_after):
+    """
+    Take the oldest session waiting in HASHING and return it, or None.
+    A session claimed more than `stale_after` ago lost its worker and is
+    taken again.
+    """
+    now = timezone.now()
+    waiting = UploadSession.objects.filter(
+        Q(hashing_started_at__isnull=True) | Q(hashing_started_at__lt=now - stale_after),
+        status=UploadSession.HASHING,
+    )
+    for pk in waiting.order_by('created_at').values_list('pk', flat=True)[:10]:
+        if waiting.filter(pk=pk).update(hashing_started_at=now):
+            return UploadSession.objects.get(pk=pk)
+    return None
+
+
+def hash_upload(session):
+    """
+    Hash a claimed session's file into its blob and mark the session
+    complete. Returns the new status, or None when it failed and will be
+    retried once the claim goes stale.
+    """
+    try:
+        blob = get_backend(session.backend).finish(session)
+    except Exception:
+        logger.exception("Could not hash upload %s", session.pk)
+        return None
+    # The first worker to finish wins, if a stale claim was taken over
+    finished = UploadSession.objects.filter(pk=session.pk, status=UploadSession.HASHING).update(
+        status=UploadSession.COMPLETE, key=blob.name, sha256=blob.sha256,
+    )
+    if not finished:
+        blobs.release(blob.name)
+        return None
+    return UploadSession.COMPLETE
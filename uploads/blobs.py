@@ -0,0 +1,167 @@
+# uploads/blobs.py
+"""
+Content-addressed storage for record and report files.
+
+Files are stored once per distinct content under
+blobs/<sha[:2]>/<sha><ext>, and each Blob counts the rows and finished
+uploads that use it. The name a file was uploaded as stays on the row
+(`filename`) and is only sent as the download name, so rows sharing a
+blob never see each other's file names. Uploads are hashed as they stream in (see
+uploads/handlers.py and the chunked upload backends), so when the same
+bytes are already stored the upload takes another reference instead of
+writing the file again. release() deletes the file when the last
+reference goes.
+
+Chunked uploads announce the file's hash before sending it. When that
+content is stored already, the client is challenged to hash a random
+range of it (make_challenge(), acquire_proven()) and, if it can, the
+upload finishes without a byte being sent. Knowing a hash is not enough
+to get a reference to someone else's file.
+"""
+import hashlib
+import hmac
+import secrets
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from storages.utils import clean_name
+
+from .models import Blob, storage_extension
+from .previews import preview_name
+
+READ_SIZE = 64 * 1024
+CHALLENGE_SIZE = 64 * 1024
+
+
+def blob_name(sha256, filename):
+    """Storage name for content `sha256`; only the extension of `filename` is kept."""
+    return f"blobs/{sha256[:2]}/{sha256}{storage_extension(filename)}"
+
+
+def hash_file(content):
+    """(hex SHA-256, size) of a File, read in chunks; leaves it rewound."""
+    digest, size = hashlib.sha256(), 0
+    for chunk in content.chunks(READ_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    content.seek(0)
+    return digest.hexdigest(), size
+
+
+def acquire_existing(sha256):
+    """Take a reference on the blob with this hash, if there is one."""
+    if Blob.objects.filter(sha256=sha256).update(refcount=F('refcount') + 1):
+        # Referenced now, so release() elsewhere cannot collect it
+        return Blob.objects.get(sha256=sha256)
+    return None
+
+
+def adopt(name, sha256, size):
+    """
+    Register the file already at `name` as the blob for `sha256`, with
+    one reference. If that content is already stored under another name,
+    the copy at `name` is deleted and the existing blob is used.
+    """
+    while True:
+        existing = acquire_existing(sha256)
+        if existing:
+            if existing.name != name:
+                default_storage.delete(name)
+            return existing
+        try:
+            with transaction.atomic():
+                return Blob.objects.create(sha256=sha256, name=name, size=size, refcount=1)
+        except IntegrityError:
+            continue  # stored concurrently; take a reference on that one
+
+
+def store(content, filename, sha256=None):
+    """
+    Blob holding `content` (a File), with one reference for the caller.
+    Nothing is written to storage when the same content is already there.
+    `sha256` may be passed when the content was hashed on the way in.
+    """
+    if sha256 is None:
+        sha256, size = hash_file(content)
+    else:
+        size = content.size
+    existing = acquire_existing(sha256)
+    if existing:
+        return existing
+    name = default_storage.save(blob_name(sha256, filename), content)
+    return adopt(name, sha256, size)
+
+
+def read_range(name, start, length):
+    """`length` bytes of the stored file `name` from offset `start`, without reading the rest."""
+    if hasattr(default_storage, 'bucket'):
+        # S3 storage would download the whole object on the first read()
+        key = default_storage._normalize_name(clean_name(name))
+        response = default_storage.bucket.Object(key).get(Range=f'bytes={start}-{start + length - 1}')
+        return response['Body'].read()
+    with default_storage.open(name, 'rb') as stored:
+        stored.seek(start)
+        return stored.read(length)
+
+
+def make_challenge(size):
+    """A random range of a `size`-byte file for an uploader to hash, with a nonce against replays."""
+    length = min(size, CHALLENGE_SIZE)
+    return {'start': secrets.randbelow(size - length + 1), 'length': length, 'nonce': secrets.token_hex(16)}
+
+
+def acquire_proven(sha256, size, challenge, proof):
+    """
+    Take a reference on the stored blob with this content if `proof` is the
+    hex SHA-256 of the challenge nonce followed by the challenged range of
+    the file, which only someone holding the file can compute. None otherwise.
+    """
+    blob = Blob.objects.filter(sha256=sha256, size=size).first()
+    if blob is None:
+        return None
+    data = read_range(blob.name, challenge['start'], challenge['length'])
+    expected = hashlib.sha256(bytes.fromhex(challenge['nonce']) + data).hexdigest()
+    if not hmac.compare_digest(expected, proof.strip().lower()):
+        return None
+    return acquire_existing(sha256)
+
+
+def acquire(name):
+    return bool(name) and bool(Blob.objects.filter(name=name).update(refcount=F('refcount') + 1))
+
+
+def release(name):
+    """Drop a reference to `name`; False when it is not a blob."""
+    if not name or not Blob.objects.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1):
+        return False
+    transaction.on_commit(lambda: _collect(name))
+    return True
+
+
+def _collect(name):
+    # The row lock keeps acquire_existing() from reviving the blob while
+    # its file is being deleted.
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(name=name, refcount=0).first()
+        if blob is None:
+            return
+        default_storage.delete(name)
+        if blob.preview_state == Blob.PREVIEW_READY:
+            default_storage.delete(preview_name(blob.sha256))
+        blob.delete()
+
+
+def stats():
+    """Blob count and bytes stored versus bytes that would be stored without sharing."""
+    totals = Blob.objects.aggregate(
+        stored=Sum('size'), logical=Sum(F('size') * F('refcount')), references=Sum('refcount'),
+    )
+    stored, logical = totals['stored'] or 0, totals['logical'] or 0
+    return {
+        'blobs': Blob.objects.count(),
+        'references': totals['references'] or 0,
+        'stored_bytes': stored,
+        'logical_bytes': logical,
+        'saved_bytes': max(logical - stored, 0),
+    }
@@ -0,0 +1,64 @@
+# uploads/forms.py
+from django import forms
+from django.urls import reverse
+
+from .models import UploadSession
+
+
+class ChunkedUploadMixin(forms.Form):
+    """
+    Lets a ModelForm take its file from a completed chunked upload instead
+    of from the request body. js/chunked_upload.js uploads the chosen file,
+    fills in `upload_id` and clears the file input before submitting, so
+    the form post itself carries no file. A plain file upload still works
+    when JavaScript is off.
+
+    Subclasses set `upload_target` (a key of uploads.models.TARGETS) and
+    are built with user=request.user, who must own the upload.
+    """
+    upload_target = None
+    upload_field = 'file'
+
+    upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, user=None, **kwargs):
+        self.upload_user = user
+        super().__init__(*args, **kwargs)
+        self.fields[self.upload_field].widget.attrs.update({
+            'data-chunked-upload': reverse('uploads:start'),
+            'data-upload-target': self.upload_target,
+        })
+
+    def clean_upload_id(self):
+        upload_id = self.cleaned_data.get('upload_id')
+        if not upload_id:
+            return None
+        session = UploadSession.objects.filter(
+            pk=upload_id, user=self.upload_user, target=self.upload_target,
+            status__in=[UploadSession.HASHING, UploadSession.COMPLETE],
+        ).first()
+        if session is not None and session.status == UploadSession.HASHING:
+            raise forms.ValidationError("The uploaded file is still being checked. Please submit again in a moment.")
+        if session is None:
+            raise forms.ValidationError("The uploaded file could not be found. Please choose it again.")
+        return session
+
+    def clean(self):
+        cleaned_data = super().clean()
+        session = cleaned_data.get('upload_id')
+        if session:
+            # Already in storage: the model field just takes its name
+            cleaned_data[self.upload_field] = session.key
+        return cleaned_data
+
+    def save(self, commit=True):
+        session = self.cleaned_data.get('upload_id')
+        if session:
+            # The finished upload's blob reference passes to the row once the
+            # row is saved, which also marks the upload attached
+            # (uploads/signals.py); until then it stays COMPLETE, so an
+            # instance that is never saved does not strand the reference.
+            self.instance._acquired_file_name = session.key
+            self.instance._attached_upload_id = session.pk
+            self.instance.filename = session.filename
+        return super().save(commit=commit)
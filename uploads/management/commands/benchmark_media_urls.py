@@ -0,0 +1,44 @@
+import time
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from uploads.media import media_urls, url_cache_key, url_cache_timeout
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the storage URLs for one list page: FieldFile.url per row "
+        "against uploads.media.media_urls() with a cold and a warm cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500,
+                            help="Files on the simulated page (default 500).")
+
+    def handle(self, *args, rows=500, **options):
+        files = [(f"blobs/bm/benchmark-{i}.pdf", f"scan-{i}.pdf") for i in range(rows)]
+        signed = getattr(default_storage, 'querystring_auth', False) and not getattr(default_storage, 'custom_domain', None)
+        self.stdout.write(
+            f"{default_storage.__class__.__name__}, signed URLs: {'yes' if signed else 'no'}, "
+            f"cache TTL {url_cache_timeout()}s, {rows} rows"
+        )
+
+        started = time.perf_counter()
+        for name, _ in files:
+            default_storage.url(name)
+        self._report("per-row .url", started)
+
+        started = time.perf_counter()
+        media_urls(files)
+        self._report("media_urls, cold", started)
+
+        started = time.perf_counter()
+        media_urls(files)
+        self._report("media_urls, warm", started)
+
+        cache.delete_many([url_cache_key(*file) for file in files])
+
+    def _report(self, label, started):
+        self.stdout.write(f"{label:<20}{(time.perf_counter() - started) * 1000:>10.1f} ms")
@@ -0,0 +1,49 @@
+import datetime
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from uploads import blobs
+from uploads.backends import get_backend
+from uploads.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = (
+        "Abort chunked uploads that were never finished and delete files that "
+        "were uploaded but never attached to a record or report, so abandoned "
+        "parts do not pile up in storage. Run it daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help="Age in hours after which an unattached upload is stale (default 24).")
+
+    def handle(self, *args, hours=24, **options):
+        cutoff = timezone.now() - datetime.timedelta(hours=hours)
+        unfinished = [UploadSession.UPLOADING, UploadSession.COMPLETING]
+        stale = UploadSession.objects.filter(
+            status__in=[*unfinished, UploadSession.HASHING, UploadSession.COMPLETE], created_at__lt=cutoff,
+        )
+        aborted = deleted = 0
+        for session in stale.iterator():
+            if session.status in unfinished:
+                get_backend(session.backend).abort(session)
+                aborted += 1
+            elif session.status == UploadSession.HASHING:
+                # Joined but never hashed into a blob, so nothing references it
+                get_backend(session.backend).discard(session)
+                aborted += 1
+            else:
+                # Finished uploads hold a blob reference; older ones own their file
+                if not blobs.release(session.key):
+                    default_storage.delete(session.key)
+                deleted += 1
+        UploadSession.objects.filter(
+            status__in=[*unfinished, UploadSession.HASHING, UploadSession.COMPLETE, UploadSession.ABORTED],
+            created_at__lt=cutoff,
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"Aborted {aborted} unfinished upload(s), deleted {deleted} unattached file(s)."
+        ))
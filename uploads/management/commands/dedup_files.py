@@ -0,0 +1,98 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from uploads import blobs
+from uploads.models import TARGETS, Blob, UploadSession
+
+
+def _size(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024 or unit == 'GB':
+            return f"{value:,.1f} {unit}"
+        value /= 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Move record and report files uploaded before deduplication into "
+        "content-addressed blobs: identical files are collapsed onto one "
+        "stored copy and the others deleted. Blobs still named after the "
+        "file they were uploaded as are renamed to their content, so no "
+        "row shows another's file name. Prints storage savings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report what would be collapsed.")
+        parser.add_argument('--stats', action='store_true',
+                            help="Only print the current savings.")
+
+    def handle(self, *args, dry_run=False, stats=False, **options):
+        if not stats:
+            self._migrate(dry_run)
+            self._rename(dry_run)
+        totals = blobs.stats()
+        self.stdout.write(
+            f"{totals['blobs']} blobs, {totals['references']} references: "
+            f"{_size(totals['stored_bytes'])} stored for {_size(totals['logical_bytes'])} of files, "
+            f"{_size(totals['saved_bytes'])} saved."
+        )
+
+    def _migrate(self, dry_run):
+        models = [UploadSession.target_field(target).model for target in TARGETS]
+        known = set(Blob.objects.values_list('name', flat=True))
+        # name -> number of rows using it, for files not yet in a blob
+        legacy = {}
+        for model in models:
+            rows = model.objects.exclude(file='').exclude(file__isnull=True).values('file').annotate(n=Count('pk'))
+            for row in rows:
+                if row['file'] not in known:
+                    legacy[row['file']] = legacy.get(row['file'], 0) + row['n']
+
+        seen, collapsed, freed = {}, 0, 0
+        for name, references in legacy.items():
+            if not default_storage.exists(name):
+                self.stderr.write(f"Missing from storage, skipped: {name}")
+                continue
+            with default_storage.open(name, 'rb') as content:
+                sha256, size = blobs.hash_file(content)
+            existing = seen.get(sha256) or Blob.objects.filter(sha256=sha256).first()
+            if dry_run:
+                if existing:
+                    collapsed, freed = collapsed + 1, freed + size
+                seen.setdefault(sha256, name)
+                continue
+            if existing:
+                # Point the rows at the stored copy, then drop this one
+                for model in models:
+                    model.objects.filter(file=name).update(file=existing.name)
+                Blob.objects.filter(pk=existing.pk).update(refcount=F('refcount') + references)
+                default_storage.delete(name)
+                collapsed, freed = collapsed + 1, freed + size
+            else:
+                seen[sha256] = Blob.objects.create(sha256=sha256, name=name, size=size, refcount=references)
+        verb = "Would collapse" if dry_run else "Collapsed"
+        self.stdout.write(f"{verb} {collapsed} duplicate file(s), freeing {_size(freed)}.")
+
+    def _rename(self, dry_run):
+        models = [UploadSession.target_field(target).model for target in TARGETS]
+        renamed = 0
+        for blob in Blob.objects.order_by('pk').iterator():
+            name = blobs.blob_name(blob.sha256, blob.name)
+            if blob.name == name:
+                continue
+            renamed += 1
+            if dry_run:
+                continue
+            if not default_storage.exists(name):
+                with default_storage.open(blob.name, 'rb') as content:
+                    name = default_storage.save(name, content)
+            old = blob.name
+            for model in models:
+                model.objects.filter(file=old).update(file=name)
+            UploadSession.objects.filter(key=old).update(key=name)
+            Blob.objects.filter(pk=blob.pk).update(name=name)
+            default_storage.delete(old)
+        verb = "Would rename" if dry_run else "Renamed"
+        self.stdout.write(f"{verb} {renamed} file(s) to their content name.")
@@ -0,0 +1,42 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from uploads.previews import build, claim_next, give_up_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the record attachment previews requested by the list pages "
+        "(uploads/previews.py), so originals are only ever read here and "
+        "never by the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Exit when the queue is empty instead of polling.")
+        parser.add_argument('--poll', type=float, default=2.0,
+                            help="Seconds to wait between polls of an empty queue (default 2).")
+        parser.add_argument('--stale-after', type=int, default=5,
+                            help="Minutes after which a preview still building is given up (default 5).")
+
+    def handle(self, *args, once=False, poll=2.0, stale_after=5, **options):
+        try:
+            import PIL  # noqa: F401
+            import pypdfium2  # noqa: F401
+        except ImportError as e:
+            raise CommandError(f"Previews need Pillow and pypdfium2: {e}")
+        stale_after = datetime.timedelta(minutes=stale_after)
+        while True:
+            close_old_connections()
+            give_up_stale(stale_after)
+            blob = claim_next()
+            if blob is None:
+                if once:
+                    return
+                time.sleep(poll)
+                continue
+            state = build(blob)
+            self.stdout.write(f"Preview of {blob.name}: {state}")
@@ -0,0 +1,35 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from uploads.backends import claim_next, hash_upload
+
+
+class Command(BaseCommand):
+    help = (
+        "Hash completed chunked uploads into blobs (uploads/backends.py), so "
+        "whole files are only ever read here and never by the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Exit when the queue is empty instead of polling.")
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help="Seconds to wait between polls of an empty queue (default 1).")
+        parser.add_argument('--stale-after', type=int, default=30,
+                            help="Minutes after which an upload still being hashed is taken again (default 30).")
+
+    def handle(self, *args, once=False, poll=1.0, stale_after=30, **options):
+        stale_after = datetime.timedelta(minutes=stale_after)
+        while True:
+            close_old_connections()
+            session = claim_next(stale_after)
+            if session is None:
+                if once:
+                    return
+                time.sleep(poll)
+                continue
+            status = hash_upload(session)
+            self.stdout.write(f"Upload {session.pk}: {status or 'failed, will retry'}")
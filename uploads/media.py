@@ -0,0 +1,96 @@
+# uploads/media.py
+"""
+Cached storage URLs for file fields on list pages.
+
+With S3 query-string auth, FieldFile.url signs a fresh URL on every call,
+which on a 500-row page means 500 signatures (plus client setup on a
+fresh worker). media_urls() looks a whole page's names up in the cache
+with one get_many() and only signs the misses. Entries live for
+url_cache_timeout(): half the signature lifetime by default, so a cached
+URL always has at least half its validity left, which also covers the
+5 minutes a cached page (hospitals/cache.py) may keep it.
+
+Views call prefetch_media_urls(objects) on the page, and templates use
+{{ record.file|media_url }} ({% load media %}) instead of .url.
+
+Stored names say nothing about the file (blobs are named by content), so
+a signed URL carries the row's own `filename` as the download name, and
+URLs are cached per name and download name: rows sharing a blob never
+get each other's. Unsigned URLs cannot carry one.
+"""
+import hashlib
+import mimetypes
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.utils.http import content_disposition_header
+
+KEY_PREFIX = 'media-url:'
+# Unsigned URLs do not expire; they are only cached to skip the storage call
+UNSIGNED_TIMEOUT = 24 * 60 * 60
+# Content types shown in the browser rather than downloaded; anything else
+# could be HTML or SVG running script wherever it is opened
+INLINE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'application/pdf'}
+
+
+def content_disposition(name, filename):
+    """Content-Disposition for the stored file `name`, downloaded as `filename`."""
+    inline = mimetypes.guess_type(name)[0] in INLINE_TYPES
+    return content_disposition_header(not inline, filename)
+
+
+def _is_signed(storage):
+    # django-storages does not sign custom-domain URLs
+    return getattr(storage, 'querystring_auth', False) and not getattr(storage, 'custom_domain', None)
+
+
+def url_cache_timeout(storage=default_storage):
+    if not _is_signed(storage):
+        return settings.MEDIA_URL_CACHE_TIMEOUT or UNSIGNED_TIMEOUT
+    expire = storage.querystring_expire
+    return min(settings.MEDIA_URL_CACHE_TIMEOUT or expire // 2, expire // 2)
+
+
+def url_cache_key(name, filename=''):
+    return KEY_PREFIX + hashlib.md5(f'{name}\0{filename}'.encode()).hexdigest()
+
+
+def _url(storage, name, filename):
+    if filename and _is_signed(storage):
+        return storage.url(name, parameters={'ResponseContentDisposition': content_disposition(name, filename)})
+    return storage.url(name)
+
+
+def media_urls(files, storage=default_storage):
+    """
+    {(name, filename): url} for the (storage name, download name) pairs in
+    `files`, signing only those not cached.
+    """
+    keys = {url_cache_key(*file): file for file in files if file[0]}
+    found = cache.get_many(keys)
+    urls = {keys[key]: url for key, url in found.items()}
+    missing = {key: _url(storage, *file) for key, file in keys.items() if key not in found}
+    if missing:
+        cache.set_many(missing, url_cache_timeout(storage))
+        urls.update((keys[key], url) for key, url in missing.items())
+    return urls
+
+
+def media_url(name, filename='', storage=default_storage):
+    return media_urls([(name, filename)], storage).get((name, filename), '')
+
+
+def download_filename(field_file):
+    """The name the row holding `field_file` shows for it (MedicalRecord.filename and the like)."""
+    return getattr(field_file.instance, 'filename', '')
+
+
+def prefetch_media_urls(objects, field_name='file'):
+    """Resolve the URLs of `field_name` on every object in one cache round trip."""
+    files = [(getattr(obj, field_name), getattr(obj, 'filename', '')) for obj in objects]
+    urls = media_urls((field_file.name, filename) for field_file, filename in files if field_file)
+    for field_file, filename in files:
+        if field_file:
+            field_file.cached_url = urls[field_file.name, filename]
+    return objects
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0002_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='preview_state',
+            field=models.CharField(choices=[('pending', 'Not requested'), ('queued', 'Queued'), ('building', 'Building'), ('ready', 'Ready'), ('none', 'Not available')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='preview_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='blob',
+            index=models.Index(fields=['preview_state', 'preview_updated_at'], name='blob_preview_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0003_blob_preview'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('completing', 'Completing'), ('complete', 'Complete'), ('attached', 'Attached'), ('aborted', 'Aborted')], default='uploading', max_length=10),
+        ),
+    ]
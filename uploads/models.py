@@ -0,0 +1,146 @@
+# uploads/models.py
+import os
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+from django.utils.text import get_valid_filename
+
+# target -> (app_label, model, file field) an upload can be attached to
+TARGETS = {
+    'medical_record': ('patients', 'MedicalRecord', 'file'),
+    'report': ('reports', 'Report', 'file'),
+}
+
+# Longest extension kept in storage names
+MAX_EXTENSION_LENGTH = 10
+
+
+def storage_extension(filename):
+    """
+    The extension of `filename`, made safe for storage names. Storage names
+    carry nothing else of the uploaded name: blobs are shared across
+    hospitals, and file names often hold a patient's name or number.
+    """
+    ext = os.path.splitext(get_valid_filename(os.path.basename(filename)) or 'file')[1]
+    return ext[:MAX_EXTENSION_LENGTH].lower()
+
+
+class UploadSession(models.Model):
+    """
+    One chunked upload, from start to completion. Parts go straight to S3
+    through presigned URLs (or to a local part directory in local mode),
+    so the web workers never hold a whole file. Once the parts are joined,
+    run_upload_worker hashes the file into a Blob; then it is complete,
+    `key` names the file in default storage and a form can attach it.
+    """
+    UPLOADING = 'uploading'
+    # Claimed by one upload_complete request while the parts are joined
+    COMPLETING = 'completing'
+    # Joined; waiting for run_upload_worker to hash it
+    HASHING = 'hashing'
+    COMPLETE = 'complete'
+    ATTACHED = 'attached'
+    ABORTED = 'aborted'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (COMPLETING, 'Completing'),
+        (HASHING, 'Hashing'),
+        (COMPLETE, 'Complete'),
+        (ATTACHED, 'Attached'),
+        (ABORTED, 'Aborted'),
+    ]
+    TARGET_CHOICES = [(target, target.replace('_', ' ').capitalize()) for target in TARGETS]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='uploads')
+    target = models.CharField(max_length=30, choices=TARGET_CHOICES)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    # Name of the file in default storage: where the parts are assembled
+    # (s3 backend), then the blob's name once complete
+    key = models.CharField(max_length=500)
+    backend = models.CharField(max_length=10)
+    # S3 multipart UploadId (s3 backend only)
+    multipart_id = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UPLOADING)
+    # Hex SHA-256 of the whole file: as announced by the client at the start,
+    # then as computed by run_upload_worker
+    sha256 = models.CharField(max_length=64, blank=True)
+    # Byte range the client must hash to use an already stored copy (uploads/blobs.py)
+    challenge = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    hashing_started_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # clean_stale_uploads: unfinished sessions by age; run_upload_worker: the queue
+            models.Index(fields=['status', 'created_at'], name='upload_status_created_idx'),
+        ]
+
+    @staticmethod
+    def target_field(target):
+        app_label, model_name, field_name = TARGETS[target]
+        return apps.get_model(app_label, model_name)._meta.get_field(field_name)
+
+    @classmethod
+    def make_key(cls, target, upload_id, filename):
+        """Storage name under the target field's upload_to, unique per upload."""
+        upload_to = cls.target_field(target).upload_to
+        return os.path.join(upload_to, f'{upload_id}{storage_extension(filename)}')
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def part_size(self, number):
+        """Expected size in bytes of part `number` (1-based)."""
+        if number < self.part_count:
+            return self.chunk_size
+        return self.size - self.chunk_size * (self.part_count - 1)
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+
+class Blob(models.Model):
+    """
+    A file in storage identified by the SHA-256 of its contents, shared by
+    every record, report or finished upload holding the same bytes.
+    `refcount` counts those holders; uploads/blobs.py deletes the file
+    once it drops to zero.
+    """
+    PREVIEW_PENDING = 'pending'
+    PREVIEW_QUEUED = 'queued'
+    PREVIEW_BUILDING = 'building'
+    PREVIEW_READY = 'ready'
+    PREVIEW_NONE = 'none'
+    PREVIEW_CHOICES = [
+        (PREVIEW_PENDING, 'Not requested'),
+        (PREVIEW_QUEUED, 'Queued'),
+        (PREVIEW_BUILDING, 'Building'),
+        (PREVIEW_READY, 'Ready'),
+        (PREVIEW_NONE, 'Not available'),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=500, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Thumbnail built by run_preview_worker (uploads/previews.py)
+    preview_state = models.CharField(max_length=10, choices=PREVIEW_CHOICES, default=PREVIEW_PENDING)
+    preview_updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # run_preview_worker: queued and stuck previews
+            models.Index(fields=['preview_state', 'preview_updated_at'], name='blob_preview_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
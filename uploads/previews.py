@@ -0,0 +1,165 @@
+# uploads/previews.py
+"""
+Thumbnails for images and the first page of PDFs.
+
+Nothing is built at upload time. The first request for a preview
+(preview_response(), behind e.g. patients:record_preview) queues it on
+the file's Blob and answers with a placeholder; `manage.py
+run_preview_worker` then reads the original, renders a JPEG no larger
+than PREVIEW_SIZE pixels and saves it to storage. Later requests are
+redirected to the stored thumbnail, so neither the original nor the
+thumbnail passes through the web workers.
+
+Previews are named after the content hash, so every record sharing a
+file shares one preview, and they are deleted with their blob.
+
+Rendering needs Pillow, plus pypdfium2 for PDFs.
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+
+from .media import media_url
+from .models import Blob
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SIZE = 320
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+PDF_EXTENSIONS = {'.pdf'}
+# Browsers may reuse a preview redirect this long; stored previews never
+# change, but the storage URL may be signed.
+REDIRECT_MAX_AGE = 5 * 60
+
+PLACEHOLDER = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 160 160">'
+    '<rect width="160" height="160" rx="8" fill="#f1f3f5"/>'
+    '<text x="80" y="86" font-family="sans-serif" font-size="14" fill="#6c757d" text-anchor="middle">{text}</text>'
+    '</svg>'
+)
+
+
+def is_previewable(name):
+    return os.path.splitext(name or '')[1].lower() in IMAGE_EXTENSIONS | PDF_EXTENSIONS
+
+
+def preview_name(sha256):
+    return f"previews/{sha256[:2]}/{sha256}-{PREVIEW_SIZE}.jpg"
+
+
+def _placeholder(text, max_age):
+    response = HttpResponse(PLACEHOLDER.format(size=PREVIEW_SIZE // 2, text=text), content_type='image/svg+xml')
+    if max_age:
+        patch_cache_control(response, private=True, max_age=max_age)
+    else:
+        patch_cache_control(response, no_store=True)
+    return response
+
+
+def preview_response(field_file):
+    """
+    Response for the preview of `field_file`: a redirect to the stored
+    thumbnail, or a placeholder while it is being built (the first call
+    queues it). The caller checks the user may see the file.
+    """
+    blob = Blob.objects.filter(name=field_file.name).only('sha256', 'preview_state').first() if field_file else None
+    if blob is None or not is_previewable(field_file.name) or blob.preview_state == Blob.PREVIEW_NONE:
+        return _placeholder("No preview", 24 * 60 * 60)
+    if blob.preview_state == Blob.PREVIEW_READY:
+        response = redirect(media_url(preview_name(blob.sha256)))
+        patch_cache_control(response, private=True, max_age=REDIRECT_MAX_AGE)
+        return response
+    if blob.preview_state == Blob.PREVIEW_PENDING:
+        Blob.objects.filter(pk=blob.pk, preview_state=Blob.PREVIEW_PENDING).update(
+            preview_state=Blob.PREVIEW_QUEUED, preview_updated_at=timezone.now(),
+        )
+    return _placeholder("Preview pending", 0)
+
+
+# =========================
+# Rendering (run_preview_worker)
+# =========================
+
+def _render_image(source):
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        # JPEGs are decoded straight at a reduced scale
+        image.draft('RGB', (PREVIEW_SIZE, PREVIEW_SIZE))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+        return image.convert('RGB')
+
+
+def _render_pdf(source):
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(source)
+    try:
+        page = pdf[0]
+        width, height = page.get_size()
+        return page.render(scale=PREVIEW_SIZE / max(width, height, 1)).to_pil().convert('RGB')
+    finally:
+        pdf.close()
+
+
+def render(source, name):
+    """JPEG bytes of the preview for `source` (a binary file), or None if the type has no preview."""
+    ext = os.path.splitext(name)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        image = _render_image(source)
+    elif ext in PDF_EXTENSIONS:
+        image = _render_pdf(source)
+    else:
+        return None
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=80, optimize=True)
+    return out.getvalue()
+
+
+def claim_next():
+    """Mark the oldest queued preview as building and return its Blob, or None."""
+    queued = Blob.objects.filter(preview_state=Blob.PREVIEW_QUEUED).order_by('preview_updated_at', 'id')
+    for pk in queued.values_list('pk', flat=True)[:10]:
+        claimed = Blob.objects.filter(pk=pk, preview_state=Blob.PREVIEW_QUEUED).update(
+            preview_state=Blob.PREVIEW_BUILDING, preview_updated_at=timezone.now(),
+        )
+        if claimed:
+            return Blob.objects.get(pk=pk)
+    return None
+
+
+def give_up_stale(older_than):
+    """
+    Previews still building after `older_than` most likely crashed their
+    worker (a malformed PDF, say); they are not retried.
+    """
+    return Blob.objects.filter(
+        preview_state=Blob.PREVIEW_BUILDING, preview_updated_at__lt=timezone.now() - older_than,
+    ).update(preview_state=Blob.PREVIEW_NONE, preview_updated_at=timezone.now())
+
+
+def build(blob):
+    """Render and store `blob`'s preview. Returns the new preview state."""
+    state = Blob.PREVIEW_NONE
+    try:
+        with default_storage.open(blob.name, 'rb') as source:
+            data = render(source, blob.name)
+        if data is not None:
+            name = preview_name(blob.sha256)
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(data))
+            state = Blob.PREVIEW_READY
+    except Exception:
+        logger.exception("Could not build a preview of %s", blob.name)
+    Blob.objects.filter(pk=blob.pk, preview_state=Blob.PREVIEW_BUILDING).update(
+        preview_state=state, preview_updated_at=timezone.now(),
+    )
+    return state
@@ -0,0 +1,149 @@
+# uploads/serving.py
+"""
+Authorized media downloads for MEDIA_MODE=local.
+
+Django decides who may read a file; the front web server sends it. With
+nginx (MEDIA_SENDFILE_HEADER = 'X-Accel-Redirect'):
+
+    location /media/ {
+        proxy_pass http://app;                      # serve_media checks access
+    }
+    location /protected-media/ {
+        internal;                                    # only via X-Accel-Redirect
+        alias /srv/chm/media/;                       # MEDIA_ROOT
+    }
+
+nginx then streams the file and answers Range requests itself, so no
+Python worker is held for the transfer. Apache (mod_xsendfile) and
+lighttpd take the file's path in X-Sendfile instead. Without a header
+configured, ranged_file_response() serves the file from Django.
+
+Uploaded files are whatever a user chose, so only types a browser shows
+without running anything (uploads.media.INLINE_TYPES) open inline; all
+else is a download, named after a row the user may see. Every file is
+sent with nosniff and a sandbox CSP, so an HTML or SVG file cannot run
+script on the site's origin.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+
+from patients.models import MedicalRecord
+from reports.models import Report
+from .media import content_disposition
+from .models import Blob, UploadSession
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+READ_SIZE = 64 * 1024
+# Stored names never change content (blobs are content-addressed), so
+# browsers may reuse a download briefly without asking again.
+MAX_AGE = 5 * 60
+
+
+def _names_for(name):
+    """Storage names whose access decides access to `name`: a preview follows its original."""
+    if name.startswith('previews/'):
+        sha256 = os.path.basename(name).split('-', 1)[0]
+        return list(Blob.objects.filter(sha256=sha256).values_list('name', flat=True))
+    return [name]
+
+
+def download_name(user, name):
+    """
+    The name `user` downloads the stored file `name` under, or None if
+    they may not, by the rules of the record and report views: admins see
+    every hospital, staff their own hospital, patients their own records
+    and their hospital's reports. Files not attached to anything yet are
+    only visible to whoever uploaded them. The name is taken from a row
+    the user can see, never from one elsewhere sharing the blob.
+    """
+    names = _names_for(name)
+    if not names:
+        return None
+    records = MedicalRecord.objects.filter(file__in=names)
+    reports = Report.objects.filter(file__in=names)
+    if user.role == 'Staff':
+        records = records.for_hospital(user.hospital_id)
+    elif user.role == 'Patient':
+        records = records.filter(patient__user=user)
+    elif user.role != 'Admin':
+        return None
+    if user.role != 'Admin':
+        # Like report_list's for_request(): the user's hospital, or nothing without one
+        reports = reports.for_hospital(user.hospital_id) if user.hospital_id else reports.none()
+    uploads = UploadSession.objects.filter(key__in=names, user=user)
+    for queryset in (records, reports, uploads):
+        filename = queryset.values_list('filename', flat=True).first()
+        if filename is not None:
+            # Previews go by their own name; rows from before `filename` have none
+            return os.path.basename(name) if name not in names or not filename else filename
+    return None
+
+
+def _read_range(file, length):
+    try:
+        while length > 0:
+            block = file.read(min(READ_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        file.close()
+
+
+def ranged_file_response(request, path, content_type):
+    """FileResponse for `path` that also answers a single-range Range request with 206."""
+    size = os.path.getsize(path)
+    match = RANGE_RE.match(request.headers.get('Range', '').strip())
+    if not match or not (match[1] or match[2]):
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+    if match[1]:
+        start, end = int(match[1]), min(int(match[2]) if match[2] else size - 1, size - 1)
+    else:
+        # bytes=-N: the last N bytes
+        start, end = max(size - int(match[2]), 0), size - 1
+    if start > end:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    file = open(path, 'rb')
+    file.seek(start)
+    response = StreamingHttpResponse(_read_range(file, end - start + 1), status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def media_response(request, name, filename=None):
+    """
+    Hand the stored file `name` to the web server (or send it) once access
+    is checked; `filename` is the download name.
+    """
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    header = settings.MEDIA_SENDFILE_HEADER
+    if header == 'X-Accel-Redirect':
+        response = HttpResponse(content_type=content_type)
+        response[header] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+    elif header:
+        response = HttpResponse(content_type=content_type)
+        response[header] = default_storage.path(name)
+    else:
+        path = default_storage.path(name)
+        if not os.path.isfile(path):
+            raise Http404("File not found.")
+        response = ranged_file_response(request, path, content_type)
+    response['Content-Disposition'] = content_disposition(name, filename or os.path.basename(name))
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Content-Security-Policy'] = 'sandbox'
+    patch_cache_control(response, private=True, max_age=MAX_AGE)
+    return response
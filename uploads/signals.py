@@ -0,0 +1,73 @@
+# uploads/signals.py
+"""
+Keep Blob reference counts in step with the record and report rows that
+point at them: a new file is stored through uploads/blobs.py, and a file
+replaced on update or dropped with its row releases its reference.
+"""
+import os
+
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+
+from . import blobs
+from .models import TARGETS, UploadSession
+
+
+def _loaded_name(instance, field_name):
+    # __dict__ so that a deferred file field is not loaded here; None means unknown
+    value = instance.__dict__.get(field_name)
+    return getattr(value, 'name', value) or ('' if field_name in instance.__dict__ else None)
+
+
+def remember_file(sender, instance, **kwargs):
+    instance._loaded_file_name = _loaded_name(instance, 'file')
+
+
+def store_new_file(sender, instance, raw=False, **kwargs):
+    if raw or 'file' not in instance.__dict__:
+        return
+    field_file = instance.file
+    if field_file and not field_file._committed:
+        upload = field_file.file
+        blob = blobs.store(upload, field_file.name, sha256=getattr(upload, 'sha256', None))
+        # The blob's name is its content; the uploaded name stays on the row
+        instance.filename = os.path.basename(field_file.name)[:255]
+        instance.file = blob.name
+        # store() took the reference this row holds
+        instance._acquired_file_name = blob.name
+
+
+def update_references(sender, instance, created=False, raw=False, **kwargs):
+    if raw or 'file' not in instance.__dict__:
+        return
+    old = '' if created else getattr(instance, '_loaded_file_name', None)
+    new = instance.file.name or ''
+    acquired = instance.__dict__.pop('_acquired_file_name', None)
+    upload_id = instance.__dict__.pop('_attached_upload_id', None)
+    if upload_id and not UploadSession.objects.filter(
+        pk=upload_id, status=UploadSession.COMPLETE,
+    ).update(status=UploadSession.ATTACHED):
+        # Attached to another row in the meantime, which took its reference
+        acquired = None
+    if new != old:
+        if new != acquired:
+            blobs.acquire(new)
+        if old:
+            blobs.release(old)
+    elif acquired:
+        # The same content again: drop the extra reference taken for it
+        blobs.release(acquired)
+    instance._loaded_file_name = new
+
+
+def release_file(sender, instance, **kwargs):
+    blobs.release(getattr(instance, '_loaded_file_name', None))
+
+
+def connect():
+    for target in TARGETS:
+        model = UploadSession.target_field(target).model
+        uid = f'blob_refs_{target}'
+        post_init.connect(remember_file, sender=model, dispatch_uid=f'{uid}_init')
+        pre_save.connect(store_new_file, sender=model, dispatch_uid=f'{uid}_pre_save')
+        post_save.connect(update_references, sender=model, dispatch_uid=f'{uid}_save')
+        post_delete.connect(release_file, sender=model, dispatch_uid=f'{uid}_delete')
@@ -0,0 +1,15 @@
+from django import template
+
+from uploads.media import download_filename, media_url as cached_media_url
+
+register = template.Library()
+
+
+@register.filter
+def media_url(field_file):
+    """The file's URL, from prefetch_media_urls() when the view ran it, else from the URL cache."""
+    if not field_file:
+        return ''
+    return getattr(field_file, 'cached_url', None) or cached_media_url(
+        field_file.name, download_filename(field_file), field_file.storage,
+    )
@@ -0,0 +1,11 @@
+from django import template
+
+from uploads.previews import is_previewable
+
+register = template.Library()
+
+
+@register.filter
+def previewable(field_file):
+    """True when the file type gets a thumbnail (images and PDFs)."""
+    return bool(field_file) and is_previewable(field_file.name)
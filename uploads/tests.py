@@ -0,0 +1,513 @@
+import base64
+import datetime
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from CHM import urls as project_urls
+from hospitals.models import Hospital
+from patients.forms import MedicalRecordForm
+from patients.models import MedicalRecord, PatientProfile
+from reports.models import Report
+from . import blobs
+from . import previews
+from .backends import MIN_CHUNK_SIZE, LocalBackend, claim_next, hash_upload
+from .media import media_url, media_urls, prefetch_media_urls, url_cache_timeout
+from .models import Blob, UploadSession
+from .views import serve_media
+
+try:
+    from PIL import Image
+except ImportError:  # previews are optional
+    Image = None
+
+# ServeMediaTests' URLconf: CHM/urls.py only routes media downloads in
+# MEDIA_MODE=local, and the suite must not depend on the mode it runs in.
+urlpatterns = project_urls.urlpatterns + [path('media/<path:name>', serve_media, name='media')]
+
+
+class UploadTestCase(TestCase):
+    """Chunked uploads against local disk: the local backend and FileSystemStorage in a temp dir."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            SECURE_SSL_REDIRECT=False,
+            MEDIA_ROOT=cls.media_root,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+            CHUNKED_UPLOAD_BACKEND='local',
+            CHUNKED_UPLOAD_TEMP_DIR=f'{cls.media_root}/parts',
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital, cls.other_hospital = Hospital.objects.bulk_create([Hospital(name='General'), Hospital(name='Other')])
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pw', role='Staff', hospital=cls.hospital)
+        cls.profile = cls.make_profile('patient@example.com', cls.hospital)
+        cls.other_profile = cls.make_profile('other@example.com', cls.other_hospital)
+
+    @staticmethod
+    def make_profile(email, hospital):
+        user = CustomUser.objects.create_user(email, 'pw', role='Patient', hospital=hospital)
+        return PatientProfile.objects.create(user=user, date_of_birth=datetime.date(1990, 1, 1), gender='other')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def start(self, data, filename='scan.pdf', target='medical_record', **fields):
+        response = self.client.post(reverse('uploads:start'), {
+            'target': target, 'filename': filename, 'size': len(data), **fields,
+        })
+        self.assertEqual(response.status_code, 201)
+        return UploadSession.objects.get(pk=response.json()['id'])
+
+    def send_part(self, session, number, data):
+        checksum = base64.b64encode(hashlib.sha256(data).digest()).decode()
+        target = self.client.post(reverse('uploads:part', args=[session.pk, number]), {'checksum': checksum}).json()
+        response = self.client.put(target['url'], data, content_type='application/octet-stream',
+                                   headers=target['headers'])
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def upload(self, data, **kwargs):
+        """A completed upload of `data`, sent as one part."""
+        session = self.start(data, **kwargs)
+        self.send_part(session, 1, data)
+        response = self.client.post(reverse('uploads:complete', args=[session.pk]))
+        self.assertEqual(response.status_code, 202, response.content)
+        self.run_worker()
+        session.refresh_from_db()
+        return session
+
+    def run_worker(self, stale_after=datetime.timedelta(minutes=30)):
+        """What `run_upload_worker --once` does."""
+        with self.captureOnCommitCallbacks(execute=True):
+            while session := claim_next(stale_after):
+                hash_upload(session)
+
+    def blob(self, session):
+        return Blob.objects.get(name=session.key)
+
+
+class AttachUploadTests(UploadTestCase):
+
+    def post_record(self, session, profile):
+        return self.client.post(reverse('patients:record_create'), {
+            'patient': profile.pk, 'description': 'Scan', 'upload_id': session.pk,
+        })
+
+    def test_attach(self):
+        session = self.upload(b'scan contents', filename='Jane Doe MRN 1234.pdf')
+        response = self.post_record(session, self.profile)
+        self.assertEqual(response.status_code, 302)
+        record = MedicalRecord.objects.get()
+        session.refresh_from_db()
+        self.assertEqual(record.file.name, session.key)
+        # Stored by content; the uploaded name stays on the row
+        self.assertEqual(record.file.name, f"blobs/{session.sha256[:2]}/{session.sha256}.pdf")
+        self.assertEqual(record.filename, 'Jane Doe MRN 1234.pdf')
+        self.assertEqual(session.status, UploadSession.ATTACHED)
+        self.assertEqual(self.blob(session).refcount, 1)
+
+    def test_patient_of_another_hospital_is_rejected_before_saving(self):
+        session = self.upload(b'scan contents')
+        response = self.post_record(session, self.other_profile)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('patient', response.context['form'].errors)
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.COMPLETE)
+        self.assertEqual(self.blob(session).refcount, 1)
+        self.assertFalse(MedicalRecord.objects.exists())
+
+    def test_unsaved_instance_keeps_upload_complete(self):
+        session = self.upload(b'scan contents')
+        form = MedicalRecordForm(
+            {'patient': self.profile.pk, 'description': 'Scan', 'upload_id': session.pk}, user=self.staff,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save(commit=False)
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.COMPLETE)
+
+    def test_upload_attached_twice_holds_two_references(self):
+        session = self.upload(b'scan contents')
+        forms = [
+            MedicalRecordForm({'patient': self.profile.pk, 'description': 'Scan', 'upload_id': session.pk}, user=self.staff)
+            for _ in range(2)
+        ]
+        # Both validated while the upload was still unattached
+        for form in forms:
+            self.assertTrue(form.is_valid(), form.errors)
+        for form in forms:
+            form.save()
+        self.assertEqual(self.blob(session).refcount, 2)
+
+
+class CompleteUploadTests(UploadTestCase):
+
+    def complete(self, session):
+        return self.client.post(reverse('uploads:complete', args=[session.pk]))
+
+    def test_complete_is_hashed_by_the_worker(self):
+        session = self.start(b'scan contents')
+        self.send_part(session, 1, b'scan contents')
+        self.assertEqual(self.complete(session).json()['status'], UploadSession.HASHING)
+        self.assertFalse(Blob.objects.exists())
+        self.run_worker()
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.COMPLETE)
+        self.assertEqual(session.sha256, hashlib.sha256(b'scan contents').hexdigest())
+        self.assertEqual(self.blob(session).refcount, 1)
+
+    def test_form_waits_for_hashing(self):
+        session = self.start(b'scan contents')
+        self.send_part(session, 1, b'scan contents')
+        self.complete(session)
+        form = MedicalRecordForm(
+            {'patient': self.profile.pk, 'description': 'Scan', 'upload_id': session.pk}, user=self.staff,
+        )
+        self.assertIn('still being checked', str(form.errors['upload_id']))
+
+    def test_stale_claim_is_taken_over(self):
+        session = self.start(b'scan contents')
+        self.send_part(session, 1, b'scan contents')
+        self.complete(session)
+        first = claim_next(datetime.timedelta(minutes=30))
+        self.assertIsNone(claim_next(datetime.timedelta(minutes=30)))
+        second = claim_next(datetime.timedelta(0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(hash_upload(first), UploadSession.COMPLETE)
+        session.refresh_from_db()
+        # The other worker finishes later, taking a reference on the same blob as S3's adopt() would
+        with mock.patch.object(LocalBackend, 'finish', lambda backend, s: blobs.acquire_existing(session.sha256)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertIsNone(hash_upload(second))
+        self.assertEqual(self.blob(session).refcount, 1)
+
+    @override_settings(CHUNKED_UPLOAD_CHUNK_SIZE=MIN_CHUNK_SIZE)
+    def test_takeover_does_not_mix_assembled_files(self):
+        data = os.urandom(MIN_CHUNK_SIZE) + b'tail'
+        session = self.start(data)
+        self.send_part(session, 1, data[:session.chunk_size])
+        self.send_part(session, 2, data[session.chunk_size:])
+        self.complete(session)
+        part_path, store = LocalBackend._part_path, blobs.store
+
+        def part_path_until_2(backend, session, number):
+            if number == 2:
+                raise RuntimeError("Worker stopped")
+            return part_path(backend, session, number)
+
+        def store_after_takeover(*args, **kwargs):
+            # Just before the first worker stores its file, a second one takes
+            # the session over and gets as far as part 2
+            with mock.patch.object(LocalBackend, '_part_path', part_path_until_2):
+                with self.assertRaises(RuntimeError):
+                    LocalBackend().finish(session)
+            return store(*args, **kwargs)
+
+        with mock.patch.object(blobs, 'store', store_after_takeover):
+            blob = LocalBackend().finish(session)
+        self.assertEqual(blob.sha256, hashlib.sha256(data).hexdigest())
+        with default_storage.open(blob.name, 'rb') as stored:
+            self.assertEqual(stored.read(), data)
+
+    def test_complete_while_another_completes(self):
+        session = self.start(b'scan contents')
+        self.send_part(session, 1, b'scan contents')
+        # Another request has claimed it
+        UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.COMPLETING)
+        self.assertEqual(self.complete(session).status_code, 409)
+        self.assertFalse(Blob.objects.exists())
+
+    def test_complete_twice_takes_one_reference(self):
+        session = self.start(b'scan contents')
+        self.send_part(session, 1, b'scan contents')
+        self.assertEqual(self.complete(session).status_code, 202)
+        self.assertEqual(self.complete(session).json()['status'], UploadSession.HASHING)
+        self.run_worker()
+        self.assertEqual(self.complete(session).json()['status'], UploadSession.COMPLETE)
+        session.refresh_from_db()
+        self.assertEqual(self.blob(session).refcount, 1)
+
+    def test_missing_parts_can_still_be_sent(self):
+        session = self.start(b'scan contents')
+        self.assertEqual(self.complete(session).status_code, 400)
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.UPLOADING)
+        self.send_part(session, 1, b'scan contents')
+        self.assertEqual(self.complete(session).status_code, 202)
+
+
+class ProveUploadTests(UploadTestCase):
+    """Content already stored is not uploaded again, but only for a client that holds it."""
+
+    data = b'scan contents ' * 10000
+
+    def start_known(self):
+        self.stored = self.upload(self.data)
+        response = self.client.post(reverse('uploads:start'), {
+            'target': 'medical_record', 'filename': 'copy.pdf', 'size': len(self.data),
+            'sha256': hashlib.sha256(self.data).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        return UploadSession.objects.get(pk=response.json()['id']), response.json()['challenge']
+
+    def prove(self, session, proof):
+        return self.client.post(reverse('uploads:prove', args=[session.pk]), {'proof': proof})
+
+    def complete(self, session):
+        return self.client.post(reverse('uploads:complete', args=[session.pk]))
+
+    def answer(self, challenge, data):
+        piece = data[challenge['start']:challenge['start'] + challenge['length']]
+        return hashlib.sha256(bytes.fromhex(challenge['nonce']) + piece).hexdigest()
+
+    def test_proof_completes_without_upload(self):
+        session, challenge = self.start_known()
+        response = self.prove(session, self.answer(challenge, self.data))
+        self.assertEqual(response.json()['status'], UploadSession.COMPLETE)
+        session.refresh_from_db()
+        self.assertEqual(session.key, self.stored.key)
+        self.assertEqual(self.blob(session).refcount, 2)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'parts', str(session.pk))))
+
+    def test_hash_alone_is_not_enough(self):
+        session, challenge = self.start_known()
+        self.assertEqual(self.prove(session, hashlib.sha256(self.data).hexdigest()).status_code, 409)
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.UPLOADING)
+        # One answer per challenge
+        self.assertEqual(self.prove(session, self.answer(challenge, self.data)).status_code, 409)
+        self.assertEqual(self.blob(self.stored).refcount, 1)
+        # The file can still be uploaded normally
+        self.send_part(session, 1, self.data)
+        self.assertEqual(self.complete(session).status_code, 202)
+
+    def test_unknown_content_gets_no_challenge(self):
+        data = b'new contents'
+        response = self.client.post(reverse('uploads:start'), {
+            'target': 'medical_record', 'filename': 'new.pdf', 'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        })
+        self.assertNotIn('challenge', response.json())
+
+
+class ServedMediaTestCase(UploadTestCase):
+    """Local-mode downloads, served by Django from the temporary MEDIA_ROOT set up by UploadTestCase."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.serve_override = override_settings(ROOT_URLCONF=__name__, MEDIA_SENDFILE_HEADER='')
+        cls.serve_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.serve_override.disable()
+        super().tearDownClass()
+
+    def stored(self, name, data=b'contents'):
+        name = default_storage.save(name, ContentFile(data))
+        self.assertTrue(default_storage.path(name).startswith(self.media_root))
+        return name
+
+    def get(self, name, user=None):
+        self.client.force_login(user or self.staff)
+        return self.client.get(reverse('media', args=[name]))
+
+
+class ServeMediaTests(ServedMediaTestCase):
+
+    def test_patient_sees_their_hospitals_reports(self):
+        mine = Report.objects.create(hospital=self.hospital, title='Stock', file=self.stored('reports/stock.csv'))
+        other = Report.objects.create(hospital=self.other_hospital, title='Stock', file=self.stored('reports/other.csv'))
+        response = self.get(mine.file.name, self.profile.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'contents')
+        self.assertEqual(self.get(other.file.name, self.profile.user).status_code, 404)
+
+    def test_only_images_and_pdfs_open_inline(self):
+        for name, disposition in [('scan.png', 'inline'), ('scan.pdf', 'inline'),
+                                  ('page.html', 'attachment'), ('drawing.svg', 'attachment')]:
+            record = MedicalRecord.objects.create(patient=self.profile, description='Scan',
+                                                  file=self.stored(f'records/{name}'))
+            response = self.get(record.file.name)
+            self.assertTrue(response['Content-Disposition'].startswith(disposition), name)
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+            self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+    def test_shared_blob_downloads_under_each_rows_name(self):
+        other_staff = CustomUser.objects.create_user('other-staff@example.com', 'pw', role='Staff',
+                                                     hospital=self.other_hospital)
+        mine = MedicalRecord.objects.create(patient=self.profile, description='Scan',
+                                            file=ContentFile(b'same scan', name='Jane Doe.pdf'))
+        theirs = MedicalRecord.objects.create(patient=self.other_profile, description='Scan',
+                                              file=ContentFile(b'same scan', name='John Roe.pdf'))
+        self.assertEqual(mine.file.name, theirs.file.name)
+        self.assertNotIn('Doe', mine.file.name)
+        self.assertIn('Jane Doe.pdf', self.get(mine.file.name)['Content-Disposition'])
+        self.assertIn('John Roe.pdf', self.get(theirs.file.name, other_staff)['Content-Disposition'])
+
+
+class DedupFilesTests(UploadTestCase):
+
+    def test_blobs_named_after_their_upload_are_renamed(self):
+        data = b'legacy scan'
+        sha256 = hashlib.sha256(data).hexdigest()
+        old = default_storage.save(f'blobs/{sha256[:2]}/{sha256}/Jane Doe.PDF', ContentFile(data))
+        Blob.objects.create(sha256=sha256, name=old, size=len(data))
+        MedicalRecord.objects.create(patient=self.profile, description='Scan', file=old, filename='Jane Doe.PDF')
+        call_command('dedup_files', stdout=io.StringIO())
+        record = MedicalRecord.objects.get()
+        self.assertEqual(record.file.name, f'blobs/{sha256[:2]}/{sha256}.pdf')
+        self.assertEqual(Blob.objects.get().name, record.file.name)
+        self.assertEqual(Blob.objects.get().refcount, 1)
+        self.assertFalse(default_storage.exists(old))
+        with record.file.open('rb') as stored:
+            self.assertEqual(stored.read(), data)
+
+
+class PreviewTests(ServedMediaTestCase):
+    """Previews are queued by the first request, built once by the worker and never retried."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def record(self, data, filename):
+        return MedicalRecord.objects.create(patient=self.profile, description='Scan',
+                                            file=ContentFile(data, name=filename))
+
+    def preview(self, record):
+        return self.client.get(reverse('patients:record_preview', args=[record.pk]))
+
+    def run_worker(self):
+        """What `run_preview_worker --once` does."""
+        while blob := previews.claim_next():
+            previews.build(blob)
+
+    def test_other_types_get_no_preview(self):
+        record = self.record(b'notes', 'notes.txt')
+        response = self.preview(record)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertContains(response, 'No preview')
+        self.assertEqual(Blob.objects.get().preview_state, Blob.PREVIEW_PENDING)
+        self.assertIsNone(previews.claim_next())
+
+    def test_unrenderable_file_is_not_retried(self):
+        record = self.record(b'not a pdf', 'scan.pdf')
+        self.assertContains(self.preview(record), 'Preview pending')
+        self.assertEqual(Blob.objects.get().preview_state, Blob.PREVIEW_QUEUED)
+        with self.assertLogs('uploads.previews', 'ERROR'):
+            self.run_worker()
+        self.assertEqual(Blob.objects.get().preview_state, Blob.PREVIEW_NONE)
+        self.assertContains(self.preview(record), 'No preview')
+        self.assertIsNone(previews.claim_next())
+
+    def test_stuck_preview_is_given_up(self):
+        self.preview(self.record(b'not a pdf', 'scan.pdf'))
+        previews.claim_next()
+        self.assertEqual(previews.give_up_stale(datetime.timedelta(minutes=5)), 0)
+        Blob.objects.update(preview_updated_at=timezone.now() - datetime.timedelta(minutes=10))
+        self.assertEqual(previews.give_up_stale(datetime.timedelta(minutes=5)), 1)
+        self.assertEqual(Blob.objects.get().preview_state, Blob.PREVIEW_NONE)
+        self.assertIsNone(previews.claim_next())
+
+    @unittest.skipIf(Image is None, "Previews need Pillow")
+    def test_preview_is_served_as_jpeg(self):
+        image = io.BytesIO()
+        Image.new('RGB', (640, 480), 'red').save(image, 'PNG')
+        record = self.record(image.getvalue(), 'scan.png')
+        self.preview(record)
+        self.run_worker()
+        blob = Blob.objects.get()
+        self.assertEqual(blob.preview_state, Blob.PREVIEW_READY)
+        name = previews.preview_name(blob.sha256)
+        response = self.preview(record)
+        self.assertRedirects(response, media_url(name), fetch_redirect_response=False)
+        response = self.get(name)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.format, 'JPEG')
+            self.assertEqual(thumbnail.size, (previews.PREVIEW_SIZE, previews.PREVIEW_SIZE * 3 // 4))
+        # Another hospital's patient cannot follow the redirect
+        self.assertEqual(self.get(name, self.other_profile.user).status_code, 404)
+
+
+class SignedStorage:
+    """Stands in for S3Storage with query-string auth, counting the URLs it signs."""
+    querystring_auth = True
+    querystring_expire = 3600
+    custom_domain = None
+
+    def __init__(self):
+        self.signed = []
+
+    def url(self, name, parameters=None):
+        self.signed.append((name, parameters))
+        return f'https://bucket.example.com/{name}?signature={len(self.signed)}'
+
+
+@override_settings(MEDIA_URL_CACHE_TIMEOUT=None)
+class MediaUrlTests(UploadTestCase):
+    """Signed URLs are cached per stored name and download name, for half their lifetime."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.storage = SignedStorage()
+
+    def test_url_is_reused_within_its_ttl(self):
+        self.assertEqual(url_cache_timeout(self.storage), 1800)
+        url = media_url('blobs/ab/ab.pdf', 'Jane Doe.pdf', self.storage)
+        self.assertEqual(media_url('blobs/ab/ab.pdf', 'Jane Doe.pdf', self.storage), url)
+        self.assertEqual(len(self.storage.signed), 1)
+        with mock.patch('time.time', return_value=time.time() + 1801):
+            self.assertNotEqual(media_url('blobs/ab/ab.pdf', 'Jane Doe.pdf', self.storage), url)
+        self.assertEqual(len(self.storage.signed), 2)
+
+    def test_rows_sharing_a_blob_get_their_own_url(self):
+        mine = MedicalRecord.objects.create(patient=self.profile, description='Scan',
+                                            file=ContentFile(b'same scan', name='Jane Doe.pdf'))
+        theirs = MedicalRecord.objects.create(patient=self.other_profile, description='Scan',
+                                              file=ContentFile(b'same scan', name='John Roe.pdf'))
+        name = mine.file.name
+        self.assertEqual(theirs.file.name, name)
+        with mock.patch.object(default_storage, '_wrapped', self.storage):
+            prefetch_media_urls([mine])
+            prefetch_media_urls([theirs])
+        self.assertNotEqual(mine.file.cached_url, theirs.file.cached_url)
+        self.assertEqual([parameters['ResponseContentDisposition'] for _, parameters in self.storage.signed], [
+            'inline; filename="Jane Doe.pdf"', 'inline; filename="John Roe.pdf"',
+        ])
+        # Both stay cached, each under its own row's name
+        urls = media_urls([(name, 'Jane Doe.pdf'), (name, 'John Roe.pdf')], self.storage)
+        self.assertEqual(urls, {(name, 'Jane Doe.pdf'): mine.file.cached_url, (name, 'John Roe.pdf'): theirs.file.cached_url})
+        self.assertEqual(len(self.storage.signed), 2)
@@ -0,0 +1,14 @@
+from django.urls import path
+from . import views
+
+app_name = 'uploads'
+
+urlpatterns = [
+    path('start/', views.upload_start, name='start'),
+    path('<uuid:pk>/', views.upload_status, name='status'),
+    path('<uuid:pk>/parts/<int:number>/', views.upload_part, name='part'),
+    path('<uuid:pk>/parts/<int:number>/data/', views.upload_part_data, name='part_data'),
+    path('<uuid:pk>/complete/', views.upload_complete, name='complete'),
+    path('<uuid:pk>/prove/', views.upload_prove, name='prove'),
+    path('<uuid:pk>/abort/', views.upload_abort, name='abort'),
+]
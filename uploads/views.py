@@ -0,0 +1,215 @@
+# uploads/views.py
+"""
+JSON endpoints for chunked uploads, driven by static js/chunked_upload.js:
+
+1. POST start/                   -> session id, chunk size and part count
+2. POST <id>/parts/<n>/          -> where and how to send part n (checksum in)
+3. PUT  the returned URL         -> the part's bytes (S3, or part_data locally)
+4. POST <id>/complete/           -> parts are verified and joined; the
+                                    session is "hashing" until
+                                    run_upload_worker makes it "complete"
+5. submit the record/report form with upload_id=<id>
+
+GET <id>/ reports the status and lists the parts already received, so an
+interrupted upload can resume with the missing ones.
+
+start/ may be given the file's hex SHA-256. If that content is stored
+already, the session carries a challenge, and POST <id>/prove/ with the
+SHA-256 of the nonce plus the challenged bytes completes the upload at
+once, skipping steps 2-4 (see uploads/blobs.py). A wrong proof just
+means the file is uploaded as usual.
+"""
+import re
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from accounts.decorators import role_required
+from . import blobs
+from .backends import LocalBackend, UploadError, chunk_size_for, get_backend
+from .models import TARGETS, Blob, UploadSession
+from .serving import download_name, media_response
+
+
+def _session_json(session, received=None):
+    data = {
+        'id': session.pk,
+        'status': session.status,
+        'filename': session.filename,
+        'size': session.size,
+        'chunk_size': session.chunk_size,
+        'part_count': session.part_count,
+    }
+    if received is not None:
+        data['parts'] = sorted(received)
+    if session.challenge and session.status == UploadSession.UPLOADING:
+        data['challenge'] = session.challenge
+    return data
+
+
+def _is_sha256(value):
+    return re.fullmatch(r'[0-9a-f]{64}', value) is not None
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _own_session(request, pk):
+    return get_object_or_404(UploadSession, pk=pk, user=request.user)
+
+
+@role_required('Admin', 'Staff')
+@require_POST
+def upload_start(request):
+    target = request.POST.get('target')
+    filename = request.POST.get('filename', '').strip()
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return _error("Size is required.")
+    if target not in TARGETS or not filename:
+        return _error("A valid target and filename are required.")
+    if not 0 < size <= settings.CHUNKED_UPLOAD_MAX_SIZE:
+        return _error(f"Files must be between 1 byte and {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes.")
+    sha256 = request.POST.get('sha256', '').lower()
+    if sha256 and not _is_sha256(sha256):
+        return _error("sha256 must be a hex SHA-256 digest.")
+
+    backend = get_backend()
+    session = UploadSession(
+        user=request.user,
+        target=target,
+        filename=filename[:255],
+        content_type=request.POST.get('content_type', '')[:100],
+        size=size,
+        chunk_size=chunk_size_for(size),
+        backend=backend.name,
+        sha256=sha256,
+    )
+    if sha256 and Blob.objects.filter(sha256=sha256, size=size).exists():
+        session.challenge = blobs.make_challenge(size)
+    session.key = UploadSession.make_key(target, session.pk, filename)
+    backend.start(session)
+    session.save()
+    return JsonResponse(_session_json(session, received={}), status=201)
+
+
+@role_required('Admin', 'Staff')
+@require_GET
+def upload_status(request, pk):
+    session = _own_session(request, pk)
+    received = None
+    if session.status == UploadSession.UPLOADING:
+        parts = get_backend(session.backend).received_parts(session)
+        received = [n for n, size in parts.items() if size == session.part_size(n)]
+    return JsonResponse(_session_json(session, received=received))
+
+
+@role_required('Admin', 'Staff')
+@require_POST
+def upload_part(request, pk, number):
+    """Where to send part `number`; the checksum is bound into the target."""
+    session = _own_session(request, pk)
+    if session.status != UploadSession.UPLOADING:
+        return _error("This upload is no longer accepting parts.", status=409)
+    if not 1 <= number <= session.part_count:
+        return _error(f"Part numbers run from 1 to {session.part_count}.")
+    try:
+        target = get_backend(session.backend).part_target(session, number, request.POST.get('checksum', ''))
+    except UploadError as e:
+        return _error(str(e))
+    return JsonResponse(target)
+
+
+@role_required('Admin', 'Staff')
+@require_http_methods(['PUT'])
+def upload_part_data(request, pk, number):
+    """Receive a part's bytes (local backend only), streamed from the request body."""
+    session = _own_session(request, pk)
+    if session.backend != LocalBackend.name:
+        return _error("Parts of this upload go directly to storage.")
+    if session.status != UploadSession.UPLOADING:
+        return _error("This upload is no longer accepting parts.", status=409)
+    if not 1 <= number <= session.part_count:
+        return _error(f"Part numbers run from 1 to {session.part_count}.")
+    try:
+        LocalBackend().write_part(session, number, request, request.headers.get('X-Chunk-Sha256', ''))
+    except UploadError as e:
+        return _error(str(e))
+    return JsonResponse({'part': number})
+
+
+@role_required('Admin', 'Staff')
+@require_POST
+def upload_complete(request, pk):
+    session = _own_session(request, pk)
+    if session.status in (UploadSession.HASHING, UploadSession.COMPLETE):
+        return JsonResponse(_session_json(session))
+    # Claim the session, so concurrent completes cannot both join the parts
+    # and queue them for hashing
+    if not UploadSession.objects.filter(pk=session.pk, status=UploadSession.UPLOADING).update(
+        status=UploadSession.COMPLETING,
+    ):
+        return _error("This upload is already being completed or has been closed.", status=409)
+    try:
+        get_backend(session.backend).complete(session)
+    except UploadError as e:
+        # Missing parts can still be sent
+        UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.UPLOADING)
+        return _error(str(e))
+    # Hashed into a blob by run_upload_worker; the client polls GET <id>/
+    session.status = UploadSession.HASHING
+    session.completed_at = timezone.now()
+    session.save(update_fields=['status', 'completed_at'])
+    return JsonResponse(_session_json(session), status=202)
+
+
+@role_required('Admin', 'Staff')
+@require_POST
+def upload_prove(request, pk):
+    """Complete an upload from the stored copy of its content, given proof the client holds the file."""
+    session = _own_session(request, pk)
+    challenge = session.challenge
+    # One answer per challenge, and it claims the session like a complete
+    if not challenge or not UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.UPLOADING, challenge__isnull=False,
+    ).update(status=UploadSession.COMPLETING, challenge=None):
+        return _error("This upload has no open challenge.", status=409)
+    proof = request.POST.get('proof', '').lower()
+    blob = blobs.acquire_proven(session.sha256, session.size, challenge, proof) if _is_sha256(proof) else None
+    if blob is None:
+        UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.UPLOADING)
+        return _error("The file does not match; upload it instead.", status=409)
+    get_backend(session.backend).abort(session)
+    session.key = blob.name
+    session.challenge = None
+    session.status = UploadSession.COMPLETE
+    session.completed_at = timezone.now()
+    session.save(update_fields=['key', 'challenge', 'status', 'completed_at'])
+    return JsonResponse(_session_json(session))
+
+
+@role_required('Admin', 'Staff')
+@require_POST
+def upload_abort(request, pk):
+    session = _own_session(request, pk)
+    if session.status == UploadSession.UPLOADING:
+        get_backend(session.backend).abort(session)
+        session.status = UploadSession.ABORTED
+        session.save(update_fields=['status'])
+    return JsonResponse(_session_json(session))
+
+
+@role_required('Admin', 'Staff', 'Patient')
+@require_GET
+def serve_media(request, name):
+    """Download a stored file in MEDIA_MODE=local; the bytes come from the web server."""
+    filename = download_name(request.user, name)
+    if filename is None:
+        # Same answer as a missing file, so names cannot be probed
+        raise Http404("File not found.")
+    return media_response(request, name, filename)